@@ -0,0 +1,313 @@
+import argparse
+import json
+import logging
+import math
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+from lsst.rucioevents.config import KafkaConfig
+from lsst.rucioevents.dummy_event_generator import process_dids
+from lsst.rucioevents.event_creator import KafkaEvent
+from lsst.rucioevents.fake_kafka import FakeProducer
+from lsst.rucioevents.fake_rucio import FakeRucioClient
+from lsst.rucioevents.kafka_producer import RucioKafkaProducer
+from lsst.rucioevents.rucio_processor import RucioProcessor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("RucioEventsBenchmark")
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_TOLERANCE = 0.2
+BENCH_RSE = "FAKE_RSE"
+BENCH_TOPIC = "benchmark"
+QUIET_LOGGERS = [
+    "RucioProcessor",
+    "KafkaEventGenerator",
+    "RucioKafkaProducer",
+    "RucioDummyEventGenerator",
+]
+# Number of files of the datasets of the end-to-end benchmark.
+FILES_PER_DATASET = 10000
+# Number of events and duration in seconds of a delivery request of the
+# producer profile comparison.
+DEFAULT_PROFILE_SIZE = 2000
+DEFAULT_REQUEST_TIME = 0.0005
+
+
+def _payload(size: int) -> Dict:
+    """Build the merged payload of a dataset of ``size`` files."""
+    client = FakeRucioClient(files_per_dataset=size)
+    name = client.dataset_names()[0]
+    return RucioProcessor(client.scope, name, BENCH_RSE, client)._merge_metadata()
+
+
+def setup_process_metadata(size: int) -> Callable[[], int]:
+    """KafkaEvent.process_metadata_records on a dataset of ``size`` files."""
+    payload = _payload(size)
+    return lambda: len(KafkaEvent(payload).process_metadata_records())
+
+
+def setup_merge_metadata(size: int) -> Callable[[], int]:
+    """RucioProcessor._merge_metadata against the fake Rucio client."""
+    client = FakeRucioClient(files_per_dataset=size)
+    name = client.dataset_names()[0]
+    return lambda: len(
+        RucioProcessor(client.scope, name, BENCH_RSE, client)._merge_metadata()
+    )
+
+
+def setup_send_event(size: int) -> Callable[[], int]:
+    """RucioKafkaProducer.send_event to the fake Kafka producer."""
+    events = KafkaEvent(_payload(size)).process_metadata_records()
+    sender = RucioKafkaProducer(BENCH_TOPIC, producer=FakeProducer())
+    return lambda: sender.send_event(events)
+
+
+def setup_process_dids(size: int) -> Callable[[], int]:
+    """End-to-end process_dids against the fake Rucio and Kafka."""
+    n_datasets = math.ceil(size / FILES_PER_DATASET)
+    client = FakeRucioClient(
+        n_datasets=n_datasets, files_per_dataset=math.ceil(size / n_datasets)
+    )
+
+    def run() -> int:
+        sender = RucioKafkaProducer(BENCH_TOPIC, producer=FakeProducer())
+        process_dids(
+            client.dids(),
+            BENCH_RSE,
+            BENCH_TOPIC,
+            client_factory=lambda: client,
+            sink=sender,
+        )
+        return sender.delivered
+
+    return run
+
+
+BENCHMARKS = {
+    "process_metadata": setup_process_metadata,
+    "merge_metadata": setup_merge_metadata,
+    "send_event": setup_send_event,
+    "process_dids": setup_process_dids,
+}
+
+
+def measure(setup: Callable[[int], Callable[[], int]], size: int, repeat: int) -> Dict:
+    """Time a benchmark, keeping the best of ``repeat`` runs, then measure
+    its peak memory in a separate run, as tracing slows down the code.
+    """
+    run = setup(size)
+    best = math.inf
+    events = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        events = run()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "events": events,
+        "seconds": best,
+        "events_per_second": events / best if best > 0 else 0.0,
+        "latency_us": 1e6 * best / events if events else 0.0,
+        "peak_memory_mb": peak / 1024**2,
+    }
+
+
+def run_benchmarks(
+    sizes: List[int], names: Optional[List[str]] = None, repeat: int = 3
+) -> List[Dict]:
+    """Run the benchmarks at each dataset size."""
+    results = []
+    for name in names or BENCHMARKS:
+        for size in sizes:
+            result = {"benchmark": name, "size": size}
+            result.update(measure(BENCHMARKS[name], size, repeat))
+            logger.info(
+                f"{name} [{size} files]: {result['events_per_second']:.0f} events/s, "
+                f"{result['latency_us']:.2f} us/event, "
+                f"{result['peak_memory_mb']:.1f} MB peak"
+            )
+            results.append(result)
+    return results
+
+
+def run_profile_benchmarks(
+    size: int = DEFAULT_PROFILE_SIZE,
+    profiles: Optional[List[str]] = None,
+    request_time: float = DEFAULT_REQUEST_TIME,
+) -> List[Dict]:
+    """
+    Send the events of a dataset of ``size`` files with each producer
+    profile, to a fake producer following the profile settings and taking
+    ``request_time`` seconds per delivery request, as a local broker would.
+    """
+    events = KafkaEvent(_payload(size)).process_metadata_records()
+    results = []
+    for profile in profiles or KafkaConfig.PROFILES:
+        config = KafkaConfig(profile=profile).complete_config()
+        producer = FakeProducer.from_config(config, request_time=request_time)
+        sender = RucioKafkaProducer(BENCH_TOPIC, producer=producer)
+        start = time.perf_counter()
+        delivered = sender.send_event(events)
+        seconds = time.perf_counter() - start
+        result = {
+            "profile": profile,
+            "size": size,
+            "events": delivered,
+            "seconds": seconds,
+            "events_per_second": delivered / seconds if seconds > 0 else 0.0,
+            "delivery_latency_ms": (
+                1e3 * producer.delivery_latency / delivered if delivered else 0.0
+            ),
+        }
+        logger.info(
+            f"{profile} profile [{size} files]: "
+            f"{result['events_per_second']:.0f} events/s, "
+            f"{result['delivery_latency_ms']:.2f} ms mean delivery latency"
+        )
+        results.append(result)
+    return results
+
+
+def compare(
+    results: List[Dict], baseline: List[Dict], tolerance: float = DEFAULT_TOLERANCE
+) -> List[str]:
+    """Return a description of the results slower than the baseline by more
+    than ``tolerance`` (as a fraction of the baseline throughput).
+    """
+    reference = {(entry["benchmark"], entry["size"]): entry for entry in baseline}
+    regressions = []
+    for result in results:
+        entry = reference.get((result["benchmark"], result["size"]))
+        if entry is None:
+            continue
+        limit = (1.0 - tolerance) * entry["events_per_second"]
+        if result["events_per_second"] < limit:
+            regressions.append(
+                f"{result['benchmark']} [{result['size']} files]: "
+                f"{result['events_per_second']:.0f} events/s, "
+                f"baseline {entry['events_per_second']:.0f} events/s"
+            )
+    return regressions
+
+
+def save(results: List[Dict], path: str):
+    """Write the results in a JSON baseline file."""
+    document = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(path, "w") as file:
+        json.dump(document, file, indent=2)
+
+
+def load(path: str) -> List[Dict]:
+    """Read the results of a JSON baseline file."""
+    with open(path, "r") as file:
+        return json.load(file)["results"]
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the DID to Kafka path against in-memory "
+        "stand-ins for Rucio and Kafka."
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        metavar="N",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Number of files of the benchmarked datasets.",
+    )
+    parser.add_argument(
+        "-b",
+        "--benchmarks",
+        metavar="NAME",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=None,
+        help="Benchmarks to run, all by default.",
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        metavar="N",
+        type=int,
+        default=3,
+        help="Number of timed runs of each benchmark, the best one is kept.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        type=str,
+        help="Write the results to FILE, to be used as a baseline.",
+    )
+    parser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        type=str,
+        help="Fail if a benchmark is slower than in the baseline FILE.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        metavar="FRACTION",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed throughput loss with respect to the baseline.",
+    )
+    parser.add_argument(
+        "--profiles",
+        metavar="PROFILE",
+        nargs="*",
+        choices=list(KafkaConfig.PROFILES),
+        default=None,
+        help="Compare the Kafka producer profiles, all of them when none is "
+        "given, instead of running the benchmarks.",
+    )
+    parser.add_argument(
+        "--request-time",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_REQUEST_TIME,
+        help="Duration of a delivery request of the profile comparison.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    # Per event logging would dominate the measurements.
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    if args.profiles is not None:
+        run_profile_benchmarks(args.sizes[0], args.profiles, args.request_time)
+        return 0
+
+    results = run_benchmarks(args.sizes, args.benchmarks, args.repeat)
+    if args.output:
+        save(results, args.output)
+    if args.baseline:
+        regressions = compare(results, load(args.baseline), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+from lsst.rucioevents.utils import chunked
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("RucioCache")
+
+
+class RucioCache:
+    """
+    On-disk cache of Rucio lookups, stored in a SQLite database.
+
+    Entries are keyed by kind (``files``, ``replicas``, ``metadata``),
+    scope, name and RSE. They expire after ``ttl`` seconds, and the least
+    recently used entries are evicted when the cache exceeds ``max_size``
+    bytes. The cache can be shared by several threads.
+
+    Args:
+        cache_dir (str): Directory holding the cache database.
+        ttl (float, optional): Lifetime of an entry in seconds.
+        max_size (int, optional): Maximum size of the cached values in bytes.
+    """
+
+    DEFAULT_TTL = 24 * 3600.0
+    DEFAULT_MAX_SIZE = 1024**3
+    DB_NAME = "rucio_cache.sqlite"
+    # Maximum number of keys in a single SELECT, below the SQLite limit.
+    QUERY_CHUNK_SIZE = 500
+
+    def __init__(
+        self,
+        cache_dir: str,
+        ttl: float = DEFAULT_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, self.DB_NAME)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "kind TEXT, scope TEXT, name TEXT, rse TEXT, value TEXT, "
+            "created REAL, accessed REAL, size INTEGER, "
+            "PRIMARY KEY (kind, scope, name, rse))"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+        self._db.execute("DELETE FROM entries WHERE created < ?", (self._expiry(),))
+        self._db.commit()
+        (self._size,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+
+    def _expiry(self) -> float:
+        """Returns the creation time before which entries are expired."""
+        return time.time() - self.ttl
+
+    def get(self, kind: str, scope: str, name: str, rse: str = "") -> Optional[Any]:
+        """Returns a cached value, or None when missing or expired."""
+        return self.get_many(kind, scope, [name], rse).get(name)
+
+    def get_many(
+        self, kind: str, scope: str, names: Iterable[str], rse: str = ""
+    ) -> Dict[str, Any]:
+        """Returns the cached values found for the given names."""
+        found = {}
+        lookups = 0
+        with self._lock:
+            expiry = self._expiry()
+            for chunk in chunked(names, self.QUERY_CHUNK_SIZE):
+                rows = self._db.execute(
+                    "SELECT name, value FROM entries WHERE kind = ? AND scope = ? "
+                    f"AND rse = ? AND created >= ? AND name IN ({','.join('?' * len(chunk))})",
+                    (kind, scope, rse, expiry, *chunk),
+                )
+                found.update((name, json.loads(value)) for name, value in rows)
+                lookups += len(chunk)
+            if found:
+                self._db.executemany(
+                    "UPDATE entries SET accessed = ? WHERE kind = ? AND scope = ? "
+                    "AND name = ? AND rse = ?",
+                    [(time.time(), kind, scope, name, rse) for name in found],
+                )
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += lookups - len(found)
+        return found
+
+    def put(self, kind: str, scope: str, name: str, value: Any, rse: str = ""):
+        """Stores a value in the cache."""
+        self.put_many(kind, scope, {name: value}, rse)
+
+    def put_many(self, kind: str, scope: str, values: Dict[str, Any], rse: str = ""):
+        """Stores the values of several names in a single transaction."""
+        now = time.time()
+        with self._lock:
+            for name, value in values.items():
+                encoded = json.dumps(value)
+                previous = self._db.execute(
+                    "SELECT size FROM entries WHERE kind = ? AND scope = ? "
+                    "AND name = ? AND rse = ?",
+                    (kind, scope, name, rse),
+                ).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, scope, name, rse, encoded, now, now, len(encoded)),
+                )
+                self._size += len(encoded) - (previous[0] if previous else 0)
+            if self._size > self.max_size:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache is back
+        to 90% of its maximum size.
+        """
+        target = 0.9 * self.max_size
+        rows = self._db.execute(
+            "SELECT rowid, size FROM entries ORDER BY accessed, rowid"
+        )
+        evicted = []
+        for rowid, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((rowid,))
+            self._size -= size
+        rows.close()
+        self._db.executemany("DELETE FROM entries WHERE rowid = ?", evicted)
+        self.evictions += len(evicted)
+
+    def summary(self) -> str:
+        """Returns the hit and miss statistics of the cache."""
+        lookups = self.hits + self.misses
+        ratio = 100.0 * self.hits / lookups if lookups else 0.0
+        return (
+            f"{self.hits} hits, {self.misses} misses ({ratio:.1f}% hit ratio), "
+            f"{self.evictions} evictions, {self._size} bytes cached"
+        )
+
+    def close(self):
+        """Closes the cache database."""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,85 @@
+import json
+import logging
+import mmap
+import struct
+from typing import Dict, Iterator, List
+from lsst.rucioevents.sinks import EventSink
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("EventCapture")
+
+CAPTURE_MAGIC = b"RUCIOEVT1\n"
+RECORD_LENGTH = struct.Struct("<I")
+
+
+class CaptureSink(EventSink):
+    """
+    Records the events in a capture file, to replay them without Rucio.
+
+    The file starts with ``CAPTURE_MAGIC``, followed by one record per
+    event: its JSON document, prefixed by its length as a 32-bit little
+    endian integer.
+
+    Args:
+        path (str): The capture file.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(CAPTURE_MAGIC)
+
+    def _serialize(self, batch: List[Dict]) -> bytes:
+        records = []
+        for event in batch:
+            data = self.encoder.encode(event)
+            records.append(RECORD_LENGTH.pack(len(data)))
+            records.append(data)
+        return b"".join(records)
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+
+    def flush(self) -> int:
+        with self._lock:
+            self._file.flush()
+        return 0
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def summary(self) -> str:
+        return f"{self.delivered} events captured, {self.bytes} bytes to {self.path}"
+
+
+def iter_capture(path: str) -> Iterator[Dict]:
+    """
+    Reads the events of a capture file through a memory map.
+
+    A record truncated by an interrupted capture ends the stream with a
+    warning.
+
+    :param path: The capture file.
+    :return: An iterator on the events, in capture order.
+    """
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[: len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+                raise ValueError(f"{path} is not an event capture")
+            offset = len(CAPTURE_MAGIC)
+            while offset < len(data):
+                end = offset + RECORD_LENGTH.size
+                if end <= len(data):
+                    (length,) = RECORD_LENGTH.unpack_from(data, offset)
+                    offset, end = end, end + length
+                if end > len(data):
+                    logger.warning(f"Truncated record at byte {offset} of {path}")
+                    return
+                yield json.loads(data[offset:end])
+                offset = end
@@ -1,12 +1,59 @@
-from typing import List, Optional, Any, Dict
+import os
+from typing import List, Mapping, Optional, Any, Dict
+
+
+def read_properties(path: str) -> Dict[str, str]:
+    """
+    Reads a librdkafka properties file: one ``key=value`` setting per line,
+    blank lines and lines starting with ``#`` being ignored.
+    """
+    settings = {}
+    with open(path, "r") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            key, separator, value = line.partition("=")
+            if not separator:
+                raise ValueError(f"{path}:{number}: expected key=value, got {line}")
+            settings[key.strip()] = value.strip()
+    return settings
 
 
 class KafkaConfig:
     """Class to manage Kafka configuration."""
 
     DEFAULT_BOOTSTRAP_SERVERS = ["134.79.23.189:9094"]
+    ENV_PREFIX = "RUCIOEVENTS_KAFKA_"
+    # Producer settings of the performance profiles. Idempotence, or a single
+    # request in flight, keeps the order of the messages of a partition.
+    PROFILES = {
+        "throughput": {
+            "compression.type": "lz4",
+            "linger.ms": 50,
+            "batch.size": 1048576,
+            "batch.num.messages": 10000,
+            "queue.buffering.max.messages": 1000000,
+            "max.in.flight.requests.per.connection": 5,
+            "enable.idempotence": True,
+            "acks": "all",
+        },
+        "low-latency": {
+            "compression.type": "none",
+            "linger.ms": 0,
+            "batch.size": 16384,
+            "max.in.flight.requests.per.connection": 1,
+            "enable.idempotence": False,
+            "acks": 1,
+        },
+    }
 
-    def __init__(self, bootstrap_servers: Optional[List[str]] = None, **kwargs):
+    def __init__(
+        self,
+        bootstrap_servers: Optional[List[str]] = None,
+        profile: Optional[str] = None,
+        **kwargs,
+    ):
         """
         Initializes a new instance of KafkaConfig.
 
@@ -14,10 +61,57 @@ class KafkaConfig:
             bootstrap_servers: A list of Kafka server addresses.
                                The format expected is: "host:port".
                                If None, the default value will be used.
+            profile: Name of a performance profile of ``PROFILES``, whose
+                     settings are overridden by the ``kwargs``.
             **kwargs: Additional configuration parameters.
         """
+        if profile is not None and profile not in self.PROFILES:
+            raise ValueError(
+                f"Unknown Kafka profile {profile}, expected one of "
+                f"{', '.join(self.PROFILES)}"
+            )
         self.bootstrap_servers = bootstrap_servers or self.DEFAULT_BOOTSTRAP_SERVERS
-        self._config = kwargs
+        self.profile = profile
+        self._config = dict(self.PROFILES.get(profile, {}))
+        self._config.update(kwargs)
+
+    @classmethod
+    def from_sources(
+        cls,
+        profile: Optional[str] = None,
+        config_file: Optional[str] = None,
+        overrides: Optional[Dict[str, Any]] = None,
+        environ: Optional[Mapping[str, str]] = None,
+    ) -> "KafkaConfig":
+        """
+        Builds a configuration from a profile and layers of overrides.
+
+        The settings of the profile are overridden by those of the
+        properties file, then by the environment variables, then by
+        ``overrides``, typically from the command line. An environment
+        variable ``RUCIOEVENTS_KAFKA_LINGER_MS`` sets ``linger.ms``, and
+        ``RUCIOEVENTS_KAFKA_PROFILE`` selects the profile when ``profile`` is
+        not given.
+
+        Args:
+            profile: Name of a performance profile.
+            config_file: A librdkafka properties file.
+            overrides: Settings with the highest priority.
+            environ: The environment variables, ``os.environ`` by default.
+        """
+        environ = os.environ if environ is None else environ
+        profile = profile or environ.get(cls.ENV_PREFIX + "PROFILE") or None
+        settings = {}
+        if config_file:
+            settings.update(read_properties(config_file))
+        for name, value in environ.items():
+            if name.startswith(cls.ENV_PREFIX) and name != cls.ENV_PREFIX + "PROFILE":
+                key = name[len(cls.ENV_PREFIX):].lower().replace("_", ".")
+                settings[key] = value
+        settings.update(overrides or {})
+        bootstrap = settings.pop("bootstrap.servers", None)
+        bootstrap_servers = bootstrap.split(",") if bootstrap else None
+        return cls(bootstrap_servers, profile=profile, **settings)
 
     @property
     def bootstrap(self) -> str:
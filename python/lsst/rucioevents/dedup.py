@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional
+from lsst.rucioevents.keys import file_identity
+from lsst.rucioevents.utils import chunked
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("DedupIndex")
+
+
+class BloomFilter:
+    """
+    Bloom filter of strings, in a bit array of about
+    ``-capacity * ln(error_rate) / ln(2)^2`` bits.
+
+    Membership tests have no false negatives, and false positives with
+    probability ``error_rate`` as long as at most ``capacity`` keys were
+    added. The bit positions of a key are derived from the two halves of a
+    128-bit BLAKE2b digest.
+
+    Args:
+        capacity (int): Expected number of keys.
+        error_rate (float, optional): False positive probability at
+            ``capacity`` keys.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.size = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterator[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> bool:
+        """Add a key, returning True if it may have been added before."""
+        present = True
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self._bits[position >> 3] & mask:
+                present = False
+                self._bits[position >> 3] |= mask
+        return present
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the bit array in bytes."""
+        return len(self._bits)
+
+
+class DedupIndex:
+    """
+    Index of the file events already emitted, keyed by the file DID and the
+    destination RSE (``scope:name@rse``), to suppress the duplicates of
+    overlapping DIDs, such as a container and one of its datasets.
+
+    The keys are added to a Bloom filter kept in memory and to a SQLite
+    table, the exact fallback: only the keys the filter reports as possibly
+    present are looked up in the table, so that new files, the common case,
+    cost no query. With a ``path`` the table persists across runs and the
+    filter is rebuilt from it when the index is opened, otherwise it lives
+    in a temporary database deleted on close. The filter is sized for
+    ``capacity`` keys, at least twice those already in the table; beyond,
+    the false positives, and the lookups, increase but no event is lost.
+
+    The keys of the events let through by ``filter`` are pending until the
+    sink confirms their delivery with ``confirm``, or reports its failure
+    with ``release``: only the confirmed keys are indexed, and saved to the
+    table, in chunks, so that an event that failed, or was never flushed,
+    is sent again by a later DID or run. Pending keys suppress the
+    duplicates of the events in flight. The index can be shared by several
+    threads.
+
+    Args:
+        path (str, optional): SQLite database of the index.
+        capacity (int, optional): Expected number of file events.
+        error_rate (float, optional): False positive rate of the filter.
+    """
+
+    DEFAULT_CAPACITY = 10_000_000
+    DEFAULT_ERROR_RATE = 0.01
+    # Number of events checked, and of keys looked up, at once.
+    CHUNK_SIZE = 500
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        capacity: int = DEFAULT_CAPACITY,
+        error_rate: float = DEFAULT_ERROR_RATE,
+    ):
+        self.path = path
+        self.checked = 0
+        self.suppressed = 0
+        self.false_positives = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._confirmed = set()
+        # An empty path opens a private temporary database.
+        self._db = sqlite3.connect(path or "", check_same_thread=False)
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files (key TEXT PRIMARY KEY) WITHOUT ROWID"
+        )
+        self._db.commit()
+        (self.size,) = self._db.execute("SELECT COUNT(*) FROM files").fetchone()
+        self._bloom = BloomFilter(max(capacity, 2 * self.size), error_rate)
+        if self.size:
+            for (key,) in self._db.execute("SELECT key FROM files"):
+                self._bloom.add(key)
+            logger.info(f"Loaded {self.size} file events from {path}")
+
+    def _existing(self, keys: List[str]) -> set:
+        """Return the keys already in the table."""
+        rows = self._db.execute(
+            f"SELECT key FROM files WHERE key IN ({','.join('?' * len(keys))})", keys
+        )
+        return {key for (key,) in rows}
+
+    def _new_events(self, events: List[Dict]) -> List[Dict]:
+        """Return the events of a chunk whose key is neither indexed nor
+        pending, their keys becoming pending.
+        """
+        with self._lock:
+            candidates = []
+            chunk_keys = set()
+            maybe = []
+            for event in events:
+                key = self.key(event)
+                if key is not None and key not in chunk_keys:
+                    if self._bloom.add(key) and not self._in_memory(key):
+                        maybe.append(key)
+                    chunk_keys.add(key)
+                candidates.append((key, event))
+            existing = self._existing(maybe) if maybe else set()
+            self.false_positives += len(maybe) - len(existing)
+            new_events = []
+            for key, event in candidates:
+                if key is not None:
+                    if key in existing or self._in_memory(key):
+                        self.suppressed += 1
+                        continue
+                    self._pending.add(key)
+                new_events.append(event)
+            self.checked += len(events)
+        return new_events
+
+    def _in_memory(self, key: str) -> bool:
+        """Return True if the key is pending or confirmed but not saved."""
+        return key in self._pending or key in self._confirmed
+
+    @staticmethod
+    def key(event: Dict) -> Optional[str]:
+        """Return the key of an event, None if it is not about a file."""
+        return file_identity(event["payload"])
+
+    def confirm(self, key: Optional[str]):
+        """Index the key of an event whose delivery is confirmed."""
+        if key is None:
+            return
+        with self._lock:
+            if key in self._pending:
+                self._pending.discard(key)
+                self.size += 1
+            self._bloom.add(key)
+            self._confirmed.add(key)
+            if len(self._confirmed) >= self.CHUNK_SIZE:
+                self._save()
+
+    def release(self, key: Optional[str]):
+        """Forget the key of an event whose delivery failed, so that it can
+        be sent again.
+        """
+        if key is None:
+            return
+        with self._lock:
+            self._pending.discard(key)
+
+    def _save(self):
+        """Save the confirmed keys to the table."""
+        if self._confirmed:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO files VALUES (?)",
+                ((key,) for key in self._confirmed),
+            )
+            self._db.commit()
+            self._confirmed = set()
+
+    def filter(
+        self, events: Iterable[Dict], skipped: Optional[Counter] = None
+    ) -> Iterator[Dict]:
+        """Drop the events already emitted, in this run or a previous one,
+        or earlier in the same events, counting them in
+        ``skipped["duplicates"]``.
+        """
+        for chunk in chunked(events, self.CHUNK_SIZE):
+            new_events = self._new_events(chunk)
+            if skipped is not None:
+                skipped["duplicates"] += len(chunk) - len(new_events)
+            yield from new_events
+
+    def summary(self) -> str:
+        """Return the statistics of the index."""
+        return (
+            f"{self.checked} file events checked, {self.suppressed} duplicates "
+            f"suppressed, {self.size} indexed, {len(self._pending)} pending, "
+            f"{self.false_positives} filter false positives, "
+            f"{self._bloom.nbytes / 1024**2:.1f} MB filter"
+        )
+
+    def close(self):
+        """Save the confirmed keys and close the index database."""
+        with self._lock:
+            self._save()
+            self._db.close()
@@ -1,19 +1,155 @@
 import argparse
+import asyncio
+import contextlib
 import logging
-from typing import List
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Sized,
+    Tuple,
+    Union,
+)
 from rucio.client import Client
 from lsst.rucioevents.rucio_processor import RucioProcessor
 from lsst.rucioevents.event_creator import KafkaEvent
 from lsst.rucioevents.kafka_producer import RucioKafkaProducer
+from lsst.rucioevents.keys import KEY_STRATEGIES, PARTITIONERS
+from lsst.rucioevents.cache import RucioCache
+from lsst.rucioevents.config import KafkaConfig
+from lsst.rucioevents.dedup import DedupIndex
+from lsst.rucioevents.expansion import ContainerExpander, ReplicaBatcher
+from lsst.rucioevents.journal import RunJournal
+from lsst.rucioevents.logs import (
+    DEFAULT_PROGRESS_INTERVAL,
+    ProgressLog,
+    configure_logging,
+    queued_logging,
+)
+from lsst.rucioevents.metrics import (
+    QUEUE_DEPTH,
+    REGISTRY,
+    STAGE_SECONDS,
+    start_http_server,
+)
+from lsst.rucioevents.capture import CaptureSink
+from lsst.rucioevents.profiling import DEFAULT_TOP, RunProfiler, track_memory
+from lsst.rucioevents.serialization import EventEncoder
+from lsst.rucioevents.sinks import (
+    EventSink,
+    JsonlFileSink,
+    NullSink,
+    StdoutSink,
+    journal_dids,
+)
+from lsst.rucioevents.utils import AdaptiveChunkSize
 
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 logger = logging.getLogger("RucioDummyEventGenerator")
 
 
+def kafka_setting(text: str) -> Tuple[str, str]:
+    """Parse a ``key=value`` librdkafka setting of the command line."""
+    key, separator, value = text.partition("=")
+    if not separator or not key:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, got {text}")
+    return key.strip(), value.strip()
+
+
+def add_kafka_arguments(parser: argparse.ArgumentParser):
+    """Add the options configuring the Kafka producer."""
+    parser.add_argument(
+        "--kafka-profile",
+        choices=list(KafkaConfig.PROFILES),
+        default=None,
+        help="Kafka producer performance profile.",
+    )
+    parser.add_argument(
+        "--kafka-config",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="librdkafka properties file overriding the profile, itself overridden "
+        f"by the {KafkaConfig.ENV_PREFIX}* environment variables.",
+    )
+    parser.add_argument(
+        "-X",
+        dest="kafka_settings",
+        metavar="KEY=VALUE",
+        type=kafka_setting,
+        action="append",
+        default=[],
+        help="librdkafka setting overriding all the others, can be repeated.",
+    )
+
+
+def kafka_config_from_args(args: argparse.Namespace) -> KafkaConfig:
+    """Build the Kafka configuration selected on the command line."""
+    return KafkaConfig.from_sources(
+        profile=args.kafka_profile,
+        config_file=args.kafka_config,
+        overrides=dict(args.kafka_settings),
+    )
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    """Add the options exporting the metrics of the run."""
+    parser.add_argument(
+        "--metrics-port",
+        metavar="PORT",
+        type=int,
+        default=None,
+        help="Serve the Prometheus metrics of the run on http://ADDRESS:PORT/metrics.",
+    )
+    parser.add_argument(
+        "--metrics-address",
+        metavar="ADDRESS",
+        type=str,
+        default="127.0.0.1",
+        help="Address the metrics are served on, the local host by default.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="Write the metrics at the end of the run to FILE, for the textfile "
+        "collector of the Prometheus node exporter.",
+    )
+
+
+@contextlib.contextmanager
+def exported_metrics(args: argparse.Namespace, sink: Optional[EventSink] = None):
+    """Export the metrics while the run lasts, as selected on the command
+    line, with the depth of the queue of ``sink``.
+    """
+    if sink is not None:
+        QUEUE_DEPTH.labels("sink").set_function(sink.queue_depth)
+    server = None
+    if args.metrics_port is not None:
+        server = start_http_server(args.metrics_port, args.metrics_address)
+    try:
+        yield
+    finally:
+        if args.metrics_file:
+            REGISTRY.write_textfile(args.metrics_file)
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        QUEUE_DEPTH.labels("sink").set_function(None)
+
+
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description="Process a list of DIDs and send events to Kafka."
@@ -39,8 +175,10 @@ def parse_arguments():
         "--rse",
         metavar="RSE",
         type=str,
+        nargs="+",
         required=True,
-        help="Specify the RSE to be used for processing.",
+        help="Specify the RSEs to be used for processing, by name or with Rucio RSE "
+        "expressions. The files are looked up once for all the RSEs.",
     )
 
     parser.add_argument(
@@ -49,16 +187,365 @@ def parse_arguments():
         metavar="TOPIC",
         type=str,
         required=False,
-        help="Specify Kafka topic. Defaults to RSE name if not provided.",
+        help="Specify Kafka topic, where {rse} is replaced by the RSE of the events. "
+        "Defaults to RSE name if not provided.",
+    )
+
+    parser.add_argument(
+        "--sink",
+        choices=SINKS,
+        default="kafka",
+        help="Destination of the events: Kafka, a JSON Lines file, a capture file "
+        "to replay, the standard output or nowhere (null), to measure the Rucio "
+        "throughput alone.",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="Output file of the file and capture sinks, the file sink is gzip "
+        "compressed if it ends with .gz.",
+    )
+
+    parser.add_argument(
+        "--sink-batch-size",
+        metavar="N",
+        type=int,
+        default=EventSink.DEFAULT_BATCH_SIZE,
+        help="Number of events written at once by the file, stdout and null sinks.",
+    )
+
+    parser.add_argument(
+        "--fast-json",
+        action="store_true",
+        help="Serialize the events with orjson when it is installed: the documents "
+        "are the same, but compact instead of byte for byte those of json.dumps.",
+    )
+
+    parser.add_argument(
+        "--timestamp-granularity",
+        metavar="SECONDS",
+        type=float,
+        default=0.0,
+        help="Time during which consecutive events share their creation time, "
+        "instead of reading the clock for every event.",
+    )
+
+    parser.add_argument(
+        "--metadata-chunk-size",
+        metavar="N",
+        type=int,
+        default=RucioProcessor.DEFAULT_METADATA_CHUNK_SIZE,
+        help="Number of files whose metadata are requested to Rucio in a single call.",
+    )
+
+    parser.add_argument(
+        "--expand-containers",
+        action="store_true",
+        help="Replace the containers by their datasets, walked recursively.",
+    )
+
+    parser.add_argument(
+        "--expansion-workers",
+        metavar="N",
+        type=int,
+        default=ContainerExpander.DEFAULT_FAN_OUT,
+        help="Maximum number of concurrent Rucio calls walking the containers.",
+    )
+
+    parser.add_argument(
+        "--replica-batch-size",
+        metavar="N",
+        type=int,
+        default=None,
+        help="Look up the replicas of N DIDs at first in a single call, the "
+        "size of the next calls following their response time.",
+    )
+
+    parser.add_argument(
+        "--flush-timeout",
+        metavar="SECONDS",
+        type=float,
+        default=RucioKafkaProducer.DEFAULT_FLUSH_TIMEOUT,
+        help="Maximum time to wait for the delivery of the events of a DID.",
+    )
+
+    add_kafka_arguments(parser)
+
+    parser.add_argument(
+        "--key-strategy",
+        choices=KEY_STRATEGIES,
+        default="did",
+        help="Kafka message keys derived from the file DID and the RSE, or random.",
+    )
+
+    parser.add_argument(
+        "--partitioner",
+        choices=PARTITIONERS,
+        default="default",
+        help="Kafka partition of the events: chosen by the producer from the key, "
+        "the same for all the files of a dataset, to keep their order, or by file.",
+    )
+
+    parser.add_argument(
+        "--partitions",
+        metavar="N",
+        type=int,
+        default=None,
+        help="Number of partitions of the topic, read from the broker by default.",
+    )
+
+    parser.add_argument(
+        "--flush-each-message",
+        action="store_true",
+        help="Wait for the delivery of every event before sending the next one.",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Number of DIDs processed concurrently.",
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Run file listing, replica and metadata lookups, event creation and "
+        "production as concurrent stages. Cannot be used with --stream-window.",
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        metavar="N",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="Maximum number of DIDs waiting between two pipeline stages.",
+    )
+
+    parser.add_argument(
+        "--stream-window",
+        metavar="N",
+        type=int,
+        default=None,
+        help="Stream the files of each DID N at a time, reading DIDs lazily, "
+        "instead of loading whole DIDs in memory.",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        type=str,
+        default=None,
+        help="Cache the Rucio file lists, replicas and metadata in DIR across runs.",
+    )
+
+    parser.add_argument(
+        "--cache-ttl",
+        metavar="SECONDS",
+        type=float,
+        default=RucioCache.DEFAULT_TTL,
+        help="Lifetime of the cached Rucio lookups.",
+    )
+
+    parser.add_argument(
+        "--cache-max-size",
+        metavar="MB",
+        type=int,
+        default=RucioCache.DEFAULT_MAX_SIZE // 1024**2,
+        help="Maximum size of the Rucio cache, least recently used entries are evicted.",
+    )
+
+    parser.add_argument(
+        "--journal",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="Append the DIDs whose events were sent to FILE.",
+    )
+
+    parser.add_argument(
+        "--journal-files",
+        action="store_true",
+        help="Also record in the journal every file event confirmed by Kafka.",
     )
 
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the DIDs and file events already recorded in the journal.",
+    )
+
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Suppress the events of the files already emitted for the RSE, "
+        "by overlapping DIDs.",
+    )
+
+    parser.add_argument(
+        "--dedup-index",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="Keep the emitted files in FILE, to also suppress the events "
+        "emitted by previous runs. Implies --dedup.",
+    )
+
+    parser.add_argument(
+        "--dedup-capacity",
+        metavar="N",
+        type=int,
+        default=DedupIndex.DEFAULT_CAPACITY,
+        help="Expected number of file events, sizing the in-memory filter.",
+    )
+    add_metrics_arguments(parser)
+
     parser.add_argument(
         "-v",
         "--verbose",
         action="store_true",
-        help="Increase the verbosity level of the output.",
+        help="Increase the verbosity level of the output, logging every file and "
+        "message.",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_PROGRESS_INTERVAL,
+        help="Time between two progress summaries of the DIDs and messages.",
+    )
+    parser.add_argument(
+        "--log-sample",
+        metavar="N",
+        type=int,
+        default=0,
+        help="Log the delivery of one message in N without --verbose.",
+    )
+    parser.add_argument(
+        "--async-logging",
+        action="store_true",
+        help="Format and write the logs in a background thread.",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Profile the run with cProfile, writing a report to FILE and the raw "
+        "profile to FILE.pstats.",
+    )
+    parser.add_argument(
+        "--profile-top",
+        metavar="N",
+        type=int,
+        default=DEFAULT_TOP,
+        help="Number of functions, and of DIDs, listed in the profile report.",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Record the memory peak of each DID in the profile report, with "
+        "tracemalloc. The peaks are exact with one worker only.",
+    )
+    args = parser.parse_args()
+    if args.trace_memory and not args.profile:
+        parser.error("--trace-memory requires --profile")
+    if (args.resume or args.journal_files) and not args.journal:
+        parser.error("--resume and --journal-files require --journal")
+    if args.replica_batch_size and args.stream_window:
+        parser.error("--replica-batch-size cannot be used with --stream-window")
+    if args.pipeline and args.stream_window:
+        parser.error("--pipeline cannot be used with --stream-window")
+    if (args.sink in FILE_SINKS) != bool(args.output):
+        parser.error("--output is required by, and only used with, --sink file and capture")
+    return args
+
+
+SINKS = ("kafka", "file", "capture", "stdout", "null")
+# Sinks writing to the --output file.
+FILE_SINKS = ("file", "capture")
+
+
+def create_sink(
+    kind: str,
+    topic: str,
+    output: Optional[str] = None,
+    batch_size: int = EventSink.DEFAULT_BATCH_SIZE,
+    flush_timeout: float = RucioKafkaProducer.DEFAULT_FLUSH_TIMEOUT,
+    flush_each: bool = False,
+    journal: Optional[RunJournal] = None,
+    encoder: Optional[EventEncoder] = None,
+    key_strategy: str = "did",
+    partitioner: str = "default",
+    partitions: Optional[int] = None,
+    kafka_config: Optional[KafkaConfig] = None,
+    topics: Optional[Dict[str, str]] = None,
+    dedup: Optional[DedupIndex] = None,
+) -> EventSink:
+    """Create the sink of the events, one of ``SINKS``; ``topics`` are the
+    Kafka topics of the events of each RSE, and ``dedup`` the index whose
+    keys are confirmed once the events are delivered.
+    """
+    if kind == "kafka":
+        return RucioKafkaProducer(
+            topic,
+            flush_timeout=flush_timeout,
+            flush_each=flush_each,
+            journal=journal,
+            encoder=encoder,
+            key_strategy=key_strategy,
+            partitioner=partitioner,
+            partitions=partitions,
+            config=kafka_config,
+            topics=topics,
+            dedup=dedup,
+        )
+    options = dict(
+        batch_size=batch_size, journal=journal, encoder=encoder, dedup=dedup
     )
-    return parser.parse_args()
+    if kind == "file":
+        return JsonlFileSink(output, **options)
+    if kind == "capture":
+        return CaptureSink(output, **options)
+    if kind == "stdout":
+        return StdoutSink(**options)
+    if kind == "null":
+        return NullSink(**options)
+    raise ValueError(f"Unknown sink {kind}, expected one of {', '.join(SINKS)}")
+
+
+# Characters of the RSE expressions, absent from the RSE names.
+RSE_EXPRESSION_CHARACTERS = set("|&\\=()*<>")
+
+
+def resolve_rses(
+    values: Iterable[str], client_factory: Optional[Callable[[], Client]] = None
+) -> List[str]:
+    """Return the RSEs named on the command line, the RSE expressions being
+    resolved by Rucio, without duplicates.
+    """
+    rses = []
+    client = None
+    for value in values:
+        if RSE_EXPRESSION_CHARACTERS.isdisjoint(value):
+            matches = [value]
+        else:
+            client = client or (client_factory or Client)()
+            matches = [rse["rse"] for rse in client.list_rses(rse_expression=value)]
+            logger.info(f"RSE expression {value} resolved to {', '.join(matches)}")
+        rses.extend(rse for rse in matches if rse not in rses)
+    return rses
+
+
+def rse_topics(rses: Iterable[str], topic: Optional[str] = None) -> Dict[str, str]:
+    """Return the topic of each RSE, from the ``topic`` template where
+    ``{rse}`` stands for the RSE, the RSE name by default.
+    """
+    return {rse: topic.format(rse=rse) if topic else rse for rse in rses}
 
 
 def read_dids_from_file(file_path: str) -> List:
@@ -67,38 +554,662 @@ def read_dids_from_file(file_path: str) -> List:
     return dids
 
 
-def process_dids(dids: List, rse: str, topic: str):
-    client = Client()
-    kafka_sender = RucioKafkaProducer(topic)
+def iter_dids_from_file(file_path: str) -> Iterator[str]:
+    """Lazily read the DIDs of a file, one per line."""
+    with open(file_path, "r") as file:
+        for line in file:
+            if line.strip():
+                yield line.strip()
+
+
+DID_SUCCEEDED = "succeeded"
+DID_EMPTY = "empty"
+DID_FAILED = "failed"
+DID_SKIPPED = "skipped"
+
+
+def _unsent_events(
+    events: Iterable[Dict], journal: RunJournal, skipped: Counter
+) -> Iterator[Dict]:
+    """Drop the events whose delivery is already recorded in the journal,
+    counting them in ``skipped``.
+    """
+    for event in events:
+        if journal.is_file_done(journal_dids(event)[1]):
+            skipped["files"] += 1
+        else:
+            yield event
+
+
+def _record_completion(journal: RunJournal, did: str, produced: int):
+    """Record a DID as completed, once all its file events are delivered
+    when the journal tracks files.
+    """
+    if not journal.track_files or journal.delivered(did) >= produced:
+        journal.record_did(did)
+    else:
+        logger.warning(
+            f"Only {journal.delivered(did)} of {produced} events of DID {did} "
+            "delivered, it will be processed again on resume"
+        )
+
+
+def process_did(
+    did: str,
+    rse: Union[str, Sequence[str]],
+    client: Client,
+    sink: EventSink,
+    metadata_chunk_size: int = RucioProcessor.DEFAULT_METADATA_CHUNK_SIZE,
+    stream_window: Optional[int] = None,
+    cache: Optional[RucioCache] = None,
+    journal: Optional[RunJournal] = None,
+    timestamp_granularity: float = 0.0,
+    dedup: Optional[DedupIndex] = None,
+    replicas: Optional[Dict[str, Dict[str, str]]] = None,
+) -> str:
+    """Create and send the events of a single DID, returning its outcome.
+
+    When ``stream_window`` is set, the file payloads and the events are
+    generated lazily and sent as they are produced, ``stream_window`` files
+    at a time, instead of being built for the whole DID first.
+
+    With a ``journal``, DIDs already completed are skipped, as are the file
+    events already delivered when the journal tracks files, and the DID is
+    recorded once its events are sent. A DID whose Rucio lookups failed is
+    not recorded, and its outcome is ``DID_FAILED``.
+
+    With a ``dedup`` index, the events of the files already emitted for
+    the RSE, by this DID, another one or a previous run, are suppressed;
+    the sink, given the same index, confirms the delivered events.
+
+    ``rse`` may list several RSEs: the files and their metadata are then
+    looked up once, and an event is created for each RSE holding a replica.
+
+    ``replicas`` are the replica URLs of the files of the DID, by RSE and
+    name, when they were looked up with those of other DIDs; they are not
+    used when streaming.
 
-    for did in dids:
+    Consecutive events share their creation time for
+    ``timestamp_granularity`` seconds.
+    """
+    try:
         scope, name = did.split(":")
-        try:
-            rucio_client = RucioProcessor(scope, name, rse, client)
+        did = f"{scope}:{name}"
+        if journal is not None and journal.is_done(did):
+            logger.info(f"DID {did} already sent, skipped")
+            return DID_SKIPPED
+        rucio_client = RucioProcessor(
+            scope,
+            name,
+            rse,
+            client,
+            metadata_chunk_size=metadata_chunk_size,
+            cache=cache,
+            replicas=None if stream_window else replicas,
+        )
+        produced = 0
+        skipped = Counter()
+        if stream_window:
+            event_gen = KafkaEvent(
+                rucio_client.iter_payload_records(stream_window),
+                timestamp_granularity=timestamp_granularity,
+            )
+            events = event_gen.iter_event_records()
+            if journal is not None and journal.track_files:
+                events = _unsent_events(events, journal, skipped)
+            if dedup is not None:
+                events = dedup.filter(events, skipped)
+            with STAGE_SECONDS.labels("stream").time():
+                produced = sink.send_event(events)
+            sent = produced + skipped["files"] + skipped["duplicates"]
+        else:
             # Estrai i metadati
-            payload = rucio_client.get_payload()
-            if len(payload) == 0:
-                logger.warning(
-                    f"No RSE found associated with files in DID {scope}:{name}"
+            with STAGE_SECONDS.labels("lookup").time():
+                payload = rucio_client.get_payload_records()
+            sent = len(payload)
+            if sent:
+                with STAGE_SECONDS.labels("events").time():
+                    event_gen = KafkaEvent(
+                        payload, timestamp_granularity=timestamp_granularity
+                    )
+                    events = event_gen.process_metadata_records()
+                if journal is not None and journal.track_files:
+                    events = _unsent_events(events, journal, skipped)
+                if dedup is not None:
+                    events = dedup.filter(events, skipped)
+                with STAGE_SECONDS.labels("produce").time():
+                    produced = sink.send_event(events)
+        if rucio_client.lookup_errors:
+            # The events of the files whose lookup failed are missing: the
+            # DID is not completed, to be processed again on resume.
+            logger.error(
+                f"{rucio_client.lookup_errors} Rucio lookups failed for DID {did}, "
+                f"{produced} events sent"
+            )
+            return DID_FAILED
+        if skipped["files"]:
+            logger.info(f"{skipped['files']} events of DID {did} already delivered")
+        if skipped["duplicates"]:
+            logger.info(
+                f"{skipped['duplicates']} duplicate events of DID {did} suppressed"
+            )
+        if journal is not None:
+            _record_completion(journal, did, produced)
+        if sent == 0:
+            logger.warning(f"No RSE found associated with files in DID {scope}:{name}")
+            logger.warning(f"Event creation for DID {scope}:{name} stopped")
+            return DID_EMPTY
+
+        logger.debug(f"DID {did} dummy event correctly created and sent")
+        return DID_SUCCEEDED
+
+    except Exception as e:
+        logger.error(f"Error processing DID {did}: {e}")
+        return DID_FAILED
+
+
+def _bounded_map(
+    executor: ThreadPoolExecutor, function: Callable, items: Iterable, max_pending: int
+) -> Iterator:
+    """Map a function on the executor, with at most ``max_pending`` items
+    submitted at once so that lazy inputs are not read in advance.
+    """
+    pending = set()
+    for item in items:
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from (future.result() for future in done)
+        pending.add(executor.submit(function, item))
+    yield from (future.result() for future in as_completed(pending))
+
+
+def _did_progress(dids: Iterable[str], expand_containers: bool) -> ProgressLog:
+    """Return the progress log of the DIDs, with their number when it is
+    known in advance.
+    """
+    total = None
+    if isinstance(dids, Sized) and not expand_containers:
+        total = len(dids)
+    return ProgressLog(logger, "DIDs", total=total)
+
+
+def resolve_dids(
+    dids: Iterable[str],
+    rse: Union[str, Sequence[str]],
+    client_factory: Callable[[], Client],
+    expand_containers: bool = False,
+    fan_out: int = ContainerExpander.DEFAULT_FAN_OUT,
+    replica_batch_size: Optional[int] = None,
+    cache: Optional[RucioCache] = None,
+) -> Iterator[Tuple[str, Optional[Dict[str, Dict[str, str]]]]]:
+    """Yield the DIDs to process with the replicas of their files, or None
+    when they are looked up by each DID.
+
+    With ``expand_containers``, the containers are replaced by their
+    datasets, walked with ``fan_out`` concurrent calls. With
+    ``replica_batch_size``, the replicas of that many DIDs at first are
+    looked up in a single call, the size of the next chunks following the
+    duration of the calls.
+    """
+    if expand_containers:
+        dids = ContainerExpander(client_factory, fan_out).expand(dids)
+    if not replica_batch_size:
+        return ((did, None) for did in dids)
+    batcher = ReplicaBatcher(
+        client_factory(), rse, AdaptiveChunkSize(replica_batch_size), cache=cache
+    )
+    return batcher.iter_replicas(dids)
+
+
+def process_dids(
+    dids: Iterable[str],
+    rse: Union[str, Sequence[str]],
+    topic: str,
+    metadata_chunk_size: int = RucioProcessor.DEFAULT_METADATA_CHUNK_SIZE,
+    flush_timeout: float = RucioKafkaProducer.DEFAULT_FLUSH_TIMEOUT,
+    flush_each: bool = False,
+    workers: int = 1,
+    stream_window: Optional[int] = None,
+    cache: Optional[RucioCache] = None,
+    journal: Optional[RunJournal] = None,
+    client_factory: Optional[Callable[[], Client]] = None,
+    sink: Optional[EventSink] = None,
+    timestamp_granularity: float = 0.0,
+    dedup: Optional[DedupIndex] = None,
+    expand_containers: bool = False,
+    fan_out: int = ContainerExpander.DEFAULT_FAN_OUT,
+    replica_batch_size: Optional[int] = None,
+) -> Counter:
+    """Process the DIDs, concurrently when more than one worker is requested.
+
+    The sink, a Kafka producer for ``topic`` unless ``sink`` is given, is
+    shared by all the workers and receives the events of all the RSEs,
+    while each worker thread owns its Rucio client, built by
+    ``client_factory`` (by default the Rucio ``Client``).
+
+    Containers are expanded, and replicas looked up for chunks of DIDs, as
+    described in ``resolve_dids``; grouped replica lookups are not used
+    when streaming.
+    """
+    client_factory = client_factory or Client
+    if sink is None:
+        sink = create_sink(
+            "kafka",
+            topic,
+            flush_timeout=flush_timeout,
+            flush_each=flush_each,
+            journal=journal,
+            dedup=dedup,
+        )
+    options = dict(
+        metadata_chunk_size=metadata_chunk_size,
+        stream_window=stream_window,
+        cache=cache,
+        journal=journal,
+        timestamp_granularity=timestamp_granularity,
+        dedup=dedup,
+    )
+    summary = Counter()
+    progress = _did_progress(dids, expand_containers)
+    items = resolve_dids(
+        dids,
+        rse,
+        client_factory,
+        expand_containers=expand_containers,
+        fan_out=fan_out,
+        replica_batch_size=None if stream_window else replica_batch_size,
+        cache=cache,
+    )
+
+    if workers <= 1:
+        client = client_factory()
+        for did, replicas in items:
+            with track_memory(did):
+                outcome = process_did(
+                    did, rse, client, sink, replicas=replicas, **options
                 )
-                logger.warning(f"Event creation for DID {scope}:{name} stopped")
-                continue
-            event_gen = KafkaEvent(payload)
-            kafka_sender.send_event(event_gen.process_metadata())
+            summary[outcome] += 1
+            progress.add()
+    else:
+        local = threading.local()
+
+        def worker(item: Tuple[str, Optional[Dict[str, str]]]) -> str:
+            if not hasattr(local, "client"):
+                local.client = client_factory()
+            did, replicas = item
+            with track_memory(did):
+                return process_did(
+                    did, rse, local.client, sink, replicas=replicas, **options
+                )
+
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="DIDWorker"
+        ) as executor:
+            for outcome in _bounded_map(executor, worker, items, 2 * workers):
+                summary[outcome] += 1
+                progress.add()
+
+    progress.close()
+    logger.info(
+        f"Processed {sum(summary.values())} DIDs: {summary[DID_SUCCEEDED]} succeeded, "
+        f"{summary[DID_EMPTY]} empty, {summary[DID_FAILED]} failed, "
+        f"{summary[DID_SKIPPED]} skipped"
+    )
+    logger.info(f"Event sink: {sink.summary()}")
+    if dedup is not None:
+        logger.info(f"Deduplication: {dedup.summary()}")
+    return summary
+
+
+PIPELINE_STOP = object()
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_REPORT_INTERVAL = 1.0
+
+
+def _check_lookups(processor: RucioProcessor, did: str):
+    """Fail the pipeline stage of a DID whose Rucio lookups failed."""
+    if processor.lookup_errors:
+        raise RuntimeError(f"{processor.lookup_errors} Rucio lookups failed for {did}")
 
-            logger.info(f"DID {did} dummy event correctly created and sent")
 
+async def _run_stage(
+    name: str,
+    handler: Callable,
+    inbox: asyncio.Queue,
+    outbox: Optional[asyncio.Queue],
+    outcomes: Counter,
+    executor: ThreadPoolExecutor,
+    progress: Optional[ProgressLog] = None,
+):
+    """Consume the items of a pipeline stage until the stop marker arrives.
+
+    Each item is a ``(did, value)`` tuple. The blocking ``handler`` runs in
+    the executor; its result is forwarded to ``outbox``, or ends the DID
+    when it is None (no event to send) or when this is the last stage. The
+    DIDs ended are counted in ``progress``.
+    """
+    loop = asyncio.get_running_loop()
+    stage_seconds = STAGE_SECONDS.labels(name)
+    while True:
+        item = await inbox.get()
+        if item is PIPELINE_STOP:
+            return
+        did, value = item
+        try:
+            with stage_seconds.time():
+                result = await loop.run_in_executor(executor, handler, did, value)
         except Exception as e:
-            logger.error(f"Error processing DID {did}: {e}")
+            logger.error(f"Error processing DID {did} in stage {name}: {e}")
+            outcomes[DID_FAILED] += 1
+        else:
+            if result is not None and outbox is not None:
+                await outbox.put((did, result))
+                continue
+            outcomes[DID_EMPTY if result is None else DID_SUCCEEDED] += 1
+        if progress is not None:
+            progress.add()
+
+
+async def _report_queue_depths(
+    queues: Dict[str, asyncio.Queue], max_depths: Counter, interval: float
+):
+    """Periodically log and record the depth of the pipeline queues."""
+    while True:
+        for name, queue in queues.items():
+            max_depths[name] = max(max_depths[name], queue.qsize())
+            QUEUE_DEPTH.labels(name).set(queue.qsize())
+        depths = ", ".join(f"{name}={queue.qsize()}" for name, queue in queues.items())
+        logger.debug(f"Pipeline queue depths: {depths}")
+        await asyncio.sleep(interval)
+
+
+async def process_dids_async(
+    dids: Iterable[str],
+    rse: Union[str, Sequence[str]],
+    topic: str,
+    metadata_chunk_size: int = RucioProcessor.DEFAULT_METADATA_CHUNK_SIZE,
+    flush_timeout: float = RucioKafkaProducer.DEFAULT_FLUSH_TIMEOUT,
+    flush_each: bool = False,
+    workers: int = 1,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    report_interval: float = DEFAULT_REPORT_INTERVAL,
+    cache: Optional[RucioCache] = None,
+    journal: Optional[RunJournal] = None,
+    client_factory: Optional[Callable[[], Client]] = None,
+    sink: Optional[EventSink] = None,
+    timestamp_granularity: float = 0.0,
+    dedup: Optional[DedupIndex] = None,
+    expand_containers: bool = False,
+    fan_out: int = ContainerExpander.DEFAULT_FAN_OUT,
+    replica_batch_size: Optional[int] = None,
+) -> Counter:
+    """Process the DIDs through an asyncio pipeline.
+
+    File enumeration, replica lookup, metadata lookup, event building and
+    production run as separate stages, each with ``workers`` consumers,
+    connected by queues of at most ``queue_size`` DIDs. A full queue blocks
+    the upstream stage, so the depth of the queues shows the bottleneck.
+
+    The DIDs fed to the pipeline are resolved by ``resolve_dids``: the
+    replicas looked up in chunks skip the enumeration and replica calls.
+    """
+    if sink is None:
+        sink = create_sink(
+            "kafka",
+            topic,
+            flush_timeout=flush_timeout,
+            flush_each=flush_each,
+            journal=journal,
+            dedup=dedup,
+        )
+    client_factory = client_factory or Client
+    local = threading.local()
+
+    def thread_client() -> Client:
+        if not hasattr(local, "client"):
+            local.client = client_factory()
+        return local.client
+
+    def enumerate_files(did, replicas):
+        scope, name = did.split(":")
+        processor = RucioProcessor(
+            scope,
+            name,
+            rse,
+            thread_client(),
+            metadata_chunk_size=metadata_chunk_size,
+            cache=cache,
+            replicas=replicas,
+        )
+        names = processor._get_file_names()
+        _check_lookups(processor, did)
+        return processor, names
+
+    def lookup_replicas(did, value):
+        processor, names = value
+        processor.client = thread_client()
+        replicas = processor._get_replicas()
+        _check_lookups(processor, did)
+        names = processor._names_on_rse(names, replicas)
+        if len(names) == 0:
+            logger.warning(f"No RSE found associated with files in DID {did}")
+            logger.warning(f"Event creation for DID {did} stopped")
+            return None
+        processor._log_skipped_lookups()
+        return processor, names, replicas
+
+    def lookup_metadata(did, value):
+        processor, names, replicas = value
+        processor.client = thread_client()
+        payload = processor._join_replicas(
+            processor._get_all_metadata(names), replicas
+        )
+        _check_lookups(processor, did)
+        if len(payload) == 0:
+            logger.warning(f"No metadata found for the files of DID {did}")
+            logger.warning(f"Event creation for DID {did} stopped")
+            return None
+        return payload
+
+    def build_events(did, payload):
+        events = KafkaEvent(
+            payload, timestamp_granularity=timestamp_granularity
+        ).process_metadata_records()
+        if journal is not None and journal.track_files:
+            events = list(_unsent_events(events, journal, Counter()))
+        if dedup is not None:
+            skipped = Counter()
+            events = list(dedup.filter(events, skipped))
+            if skipped["duplicates"]:
+                logger.info(
+                    f"{skipped['duplicates']} duplicate events of DID {did} suppressed"
+                )
+        return events
+
+    def produce(did, events):
+        produced = sink.send_event(events)
+        if journal is not None:
+            _record_completion(journal, did, produced)
+        logger.debug(f"DID {did} dummy event correctly created and sent")
+        return did
+
+    stages = {
+        "enumerate": enumerate_files,
+        "replicas": lookup_replicas,
+        "metadata": lookup_metadata,
+        "events": build_events,
+        "produce": produce,
+    }
+    workers = max(1, workers)
+    queues = {name: asyncio.Queue(maxsize=queue_size) for name in stages}
+    outboxes = list(queues.values())[1:] + [None]
+    outcomes = Counter()
+    max_depths = Counter()
+    progress = _did_progress(dids, expand_containers)
+
+    with ThreadPoolExecutor(
+        max_workers=len(stages) * workers, thread_name_prefix="PipelineStage"
+    ) as executor:
+        monitor = asyncio.create_task(
+            _report_queue_depths(queues, max_depths, report_interval)
+        )
+        stage_tasks = [
+            [
+                asyncio.create_task(
+                    _run_stage(
+                        name,
+                        handler,
+                        queues[name],
+                        outbox,
+                        outcomes,
+                        executor,
+                        progress,
+                    )
+                )
+                for _ in range(workers)
+            ]
+            for (name, handler), outbox in zip(stages.items(), outboxes)
+        ]
+        items = resolve_dids(
+            dids,
+            rse,
+            thread_client,
+            expand_containers=expand_containers,
+            fan_out=fan_out,
+            replica_batch_size=replica_batch_size,
+            cache=cache,
+        )
+        loop = asyncio.get_running_loop()
+        while True:
+            # The DIDs are resolved in the executor, not to block the stages.
+            item = await loop.run_in_executor(executor, next, items, PIPELINE_STOP)
+            if item is PIPELINE_STOP:
+                break
+            did, replicas = item
+            if journal is not None and journal.is_done(did):
+                logger.info(f"DID {did} already sent, skipped")
+                outcomes[DID_SKIPPED] += 1
+                progress.add()
+                continue
+            await queues["enumerate"].put((did, replicas))
+        for queue, tasks in zip(queues.values(), stage_tasks):
+            for _ in tasks:
+                await queue.put(PIPELINE_STOP)
+            await asyncio.gather(*tasks)
+        monitor.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await monitor
+
+    progress.close()
+    depths = ", ".join(f"{name}={max_depths[name]}" for name in queues)
+    logger.info(f"Pipeline maximum queue depths: {depths}")
+    logger.info(
+        f"Processed {sum(outcomes.values())} DIDs: {outcomes[DID_SUCCEEDED]} succeeded, "
+        f"{outcomes[DID_EMPTY]} empty, {outcomes[DID_FAILED]} failed, "
+        f"{outcomes[DID_SKIPPED]} skipped"
+    )
+    logger.info(f"Event sink: {sink.summary()}")
+    if dedup is not None:
+        logger.info(f"Deduplication: {dedup.summary()}")
+    return outcomes
 
 
 def main():
     args = parse_arguments()
-    topic = args.topic or args.rse
-    dids = args.dids or read_dids_from_file(args.file)
+    configure_logging(
+        verbose=args.verbose,
+        progress_interval=args.progress_interval,
+        sample=args.log_sample,
+    )
+    if args.profile:
+        profiler = RunProfiler(
+            args.profile, top=args.profile_top, trace_memory=args.trace_memory
+        )
+    else:
+        profiler = contextlib.nullcontext()
+    with queued_logging(args.async_logging), profiler:
+        run(args)
+
+
+def run(args: argparse.Namespace):
+    """Process the DIDs selected on the command line."""
+    rses = resolve_rses(args.rse)
+    topics = rse_topics(rses, args.topic)
+    topic = topics[rses[0]]
+    rse = rses[0] if len(rses) == 1 else rses
+    if args.stream_window:
+        dids = args.dids or iter_dids_from_file(args.file)
+    else:
+        dids = args.dids or read_dids_from_file(args.file)
     if args.verbose:
-        logger.info(f"The following list of DIDs will be processed:  {dids}")
-        logger.info(f"The events will be applied to the following RSE: {args.rse}")
-        logger.info(f"The events will be sent to the following topic: {topic}")
+        if isinstance(dids, list):
+            logger.info(f"The following list of DIDs will be processed:  {dids}")
+        else:
+            logger.info(f"The DIDs will be read lazily from: {args.file}")
+        logger.info(f"The events will be applied to the following RSEs: {rses}")
+        logger.info(f"The events will be sent to the following topics: {topics}")
 
-    process_dids(dids, args.rse, topic)
+    cache = None
+    if args.cache_dir:
+        cache = RucioCache(
+            args.cache_dir, ttl=args.cache_ttl, max_size=args.cache_max_size * 1024**2
+        )
+    journal = None
+    if args.journal:
+        journal = RunJournal(
+            args.journal, resume=args.resume, track_files=args.journal_files
+        )
+    dedup = None
+    if args.dedup or args.dedup_index:
+        dedup = DedupIndex(args.dedup_index, capacity=args.dedup_capacity)
+    sink = create_sink(
+        args.sink,
+        topic,
+        output=args.output,
+        batch_size=args.sink_batch_size,
+        flush_timeout=args.flush_timeout,
+        flush_each=args.flush_each_message,
+        journal=journal,
+        encoder=EventEncoder(fast=args.fast_json),
+        key_strategy=args.key_strategy,
+        partitioner=args.partitioner,
+        partitions=args.partitions,
+        kafka_config=kafka_config_from_args(args),
+        topics=topics if len(rses) > 1 else None,
+        dedup=dedup,
+    )
+    options = dict(
+        metadata_chunk_size=args.metadata_chunk_size,
+        workers=args.workers,
+        cache=cache,
+        journal=journal,
+        sink=sink,
+        timestamp_granularity=args.timestamp_granularity,
+        dedup=dedup,
+        expand_containers=args.expand_containers,
+        fan_out=args.expansion_workers,
+        replica_batch_size=args.replica_batch_size,
+    )
+    try:
+        with exported_metrics(args, sink):
+            try:
+                if args.pipeline:
+                    asyncio.run(
+                        process_dids_async(
+                            dids, rse, topic, queue_size=args.queue_size, **options
+                        )
+                    )
+                else:
+                    process_dids(
+                        dids, rse, topic, stream_window=args.stream_window, **options
+                    )
+            finally:
+                sink.close()
+    finally:
+        if cache is not None:
+            logger.info(f"Rucio cache: {cache.summary()}")
+            cache.close()
+        if journal is not None:
+            journal.close()
+        if dedup is not None:
+            dedup.close()
@@ -1,6 +1,9 @@
 import logging
-from typing import Dict, List
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 from datetime import datetime
+from lsst.rucioevents.metrics import EVENT_BUILD_SECONDS, EVENTS_BUILT
+from lsst.rucioevents.records import EVENT_TYPE, TransferEvent
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,11 +16,27 @@ logger = logging.getLogger("KafkaEventGenerator")
 class KafkaEvent:
     """Class to handle Kafka events for file transfers."""
 
-    EVENT_TYPE = "transfer-done"
+    EVENT_TYPE = EVENT_TYPE
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
 
-    def __init__(self, metadata: Dict[str, Dict]):
+    def __init__(
+        self,
+        metadata: Union[Dict[str, Dict], Iterable[Tuple[str, Dict]]],
+        timestamp_granularity: float = 0.0,
+    ):
+        """
+        Args:
+            metadata: The payload of each file, either as a dictionary
+                keyed by file name or as a stream of ``(name, payload)``
+                pairs, which can then be consumed only once.
+            timestamp_granularity: Time in seconds during which the events
+                share their ``created_at``, instead of reading the clock for
+                every event. Use ``math.inf`` for one timestamp per batch.
+        """
         self.metadata = metadata
+        self.timestamp_granularity = timestamp_granularity
+        self._timestamp = None
+        self._timestamp_time = 0.0
 
     def get_metadata(self) -> Dict[str, Dict]:
         """Return the metadata associated with the event."""
@@ -25,21 +44,56 @@ class KafkaEvent:
 
     def process_metadata(self) -> List[Dict]:
         """Process metadata to create a list of events."""
+        return [event.to_dict() for event in self.process_metadata_records()]
+
+    def process_metadata_records(self) -> List[TransferEvent]:
+        """Process metadata to create a list of events, as compact records
+        with the read-only API of a dictionary.
+        """
         logger.info("Generating dummy events")
-        all_events = []
-        for file, payload in self.metadata.items():
-            all_events.append(self._create_file_event(payload))
-        return all_events
+        with EVENT_BUILD_SECONDS.time():
+            return list(self._iter_file_events())
+
+    def iter_events(self) -> Iterator[Dict]:
+        """Lazily create the events, one per file payload."""
+        return (event.to_dict() for event in self.iter_event_records())
+
+    def iter_event_records(self) -> Iterator[TransferEvent]:
+        """Lazily create the events, one per file payload, as compact
+        records.
+        """
+        logger.info("Streaming dummy events")
+        return self._iter_file_events()
 
-    def _create_file_event(self, file_meta: Dict) -> Dict:
+    def _iter_file_events(self) -> Iterator[TransferEvent]:
+        """Yield the event of each file payload."""
+        items = self.metadata.items() if isinstance(self.metadata, dict) else self.metadata
+        built = 0
+        try:
+            for file, payload in items:
+                yield self._create_file_event(payload)
+                built += 1
+        finally:
+            EVENTS_BUILT.inc(built)
+
+    def _create_file_event(self, file_meta: Dict) -> TransferEvent:
         """Create a single file event with the given metadata."""
-        created_at = datetime.now().strftime(self.DATE_FORMAT)
-        event_dict = {
-            "event_type": self.EVENT_TYPE,
-            "payload": file_meta,
-            "created_at": created_at,
-        }
-        return event_dict
+        return TransferEvent(file_meta, self._created_at())
+
+    def _created_at(self) -> str:
+        """Return the creation time of an event, read from the clock at
+        most once every ``timestamp_granularity`` seconds.
+        """
+        if self.timestamp_granularity <= 0:
+            return datetime.now().strftime(self.DATE_FORMAT)
+        now = time.monotonic()
+        if (
+            self._timestamp is None
+            or now - self._timestamp_time >= self.timestamp_granularity
+        ):
+            self._timestamp = datetime.now().strftime(self.DATE_FORMAT)
+            self._timestamp_time = now
+        return self._timestamp
 
     @staticmethod
     def _get_template() -> Dict:
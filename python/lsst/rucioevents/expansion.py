@@ -0,0 +1,269 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from rucio.client import Client
+from lsst.rucioevents.cache import RucioCache
+from lsst.rucioevents.metrics import timed_call
+from lsst.rucioevents.utils import AdaptiveChunkSize
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("RucioExpansion")
+
+CONTAINER = "CONTAINER"
+
+
+class ContainerExpander:
+    """
+    Expands the containers of a list of DIDs into their datasets.
+
+    The DIDs are resolved, and the containers listed, by a pool of
+    ``fan_out`` threads, each owning a Rucio client built by
+    ``client_factory``, so that at most ``fan_out`` calls are in flight.
+    Nested containers are walked recursively. Each dataset is yielded once,
+    as soon as it is found, even when it belongs to several of the
+    containers; DIDs that are not containers, or that cannot be resolved,
+    are yielded unchanged.
+
+    Args:
+        client_factory (callable, optional): Builds the Rucio clients, by
+            default the Rucio ``Client``.
+        fan_out (int, optional): Maximum number of concurrent Rucio calls.
+    """
+
+    DEFAULT_FAN_OUT = 8
+
+    def __init__(
+        self,
+        client_factory: Optional[Callable[[], Client]] = None,
+        fan_out: int = DEFAULT_FAN_OUT,
+    ):
+        self.client_factory = client_factory or Client
+        self.fan_out = max(1, fan_out)
+        self.counts = Counter()
+        self._local = threading.local()
+
+    def _client(self) -> Client:
+        if not hasattr(self._local, "client"):
+            self._local.client = self.client_factory()
+        return self._local.client
+
+    def _resolve(self, did: str, did_type: Optional[str]) -> Tuple[str, List[Dict]]:
+        """Return the type of a DID and, for a container, its children."""
+        scope, name = did.split(":")
+        if did_type is None:
+            info = timed_call("get_did", self._client().get_did, scope, name)
+            did_type = info["type"].upper()
+        if did_type != CONTAINER:
+            return did_type, []
+        content = timed_call("list_content", self._client().list_content, scope, name)
+        return did_type, list(content)
+
+    def expand(self, dids: Iterable[str]) -> Iterator[str]:
+        """Yield the datasets of the DIDs, in the order they are found."""
+        iterator = iter(dids)
+        seen = set()
+        pending = {}
+        exhausted = False
+        with ThreadPoolExecutor(
+            max_workers=self.fan_out, thread_name_prefix="ContainerWalker"
+        ) as executor:
+            while pending or not exhausted:
+                # Read the input DIDs only when a thread is free.
+                while not exhausted and len(pending) < self.fan_out:
+                    did = next(iterator, None)
+                    if did is None:
+                        exhausted = True
+                    elif did not in seen:
+                        seen.add(did)
+                        pending[executor.submit(self._resolve, did, None)] = did
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    did = pending.pop(future)
+                    try:
+                        did_type, children = future.result()
+                    except Exception as e:
+                        logger.error(f"Error expanding DID {did}: {e}")
+                        self.counts["errors"] += 1
+                        yield did
+                        continue
+                    if did_type != CONTAINER:
+                        self.counts[did_type.lower()] += 1
+                        yield did
+                        continue
+                    self.counts["containers"] += 1
+                    for child in children:
+                        child_did = f"{child['scope']}:{child['name']}"
+                        if child_did in seen:
+                            continue
+                        seen.add(child_did)
+                        child_type = child["type"].upper()
+                        if child_type == CONTAINER:
+                            future = executor.submit(
+                                self._resolve, child_did, child_type
+                            )
+                            pending[future] = child_did
+                        else:
+                            self.counts[child_type.lower()] += 1
+                            yield child_did
+        logger.info(f"Expanded the DIDs: {self.summary()}")
+
+    def summary(self) -> str:
+        """Return the number of containers walked and of DIDs found."""
+        return (
+            f"{self.counts['containers']} containers, "
+            f"{self.counts['dataset']} datasets, {self.counts['file']} files, "
+            f"{self.counts['errors']} errors"
+        )
+
+
+class ReplicaBatcher:
+    """
+    Looks up the replicas on one or several RSEs of the files of many
+    datasets with one ``list_replicas`` call per chunk of datasets, instead
+    of one per dataset.
+
+    The replicas are attributed to the datasets of the chunk through the
+    ``parents`` returned with ``resolve_parents``; they give both the files
+    of each dataset with a replica on the RSE and their URL, so that
+    neither ``list_files`` nor ``list_replicas`` is needed per dataset. The
+    number of datasets per call follows ``chunk_size``, adjusted to the
+    duration of the calls.
+
+    When a chunk cannot be looked up, or the server does not resolve the
+    parents, its datasets are yielded without replicas, to be looked up one
+    at a time. Datasets whose replicas are in the cache are not requested.
+
+    Args:
+        client (Client): The Rucio client.
+        rse (str or list of str): The Rucio Storage Element, or several.
+        chunk_size (AdaptiveChunkSize): Number of datasets per call.
+        cache (RucioCache, optional): Cache of the replica lookups.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        rse: Union[str, Sequence[str]],
+        chunk_size: AdaptiveChunkSize,
+        cache: Optional[RucioCache] = None,
+    ):
+        self.client = client
+        self.rses = [rse] if isinstance(rse, str) else list(rse)
+        self.rse = "|".join(self.rses)
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.calls = 0
+        self.fallbacks = 0
+
+    def _cached(self, did: str) -> Optional[Dict[str, Dict[str, str]]]:
+        if self.cache is None:
+            return None
+        scope, name = did.split(":")
+        cached = {
+            rse: self.cache.get("replicas", scope, name, rse) for rse in self.rses
+        }
+        if any(urls is None for urls in cached.values()):
+            return None
+        return cached
+
+    def _lookup(
+        self, dids: List[str]
+    ) -> Optional[Dict[str, Dict[str, Dict[str, str]]]]:
+        """Return the replica URLs of the files of each DID on each RSE, or
+        None if the chunk could not be looked up.
+        """
+        requested = []
+        for did in dids:
+            scope, name = did.split(":")
+            requested.append({"scope": scope, "name": name})
+        replicas = {did: {rse: {} for rse in self.rses} for did in dids}
+        start = time.monotonic()
+        try:
+            self.calls += 1
+            for replica in timed_call(
+                "list_replicas",
+                self.client.list_replicas,
+                requested,
+                rse_expression=self.rse,
+                resolve_parents=True,
+            ):
+                if "parents" not in replica:
+                    logger.warning("Replica parents not returned by the server")
+                    return None
+                file_did = f"{replica['scope']}:{replica['name']}"
+                owners = [
+                    did for did in [file_did, *replica["parents"]] if did in replicas
+                ]
+                for rse in self.rses:
+                    if rse in replica["rses"]:
+                        for did in owners:
+                            replicas[did][rse][replica["name"]] = replica["rses"][rse][
+                                0
+                            ]
+        except Exception as e:
+            logger.warning(
+                f"Error retrieving the replicas of {len(dids)} DIDs, looking them "
+                f"up one at a time: {e}"
+            )
+            return None
+        self.chunk_size.update(time.monotonic() - start)
+        if self.cache is not None:
+            for did, by_rse in replicas.items():
+                scope, name = did.split(":")
+                for rse, urls in by_rse.items():
+                    self.cache.put("replicas", scope, name, urls, rse)
+        return replicas
+
+    def iter_replicas(
+        self, dids: Iterable[str]
+    ) -> Iterator[Tuple[str, Optional[Dict[str, Dict[str, str]]]]]:
+        """Yield each DID with the replica URLs of its files, by RSE then
+        file name, or None when they must be looked up for the DID alone.
+        """
+        iterator = iter(dids)
+        while True:
+            chunk = []
+            while len(chunk) < self.chunk_size.value:
+                did = next(iterator, None)
+                if did is None:
+                    break
+                if did.count(":") != 1:
+                    # Left to the per-DID processing, which reports it.
+                    yield did, None
+                    continue
+                cached = self._cached(did)
+                if cached is not None:
+                    yield did, cached
+                else:
+                    chunk.append(did)
+            if not chunk:
+                break
+            replicas = self._lookup(chunk)
+            if replicas is None:
+                self.fallbacks += len(chunk)
+            for did in chunk:
+                yield did, None if replicas is None else replicas[did]
+        logger.info(
+            f"Replicas looked up with {self.calls} list_replicas calls, "
+            f"{self.fallbacks} DIDs left to single lookups, last chunk size "
+            f"{self.chunk_size.value}"
+        )
@@ -0,0 +1,218 @@
+import logging
+import math
+import random
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("FakeProducer")
+
+
+class FakeMessage:
+    """Delivered message, with the accessors of ``confluent_kafka.Message``."""
+
+    __slots__ = ("_topic", "_key", "_value", "_partition", "_offset")
+
+    def __init__(self, topic, key, value, partition, offset):
+        self._topic = topic
+        self._key = key
+        self._value = value
+        self._partition = partition
+        self._offset = offset
+
+    def topic(self):
+        return self._topic
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+
+class FakeProducer:
+    """
+    In-memory stand-in for ``confluent_kafka.Producer``.
+
+    Produced messages wait in a local queue of at most ``queue_size``
+    messages, ``produce`` raising ``BufferError`` when it is full, like
+    librdkafka. They are delivered, and their callback served, by ``poll``
+    and ``flush`` once they are ``latency`` seconds old. A fraction
+    ``error_rate`` of the deliveries fails.
+
+    Messages are delivered in requests of at most ``batch_messages``
+    messages, ``max_in_flight`` of them at a time, each taking
+    ``request_time`` seconds, to model the round trips to a broker.
+    ``delivery_latency`` sums the time from ``produce`` to the delivery of
+    every message, and ``messages_per_topic`` counts the messages delivered
+    to each topic.
+
+    Args:
+        config (dict, optional): Producer configuration, only kept.
+        queue_size (int, optional): Maximum number of undelivered messages.
+        latency (float, optional): Time for a message to be delivered.
+        error_rate (float, optional): Probability of a delivery to fail.
+        partitions (int, optional): Number of partitions of every topic.
+        seed (int, optional): Seed of the random delivery failures.
+        request_time (float, optional): Duration of a delivery request.
+        batch_messages (int, optional): Maximum number of messages of a
+            request.
+        max_in_flight (int, optional): Number of concurrent requests.
+    """
+
+    def __init__(
+        self,
+        config: Optional[Dict] = None,
+        queue_size: int = 100000,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        partitions: int = 1,
+        seed: int = 0,
+        request_time: float = 0.0,
+        batch_messages: int = 10000,
+        max_in_flight: int = 5,
+    ):
+        self.config = config or {}
+        self.queue_size = queue_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.partitions = partitions
+        self.request_time = request_time
+        self.batch_messages = batch_messages
+        self.max_in_flight = max_in_flight
+        self.produced = 0
+        self.delivered = 0
+        self.bytes = 0
+        self.delivery_latency = 0.0
+        self.messages_per_partition = Counter()
+        self.messages_per_topic = Counter()
+        self._queue = deque()
+        self._offsets = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict, **kwargs) -> "FakeProducer":
+        """
+        Build a producer behaving as the settings of a librdkafka
+        configuration: ``linger.ms`` sets the latency,
+        ``queue.buffering.max.messages`` the queue size,
+        ``batch.num.messages`` the size of the requests and
+        ``max.in.flight.requests.per.connection`` their concurrency.
+
+        :param config: librdkafka configuration.
+        :param kwargs: Other arguments of the producer.
+        """
+        settings = {
+            "latency": float(config.get("linger.ms", 5)) / 1000,
+            "queue_size": int(config.get("queue.buffering.max.messages", 100000)),
+            "batch_messages": int(config.get("batch.num.messages", 10000)),
+            "max_in_flight": int(
+                config.get("max.in.flight.requests.per.connection", 5)
+            ),
+        }
+        settings.update(kwargs)
+        return cls(config=config, **settings)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def produce(
+        self,
+        topic: str,
+        value=None,
+        key=None,
+        partition: int = -1,
+        callback: Optional[Callable] = None,
+        on_delivery: Optional[Callable] = None,
+        **kwargs,
+    ):
+        with self._lock:
+            if len(self._queue) >= self.queue_size:
+                raise BufferError("Local: Queue full")
+            if partition < 0:
+                partition = self._partition(key)
+            self._queue.append(
+                (
+                    time.monotonic(),
+                    topic,
+                    key,
+                    value,
+                    partition,
+                    callback or on_delivery,
+                )
+            )
+            self.produced += 1
+            self.bytes += len(value or b"")
+
+    def list_topics(self, topic: Optional[str] = None, timeout: float = -1):
+        """Returns the metadata of a topic, with ``partitions`` partitions."""
+        partitions = {
+            index: SimpleNamespace(id=index) for index in range(self.partitions)
+        }
+        topics = {
+            topic: SimpleNamespace(topic=topic, partitions=partitions, error=None)
+        }
+        return SimpleNamespace(topics=topics)
+
+    def _partition(self, key) -> int:
+        """Assigns a partition to a key, as a stable hash."""
+        if not key:
+            return 0
+        if not isinstance(key, bytes):
+            key = str(key).encode("utf-8")
+        return zlib.crc32(key) % self.partitions
+
+    def _deliver(self, wait: bool) -> int:
+        """Delivers the messages old enough, serving their callback."""
+        delivered = []
+        with self._lock:
+            deadline = time.monotonic() - self.latency
+            while self._queue and (wait or self._queue[0][0] <= deadline):
+                produced_at, topic, key, value, partition, callback = (
+                    self._queue.popleft()
+                )
+                failed = self._random.random() < self.error_rate
+                self.delivered += not failed
+                offset = self._offsets[(topic, partition)]
+                self._offsets[(topic, partition)] += 1
+                self.messages_per_partition[partition] += 1
+                self.messages_per_topic[topic] += not failed
+                message = FakeMessage(topic, key, value, partition, offset)
+                delivered.append((callback, failed, message, produced_at))
+        if delivered and self.request_time:
+            requests = math.ceil(len(delivered) / self.batch_messages)
+            time.sleep(math.ceil(requests / self.max_in_flight) * self.request_time)
+        now = time.monotonic()
+        for callback, failed, message, produced_at in delivered:
+            self.delivery_latency += now - produced_at
+            if callback is not None:
+                callback("Simulated delivery failure" if failed else None, message)
+        return len(delivered)
+
+    def poll(self, timeout: Optional[float] = None) -> int:
+        served = self._deliver(wait=False)
+        if not served and timeout and self._queue:
+            time.sleep(min(timeout, self.latency))
+            served = self._deliver(wait=False)
+        return served
+
+    def flush(self, timeout: Optional[float] = None) -> int:
+        if self.latency and self._queue:
+            time.sleep(self.latency)
+        self._deliver(wait=True)
+        return len(self._queue)
@@ -0,0 +1,291 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional
+from rucio.common.exception import (
+    DataIdentifierNotFound,
+    InvalidRSEExpression,
+    RucioException,
+    UnsupportedOperation,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("FakeRucioClient")
+
+
+class FakeRucioClient:
+    """
+    In-process stand-in for the Rucio client, serving a generated catalogue.
+
+    The catalogue holds ``n_datasets`` datasets of ``files_per_dataset``
+    files in ``scope``. With ``datasets_per_container``, the datasets are
+    also grouped in containers of that many datasets, themselves attached
+    to the ``container_all`` container. Files, metadata and replicas are
+    derived from the names on demand, so that large catalogues use no
+    memory. Every call
+    waits ``latency`` seconds, plus or minus a uniform ``jitter``, and fails
+    with probability ``error_rate``, to reproduce a remote server.
+
+    Args:
+        scope (str, optional): Scope of the datasets and files.
+        n_datasets (int, optional): Number of datasets in the catalogue.
+        files_per_dataset (int, optional): Number of files per dataset.
+        rses (list of str, optional): RSEs holding the replicas.
+        replica_fraction (float, optional): Fraction of the files with a
+            replica on each RSE.
+        latency (float, optional): Time taken by each call, in seconds.
+        jitter (float, optional): Maximum random deviation of the latency.
+        error_rate (float, optional): Probability of a call to fail.
+        bulk_metadata (bool, optional): Whether ``get_metadata_bulk`` is
+            supported.
+        sidecar_size (int, optional): Size of the ``rubin_sidecar`` blobs.
+        seed (int, optional): Seed of the random latencies and errors.
+        datasets_per_container (int, optional): Number of datasets of each
+            container, no container when 0.
+    """
+
+    ALL_CONTAINERS = "container_all"
+
+    def __init__(
+        self,
+        scope: str = "test",
+        n_datasets: int = 1,
+        files_per_dataset: int = 1000,
+        rses: Optional[List[str]] = None,
+        replica_fraction: float = 1.0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        bulk_metadata: bool = True,
+        sidecar_size: int = 64,
+        seed: int = 0,
+        datasets_per_container: int = 0,
+    ):
+        self.scope = scope
+        self.n_datasets = n_datasets
+        self.files_per_dataset = files_per_dataset
+        self.rses = rses or ["FAKE_RSE"]
+        self.replica_fraction = replica_fraction
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bulk_metadata = bulk_metadata
+        self.sidecar_size = sidecar_size
+        self.datasets_per_container = datasets_per_container
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def dataset_names(self) -> List[str]:
+        """Returns the names of the datasets of the catalogue."""
+        return [f"dataset_{index:06d}" for index in range(self.n_datasets)]
+
+    def container_names(self) -> List[str]:
+        """Returns the names of the containers of the datasets."""
+        if not self.datasets_per_container:
+            return []
+        count = -(-self.n_datasets // self.datasets_per_container)
+        return [f"container_{index:06d}" for index in range(count)]
+
+    def dids(self) -> List[str]:
+        """Returns the datasets of the catalogue as ``scope:name`` strings."""
+        return [f"{self.scope}:{name}" for name in self.dataset_names()]
+
+    def _call(self, method: str):
+        """Counts a call, then waits for its latency and draws its failure."""
+        with self._lock:
+            self.calls[method] += 1
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            failed = self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise RucioException(f"Simulated failure of {method}")
+
+    def _container_content(self, name: str) -> Optional[List[Dict]]:
+        """Returns the children of a container, or None if ``name`` is not
+        a container of the catalogue.
+        """
+        if name == self.ALL_CONTAINERS and self.datasets_per_container:
+            names, did_type = self.container_names(), "CONTAINER"
+        elif name in self.container_names():
+            index = int(name.split("_", 1)[1])
+            start = index * self.datasets_per_container
+            stop = min(start + self.datasets_per_container, self.n_datasets)
+            names = [f"dataset_{i:06d}" for i in range(start, stop)]
+            did_type = "DATASET"
+        else:
+            return None
+        return [
+            {"scope": self.scope, "name": child, "type": did_type} for child in names
+        ]
+
+    def _datasets(self, scope: str, name: str) -> List[str]:
+        """Returns the datasets of a DID, walking the containers."""
+        content = None
+        if scope == self.scope:
+            content = self._container_content(name)
+        if content is None:
+            self._check_dataset(scope, name)
+            return [name]
+        return [
+            dataset for child in content for dataset in self._datasets(scope, child["name"])
+        ]
+
+    def _parents(self, dataset: str) -> List[str]:
+        """Returns the ancestors of a dataset, as ``scope:name`` strings."""
+        parents = [f"{self.scope}:{dataset}"]
+        if self.datasets_per_container:
+            index = int(dataset.split("_", 1)[1]) // self.datasets_per_container
+            parents.append(f"{self.scope}:container_{index:06d}")
+            parents.append(f"{self.scope}:{self.ALL_CONTAINERS}")
+        return parents
+
+    def _check_dataset(self, scope: str, name: str):
+        """Raises DataIdentifierNotFound for a DID not in the catalogue."""
+        if scope != self.scope or not name.startswith("dataset_"):
+            raise DataIdentifierNotFound(f"Data identifier '{scope}:{name}' not found")
+        try:
+            index = int(name.split("_", 1)[1])
+        except ValueError:
+            raise DataIdentifierNotFound(f"Data identifier '{scope}:{name}' not found")
+        if not 0 <= index < self.n_datasets:
+            raise DataIdentifierNotFound(f"Data identifier '{scope}:{name}' not found")
+
+    def _file_names(self, dataset: str) -> Iterator[str]:
+        """Yields the names of the files of a dataset."""
+        for index in range(self.files_per_dataset):
+            yield f"{dataset}/file_{index:07d}.fits"
+
+    @staticmethod
+    def _fraction(key: str) -> float:
+        """Maps a key to a stable number in [0, 1)."""
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") / 2**64
+
+    def _has_replica(self, name: str, rse: str) -> bool:
+        """Tells whether a file has a replica on an RSE."""
+        return self._fraction(f"{rse}/{name}") < self.replica_fraction
+
+    def _file_metadata(self, scope: str, name: str) -> Dict:
+        """Returns the metadata of a file, with the DID columns."""
+        return {
+            "scope": scope,
+            "name": name,
+            "did_type": "FILE",
+            "bytes": 1024,
+            "rubin_butler": 1,
+            "rubin_sidecar": ("x" * self.sidecar_size) if self.sidecar_size else "",
+        }
+
+    def get_did(self, scope: str, name: str, dynamic_depth=None) -> Dict:
+        self._call("get_did")
+        if "/" in name:
+            return {"scope": scope, "name": name, "type": "FILE", "bytes": 1024}
+        if scope == self.scope and self._container_content(name) is not None:
+            return {"scope": scope, "name": name, "type": "CONTAINER"}
+        self._check_dataset(scope, name)
+        return {
+            "scope": scope,
+            "name": name,
+            "type": "DATASET",
+            "length": self.files_per_dataset,
+        }
+
+    def list_content(self, scope: str, name: str) -> Iterator[Dict]:
+        self._call("list_content")
+        content = self._container_content(name) if scope == self.scope else None
+        if content is None:
+            self._check_dataset(scope, name)
+            content = [
+                {"scope": scope, "name": file_name, "type": "FILE", "bytes": 1024}
+                for file_name in self._file_names(name)
+            ]
+        yield from content
+
+    def list_files(self, scope: str, name: str, long: bool = None) -> Iterator[Dict]:
+        self._call("list_files")
+        for dataset in self._datasets(scope, name):
+            for file_name in self._file_names(dataset):
+                file_info = {"scope": scope, "name": file_name, "bytes": 1024}
+                if long:
+                    file_info.update(
+                        {"adler32": "00000001", "guid": None, "events": None}
+                    )
+                yield file_info
+
+    def get_metadata(self, scope: str, name: str, plugin: str = "DID_COLUMN") -> Dict:
+        self._call("get_metadata")
+        return self._file_metadata(scope, name)
+
+    def get_metadata_bulk(
+        self, dids: List[Dict], inherit: bool = False, plugin: str = "JSON"
+    ) -> Iterator[Dict]:
+        self._call("get_metadata_bulk")
+        if not self.bulk_metadata:
+            raise UnsupportedOperation("get_metadata_bulk is not supported")
+        for did in dids:
+            yield self._file_metadata(did["scope"], did["name"])
+
+    def list_rses(self, rse_expression: Optional[str] = None) -> Iterator[Dict]:
+        """Lists the RSEs matching an expression, ``*`` or RSE names
+        separated by ``|``, the only forms understood.
+        """
+        self._call("list_rses")
+        rses = self.rses
+        if rse_expression and rse_expression != "*":
+            names = rse_expression.split("|")
+            rses = [rse for rse in rses if rse in names]
+            if not rses:
+                raise InvalidRSEExpression(
+                    f"RSE expression '{rse_expression}' matches no RSE"
+                )
+        for rse in rses:
+            yield {"rse": rse}
+
+    def list_replicas(
+        self,
+        dids: List[Dict],
+        rse_expression: Optional[str] = None,
+        resolve_parents: bool = False,
+        **kwargs,
+    ) -> Iterator[Dict]:
+        self._call("list_replicas")
+        rses = self.rses
+        if rse_expression:
+            rses = [rse for rse in rses if rse in rse_expression.split("|")]
+        # Check all the DIDs before returning replicas, as the server does.
+        resolved = []
+        for did in dids:
+            if "/" in did["name"]:
+                resolved.append((did, None))
+            else:
+                resolved.append((did, self._datasets(did["scope"], did["name"])))
+        for did, datasets in resolved:
+            scope = did["scope"]
+            if datasets is None:
+                files = [(did["name"], None)]
+            else:
+                files = (
+                    (name, dataset)
+                    for dataset in datasets
+                    for name in self._file_names(dataset)
+                )
+            for name, dataset in files:
+                replicas = {
+                    rse: [f"davs://{rse.lower()}.example.org/{scope}/{name}"]
+                    for rse in rses
+                    if self._has_replica(name, rse)
+                }
+                if replicas:
+                    replica = {"scope": scope, "name": name, "rses": replicas}
+                    if resolve_parents:
+                        replica["parents"] = self._parents(dataset) if dataset else []
+                    yield replica
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("RunJournal")
+
+
+def key_hash(key: str) -> int:
+    """Return a 64-bit hash of a key, stable across runs."""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class RunJournal:
+    """
+    Append-only journal of the work completed by a run, used to resume it.
+
+    Each line records either a DID whose events were all sent
+    (``did<TAB>scope:name``) or, when ``track_files`` is set, a file event
+    whose delivery was confirmed by Kafka
+    (``file<TAB>dataset scope:name<TAB>file scope:name@rse``). Files
+    recorded without RSE, by earlier versions, are done for every RSE.
+
+    Completed DIDs and files are kept in memory as 64-bit hashes, so that
+    a lookup is O(1) and journals with millions of entries stay small.
+
+    A DID is flushed to disk as soon as it is recorded; files are flushed
+    every ``flush_records`` records or ``flush_interval`` seconds, so that
+    a crash loses few of them without a write to disk per delivery.
+
+    Args:
+        path (str): The journal file.
+        resume (bool, optional): Load the entries already in the journal, so
+            that the work they record is skipped.
+        track_files (bool, optional): Also record the delivered file events.
+        flush_records (int, optional): Number of file records written
+            between two flushes.
+        flush_interval (float, optional): Longest time, in seconds, a file
+            record waits before being flushed, checked at each record.
+    """
+
+    DID = "did"
+    FILE = "file"
+    DEFAULT_FLUSH_RECORDS = 1000
+    DEFAULT_FLUSH_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        path: str,
+        resume: bool = False,
+        track_files: bool = False,
+        flush_records: int = DEFAULT_FLUSH_RECORDS,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.track_files = track_files
+        self.flush_records = max(1, flush_records)
+        self.flush_interval = flush_interval
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._dids = set()
+        self._files = set()
+        self._delivered = Counter()
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            self._load()
+        self._file = open(path, "a")
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            # Terminate a line left incomplete by a crash.
+            self._file.write("\n")
+
+    def _ends_with_newline(self) -> bool:
+        """Return True if the journal file ends with a complete line."""
+        with open(self.path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+    def _load(self):
+        """Load the completed DIDs and files recorded in the journal."""
+        with open(self.path, "r") as file:
+            for line in file:
+                fields = line.rstrip("\n").split("\t")
+                if fields[0] == self.DID and len(fields) == 2:
+                    self._dids.add(key_hash(fields[1]))
+                elif fields[0] == self.FILE and len(fields) == 3:
+                    self._files.add(key_hash(fields[2]))
+        logger.info(
+            f"Resuming from {self.path}: {len(self._dids)} DIDs and "
+            f"{len(self._files)} file events already sent"
+        )
+
+    def is_done(self, did: str) -> bool:
+        """Return True if all the events of the DID were already sent."""
+        return key_hash(did) in self._dids
+
+    def is_file_done(self, file_did: str) -> bool:
+        """Return True if the event of the file, ``scope:name@rse``, was
+        already delivered.
+        """
+        if key_hash(file_did) in self._files:
+            return True
+        did, separator, _ = file_did.rpartition("@")
+        return bool(separator) and key_hash(did) in self._files
+
+    def delivered(self, did: str) -> int:
+        """Return the number of file events of the DID delivered in this
+        run.
+        """
+        with self._lock:
+            return self._delivered[did]
+
+    def record_did(self, did: str):
+        """Record a DID whose events were all sent."""
+        with self._lock:
+            self._dids.add(key_hash(did))
+            self._file.write(f"{self.DID}\t{did}\n")
+            self._flush()
+
+    def record_file(self, did: str, file_did: str):
+        """Record the confirmed delivery of the event of a file of a DID."""
+        with self._lock:
+            self._files.add(key_hash(file_did))
+            self._delivered[did] += 1
+            self._file.write(f"{self.FILE}\t{did}\t{file_did}\n")
+            self._pending += 1
+            if (
+                self._pending >= self.flush_records
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush()
+
+    def _flush(self):
+        """Flush the records written, with the lock held."""
+        self._file.flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flush and close the journal."""
+        with self._lock:
+            self._file.close()
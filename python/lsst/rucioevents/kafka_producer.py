@@ -1,57 +1,327 @@
 import logging
-import uuid
-import json
-from typing import Dict
+import time
+from functools import partial
+from typing import Dict, Iterable, Optional
 from confluent_kafka import Producer
 from lsst.rucioevents.config import KafkaConfig
+from lsst.rucioevents.dedup import DedupIndex
+from lsst.rucioevents.journal import RunJournal
+from lsst.rucioevents.logs import ProgressLog
+from lsst.rucioevents.metrics import DELIVERIES, DELIVERY_SECONDS
+from lsst.rucioevents.keys import (
+    KEY_STRATEGIES,
+    PARTITIONERS,
+    event_partition,
+    message_key,
+    random_key,
+)
+from lsst.rucioevents.serialization import EventEncoder
+from lsst.rucioevents.sinks import EventSink, journal_dids
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("RucioKafkaProducer")
 
 
-class RucioKafkaProducer:
-    def __init__(self, topic: str):
+class RucioKafkaProducer(EventSink):
+    DEFAULT_FLUSH_TIMEOUT = 30.0
+    DEFAULT_QUEUE_FULL_TIMEOUT = 300.0
+    QUEUE_FULL_POLL_INTERVAL = 0.1
+    METADATA_TIMEOUT = 10.0
+
+    def __init__(
+        self,
+        topic: str,
+        flush_timeout: float = DEFAULT_FLUSH_TIMEOUT,
+        flush_each: bool = False,
+        queue_full_timeout: float = DEFAULT_QUEUE_FULL_TIMEOUT,
+        journal: Optional[RunJournal] = None,
+        producer: Optional[Producer] = None,
+        encoder: Optional[EventEncoder] = None,
+        key_strategy: str = "did",
+        partitioner: str = "default",
+        partitions: Optional[int] = None,
+        config: Optional[KafkaConfig] = None,
+        topics: Optional[Dict[str, str]] = None,
+        dedup: Optional[DedupIndex] = None,
+    ):
         """
         Initializes a Kafka producer to send fakes Rucio events.
 
         :param topic: The name of the Kafka topic.
+        :param flush_timeout: Maximum time in seconds to wait for the
+            outstanding messages when flushing.
+        :param flush_each: Wait for the delivery of every message before
+            producing the next one, to keep a strict ordering or to debug.
+        :param queue_full_timeout: Maximum time in seconds to wait for room
+            in the local producer queue before giving up on a message.
+        :param journal: Journal recording the delivered file events, when it
+            tracks files.
+        :param producer: A pre-configured Kafka producer. If not provided, a
+            new Producer will be created.
+        :param encoder: Serializer of the events, by default equivalent to
+            ``json.dumps``.
+        :param key_strategy: Key of the events without one: ``did`` derives
+            it from the file DID and the RSE, ``random`` draws a UUID. Events
+            without a file DID get a random key.
+        :param partitioner: ``default`` leaves the partition to the producer,
+            which hashes the key, ``dataset`` sends all the events of a
+            dataset to the same partition, to preserve their order, and
+            ``file`` spreads the events by file DID.
+        :param partitions: Number of partitions of the topics, read from
+            the broker metadata of each topic if not provided. The events of
+            a topic without partition metadata are left to the default
+            partitioner.
+        :param config: Configuration of the Producer created when
+            ``producer`` is not provided, the default KafkaConfig otherwise.
+        :param topics: Topic of the events of each destination RSE, the
+            events of the other RSEs being sent to ``topic``.
+        :param dedup: Index of the emitted file events, whose keys are
+            confirmed, or released, by the delivery reports.
         """
-        config = KafkaConfig()
-        self.producer = Producer(config.complete_config())
+        super().__init__(journal=journal, encoder=encoder, dedup=dedup)
+        if key_strategy not in KEY_STRATEGIES:
+            raise ValueError(f"Unknown key strategy {key_strategy}")
+        if partitioner not in PARTITIONERS:
+            raise ValueError(f"Unknown partitioner {partitioner}")
+        if producer is None:
+            config = config or KafkaConfig()
+            producer = Producer(config.complete_config())
+        self.producer = producer
         self.topic = topic
+        self.topics = topics or {}
+        self.flush_timeout = flush_timeout
+        self.flush_each = flush_each
+        self.queue_full_timeout = queue_full_timeout
+        self.key_strategy = key_strategy
+        self.partitioner = partitioner
+        self.partitions = partitions
+        # Partitions of the per-RSE topics, the same for all when given.
+        self._given_partitions = partitions
+        self._partitions = {}
+        self.blocked_count = 0
+        self.blocked_time = 0.0
+        self._progress = ProgressLog(logger, "messages delivered")
+        self._delivered_metric = DELIVERIES.labels("delivered")
+        self._failed_metric = DELIVERIES.labels("failed")
 
-    def send_event(self, events: Dict) -> None:
+    def delivery_report(self, errmsg, msg):
         """
-        Sends an event to Kafka.
+        Reports the Failure or Success of a message delivery.
 
-        :param event: Dictionary containing the event data.
+        Failures are logged one by one, successes rolled up into periodic
+        progress summaries; the successful messages are logged at the DEBUG
+        level, and at the INFO level for the sampled ones.
+        Args:
+            errmsg  (KafkaError): The Error that occurred.
+            msg    (Actual message): The message that was produced.
         """
 
-        def delivery_report(errmsg, msg):
-            """
-            Reports the Failure or Success of a message delivery.
-            Args:
-                errmsg  (KafkaError): The Error that occurred.
-                msg    (Actual message): The message that was produced.
-            """
-
-            if errmsg is not None:
-                logger.error(
-                    "Delivery failed for Message: {} : {}".format(msg.key(), errmsg)
-                )
-                return
-            logger.info(
+        if errmsg is not None:
+            with self._lock:
+                self.failed += 1
+            self._failed_metric.inc()
+            logger.error(
+                "Delivery failed for Message: {} : {}".format(msg.key(), errmsg)
+            )
+            return
+        size = len(msg.value() or b"")
+        with self._lock:
+            self.delivered += 1
+            self.bytes += size
+        self._delivered_metric.inc()
+        self._bytes_sent.inc(size)
+        sampled = self._progress.add()
+        if sampled or logger.isEnabledFor(logging.DEBUG):
+            logger.log(
+                logging.INFO if sampled else logging.DEBUG,
                 "Message: {} successfully produced to Topic: {} Partition: [{}] at offset {}".format(
                     msg.key(), msg.topic(), msg.partition(), msg.offset()
-                )
+                ),
             )
 
+    def journal_report(self, did: str, file_did: str, errmsg, msg):
+        """
+        Reports a message delivery and records it in the journal.
+        Args:
+            did (str): The DID the file event belongs to.
+            file_did (str): The file the event is about.
+            errmsg  (KafkaError): The Error that occurred.
+            msg    (Actual message): The message that was produced.
+        """
+        self.delivery_report(errmsg, msg)
+        if errmsg is None:
+            self.journal.record_file(did, file_did)
+
+    def _callback(self, event: Dict):
+        """Returns the delivery callback of an event, produced now."""
+        dids = None
+        if self.journal is not None and self.journal.track_files:
+            dids = journal_dids(event)
+        key = None if self.dedup is None else self.dedup.key(event)
+        return partial(self._on_delivery, time.perf_counter(), dids, key)
+
+    def _on_delivery(
+        self, produced_at: float, dids: Optional[tuple], key: Optional[str], errmsg, msg
+    ):
+        """Records the delivery latency of a message, then reports its
+        delivery, in the journal when ``dids`` are given and in the
+        deduplication index when its ``key`` is.
+        """
+        DELIVERY_SECONDS.observe(time.perf_counter() - produced_at)
+        if dids is None:
+            self.delivery_report(errmsg, msg)
+        else:
+            self.journal_report(*dids, errmsg, msg)
+        if key is not None:
+            if errmsg is None:
+                self.dedup.confirm(key)
+            else:
+                self.dedup.release(key)
+
+    def send_event(self, events: Iterable[Dict], flush: bool = True) -> int:
+        """
+        Sends a batch of events to Kafka.
+
+        Delivery callbacks are served while producing, and the producer is
+        flushed once at the end of the batch, unless ``flush_each`` is set.
+
+        :param events: Dictionaries containing the event data. They can be
+            generated lazily, as they are consumed one at a time.
+        :param flush: Wait for the delivery of the batch before returning.
+            Set to False to flush once at the end of the run instead.
+        :return: The number of events produced.
+        """
+        produced = 0
+        encode = self.encoder.encode
+        start = time.perf_counter()
         for event in events:
-            default_key = str(uuid.uuid4()).encode("utf-8")
-            self.producer.produce(
-                topic=self.topic,
-                key=event.get("key", default_key),
-                value=json.dumps(event),
-                callback=delivery_report,
+            produced += 1
+            topic = self._topic(event)
+            options = {}
+            if self.partitioner != "default":
+                partitions = self._partition_count(topic)
+                # Without partition metadata the producer picks the partition.
+                if partitions:
+                    options["partition"] = event_partition(
+                        event, self.partitioner, partitions
+                    )
+            self._produce(
+                topic=topic,
+                key=event.get("key") or self._key(event),
+                value=encode(event),
+                callback=self._callback(event),
+                **options,
             )
-            self.producer.flush()
+            if self.flush_each:
+                self.producer.flush(self.flush_timeout)
+            else:
+                self.producer.poll(0)
+        self._produce_seconds.observe(time.perf_counter() - start)
+        self._events_sent.inc(produced)
+        if flush and not self.flush_each:
+            self.flush()
+        return produced
+
+    def _key(self, event: Dict) -> bytes:
+        """Returns the key of an event without one."""
+        if self.key_strategy == "did":
+            return message_key(event) or random_key()
+        return random_key()
+
+    def _topic(self, event: Dict) -> str:
+        """Returns the topic of an event, from its destination RSE."""
+        if not self.topics:
+            return self.topic
+        rse = event.get("payload", {}).get("dst-rse")
+        return self.topics.get(rse, self.topic)
+
+    def _partition_count(self, topic: Optional[str] = None) -> int:
+        """Returns the number of partitions of a topic, by default the
+        topic of the producer.
+        """
+        topic = topic or self.topic
+        if topic == self.topic:
+            if self.partitions is None:
+                self.partitions = self._read_partition_count(topic)
+            return self.partitions
+        if topic not in self._partitions:
+            self._partitions[topic] = (
+                self._given_partitions or self._read_partition_count(topic)
+            )
+        return self._partitions[topic]
+
+    def _read_partition_count(self, topic: str) -> int:
+        """Reads the number of partitions of a topic from the broker, 0 when
+        the topic does not exist yet or its metadata has an error.
+        """
+        metadata = self.producer.list_topics(topic, timeout=self.METADATA_TIMEOUT)
+        topic_metadata = metadata.topics.get(topic)
+        if topic_metadata is None or topic_metadata.error is not None:
+            error = None if topic_metadata is None else topic_metadata.error
+            logger.warning(
+                f"No partition metadata for topic {topic} ({error}), the "
+                f"{self.partitioner} partitioner is not applied to it"
+            )
+            return 0
+        count = len(topic_metadata.partitions)
+        if count == 0:
+            logger.warning(
+                f"Topic {topic} has no partitions, the {self.partitioner} "
+                "partitioner is not applied to it"
+            )
+        return count
+
+    def _produce(self, **kwargs) -> None:
+        """
+        Produces a message, waiting for room when the local queue is full.
+
+        When librdkafka's queue is full ``produce`` raises ``BufferError``:
+        the queue is drained with bounded ``poll()`` calls and the message is
+        retried, for at most ``queue_full_timeout`` seconds.
+        """
+        blocked_since = None
+        while True:
+            try:
+                self.producer.produce(**kwargs)
+                break
+            except BufferError:
+                now = time.monotonic()
+                if blocked_since is None:
+                    blocked_since = now
+                    with self._lock:
+                        self.blocked_count += 1
+                    logger.debug("Local producer queue full, waiting for deliveries")
+                elif now - blocked_since > self.queue_full_timeout:
+                    with self._lock:
+                        self.blocked_time += now - blocked_since
+                    raise
+                self.producer.poll(self.QUEUE_FULL_POLL_INTERVAL)
+        if blocked_since is not None:
+            with self._lock:
+                self.blocked_time += time.monotonic() - blocked_since
+
+    def flush(self) -> int:
+        """
+        Waits for the delivery of all the outstanding messages.
+
+        :return: The number of messages still waiting for delivery after
+            ``flush_timeout`` seconds.
+        """
+        remaining = self.producer.flush(self.flush_timeout)
+        if remaining:
+            logger.warning(
+                f"{remaining} messages not delivered after {self.flush_timeout}s"
+            )
+        return remaining
+
+    def queue_depth(self) -> int:
+        """Returns the number of messages waiting for delivery."""
+        return len(self.producer)
+
+    def summary(self) -> str:
+        """Returns a summary of the delivered and failed messages."""
+        return (
+            f"{self.delivered} messages delivered, {self.failed} failed, "
+            f"production blocked {self.blocked_count} times "
+            f"for {self.blocked_time:.2f}s on a full queue"
+        )
@@ -0,0 +1,62 @@
+import hashlib
+import uuid
+from typing import Mapping, Optional
+from lsst.rucioevents.journal import key_hash
+from lsst.rucioevents.sinks import event_dids
+
+KEY_STRATEGIES = ("did", "random")
+PARTITIONERS = ("default", "dataset", "file")
+
+
+def random_key() -> bytes:
+    """Return a random message key."""
+    return str(uuid.uuid4()).encode("utf-8")
+
+
+def file_identity(payload: Mapping) -> Optional[str]:
+    """Return ``scope:name@rse``, identifying the event of a file on an RSE,
+    or None if the payload has no file DID.
+    """
+    scope = payload.get("scope")
+    name = payload.get("name")
+    if not scope or not name:
+        return None
+    return f"{scope}:{name}@{payload.get('dst-rse') or ''}"
+
+
+def message_key(event: Mapping) -> Optional[bytes]:
+    """
+    Return the message key of the event of a file, derived from the file
+    DID and the destination RSE, so that the events of a file sent again
+    get the same key and can be compacted or deduplicated downstream.
+
+    :param event: The event, with a payload holding the file DID.
+    :return: The hexadecimal 128-bit BLAKE2b digest of ``scope:name@rse``,
+        or None if the payload has no file DID.
+    """
+    identity = file_identity(event.get("payload") or {})
+    if identity is None:
+        return None
+    digest = hashlib.blake2b(identity.encode("utf-8"), digest_size=16)
+    return digest.hexdigest().encode("ascii")
+
+
+def event_partition(event: Mapping, partitioner: str, partitions: int) -> int:
+    """
+    Return the partition of an event, stable across runs.
+
+    :param event: The event, with a payload holding the file and dataset
+        DIDs.
+    :param partitioner: ``dataset`` sends all the events of a dataset to the
+        same partition, preserving their order, ``file`` spreads the events
+        by file DID.
+    :param partitions: Number of partitions of the topic.
+    """
+    dataset_did, file_did = event_dids(event)
+    if partitioner == "dataset":
+        return key_hash(dataset_did) % partitions
+    if partitioner == "file":
+        return key_hash(file_did) % partitions
+    raise ValueError(
+        f"Unknown partitioner {partitioner}, expected one of {', '.join(PARTITIONERS)}"
+    )
@@ -0,0 +1,192 @@
+import contextlib
+import copy
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator, Optional
+
+# Loggers of the per-file and per-message details, shown with --verbose.
+ITEM_LOGGERS = ("RucioProcessor", "RucioKafkaProducer", "RucioDummyEventGenerator")
+
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+# Settings of the progress logs created without explicit ones.
+_progress_settings = {"interval": DEFAULT_PROGRESS_INTERVAL, "sample": 0}
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler leaving the formatting of the records to the listener.
+
+    ``QueueHandler`` formats each record, timestamp included, in the thread
+    that logs it; only the message arguments are merged here, so that the
+    record can be read later, and the exception rendered to text.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def start_queue_logging() -> QueueListener:
+    """
+    Move the handlers of the root logger to a background thread: the
+    records are put in a queue, then formatted and written by a
+    ``QueueListener``, off the threads producing the events.
+
+    :return: The listener, to be given to ``stop_queue_logging``.
+    """
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    listener.start()
+    return listener
+
+
+def stop_queue_logging(listener: QueueListener):
+    """Write the queued records and give the handlers back to the root
+    logger.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, DeferredQueueHandler):
+            root.removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        root.addHandler(handler)
+
+
+@contextlib.contextmanager
+def queued_logging(enabled: bool = True) -> Iterator[None]:
+    """Log through a background thread while the context lasts."""
+    if not enabled:
+        yield
+        return
+    listener = start_queue_logging()
+    try:
+        yield
+    finally:
+        stop_queue_logging(listener)
+
+
+def configure_logging(
+    verbose: bool = False,
+    progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+    sample: int = 0,
+):
+    """
+    Select the logs of the run.
+
+    :param verbose: Log every file and message, at the DEBUG level.
+    :param progress_interval: Time between two progress summaries, in
+        seconds.
+    :param sample: Log the details of one item in ``sample`` at the INFO
+        level, none if 0.
+    """
+    level = logging.DEBUG if verbose else logging.INFO
+    for name in ITEM_LOGGERS:
+        logging.getLogger(name).setLevel(level)
+    _progress_settings["interval"] = progress_interval
+    _progress_settings["sample"] = max(0, sample)
+
+
+class ProgressLog:
+    """
+    Rolls items up into periodic progress summaries: the total so far, the
+    rate and, when the number of items is known, the estimated time left.
+
+    ``add`` is cheap enough to be called for every item. It returns True
+    for one item in ``sample``, whose details can then be logged; the
+    details of the other items are only worth logging at the DEBUG level.
+    The interval and the sampling default to those of
+    ``configure_logging``.
+
+    Args:
+        logger (Logger): The logger of the summaries.
+        unit (str): Name of the items, such as ``DIDs``.
+        total (int, optional): Number of items expected.
+        interval (float, optional): Time between two summaries, in seconds.
+        sample (int, optional): Sample one item in ``sample``, none if 0.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        unit: str,
+        total: Optional[int] = None,
+        interval: Optional[float] = None,
+        sample: Optional[int] = None,
+    ):
+        self.logger = logger
+        self.unit = unit
+        self.total = total
+        if interval is None:
+            interval = _progress_settings["interval"]
+        if sample is None:
+            sample = _progress_settings["sample"]
+        self.interval = interval
+        self.sample = sample
+        self.count = 0
+        self.start = time.monotonic()
+        self._next_report = self.start + interval
+        self._lock = threading.Lock()
+
+    def add(self, count: int = 1) -> bool:
+        """Count items, logging a summary when one is due, and return True
+        if the details of the item are sampled.
+        """
+        with self._lock:
+            previous = self.count
+            self.count += count
+            sampled = bool(self.sample) and previous // self.sample != (
+                self.count // self.sample
+            )
+            now = time.monotonic()
+            due = now >= self._next_report
+            if due:
+                self._next_report = now + self.interval
+        if due:
+            self.logger.info(self.summary(now))
+        return sampled
+
+    def summary(self, now: Optional[float] = None) -> str:
+        """Return the progress so far."""
+        elapsed = (now or time.monotonic()) - self.start
+        count = self.count
+        rate = count / elapsed if elapsed > 0 else 0.0
+        if not self.total:
+            return f"Progress: {count} {self.unit}, {rate:.1f} {self.unit}/s"
+        percent = 100.0 * count / self.total
+        eta = ""
+        if rate > 0 and count < self.total:
+            eta = f", ETA {format_duration((self.total - count) / rate)}"
+        return (
+            f"Progress: {count}/{self.total} {self.unit} ({percent:.1f}%), "
+            f"{rate:.1f} {self.unit}/s{eta}"
+        )
+
+    def close(self):
+        """Log the final summary."""
+        self.logger.info(self.summary())
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration as hours, minutes and seconds."""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
@@ -0,0 +1,491 @@
+import bisect
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("RucioEventsMetrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    labels = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + labels + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    """
+    Family of samples of a metric, one per combination of label values.
+
+    Args:
+        name (str): Name of the metric.
+        documentation (str): Help text of the metric.
+        labels (sequence of str, optional): Names of the labels.
+    """
+
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.label_names:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+    def labels(self, *values: str):
+        """Return the sample of the given label values."""
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self) -> Iterator[Tuple[str, str, float]]:
+        """Yield the name suffix, the labels and the value of each sample."""
+        raise NotImplementedError()
+
+    def render(self) -> List[str]:
+        """Return the lines of the metric in the Prometheus text format."""
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+    def reset(self):
+        """Zero the samples recorded so far, keeping the samples already
+        handed out by ``labels``.
+        """
+        with self._lock:
+            children = list(self._children.values())
+        for child in children:
+            child.reset()
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def reset(self):
+        with self._lock:
+            self.value = 0.0
+
+
+class CounterMetric(Metric):
+    """Monotonic counter, such as a number of calls or of bytes."""
+
+    TYPE = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        """Increment the counter without labels."""
+        self._children[()].inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "_total", _format_labels(self.label_names, values), child.value
+
+
+class _GaugeValue:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """Read the value from ``function`` when the metric is collected."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+    def reset(self):
+        self.value = 0.0
+        self.function = None
+
+
+class GaugeMetric(Metric):
+    """Value that goes up and down, such as the depth of a queue."""
+
+    TYPE = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value: float):
+        """Set the gauge without labels."""
+        self._children[()].set(value)
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """Read the gauge without labels from ``function``."""
+        self._children[()].set_function(function)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            try:
+                value = child.get()
+            except Exception as e:
+                logger.warning(f"Error reading metric {self.name}: {e}")
+                continue
+            yield "", _format_labels(self.label_names, values), value
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """Return a context manager observing the time spent in it."""
+        return _Timer(self)
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * len(self.counts)
+            self.sum = 0.0
+
+
+class _Timer:
+    def __init__(self, histogram: _HistogramValue):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class HistogramMetric(Metric):
+    """
+    Distribution of durations, in cumulative buckets.
+
+    Args:
+        buckets (sequence of float, optional): Upper bounds of the buckets,
+            in seconds.
+    """
+
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        """Record a value of the histogram without labels."""
+        self._children[()].observe(value)
+
+    def time(self) -> _Timer:
+        """Time a block of code, for the histogram without labels."""
+        return self._children[()].time()
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """Return the number and the sum of the values of each sample."""
+        totals = {}
+        for values, child in list(self._children.items()):
+            with child._lock:
+                totals[values] = (sum(child.counts), child.sum)
+        return totals
+
+    def _samples(self):
+        names = self.label_names + ("le",)
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bound = "+Inf" if bound == math.inf else repr(bound)
+                labels = _format_labels(names, values + (bound,))
+                yield "_bucket", labels, cumulative
+            labels = _format_labels(self.label_names, values)
+            yield "_sum", labels, total
+            yield "_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """
+    Collection of the metrics of a run, rendered in the Prometheus text
+    exposition format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> CounterMetric:
+        """Register a counter."""
+        return self._register(CounterMetric(name, documentation, labels))
+
+    def gauge(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> GaugeMetric:
+        """Register a gauge."""
+        return self._register(GaugeMetric(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> HistogramMetric:
+        """Register a histogram."""
+        return self._register(HistogramMetric(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """Return all the metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = [line for metric in metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """
+        Write the metrics for the textfile collector of the node exporter,
+        atomically, so that the collector never reads a partial file.
+
+        :param path: The output file, ending with ``.prom``.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+                file.write(self.render())
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        logger.info(f"Metrics written to {path}")
+
+    def reset(self):
+        """Zero the samples of all the metrics."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+RUCIO_CALL_SECONDS = REGISTRY.histogram(
+    "rucioevents_rucio_call_seconds",
+    "Duration of the Rucio calls, including the reading of their results.",
+    labels=("method",),
+)
+RUCIO_CALL_ERRORS = REGISTRY.counter(
+    "rucioevents_rucio_call_errors",
+    "Number of the Rucio calls that failed.",
+    labels=("method",),
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "rucioevents_stage_seconds",
+    "Time spent by a DID in each processing stage.",
+    labels=("stage",),
+)
+EVENT_BUILD_SECONDS = REGISTRY.histogram(
+    "rucioevents_event_build_seconds",
+    "Time taken to build the events of a DID.",
+)
+EVENTS_BUILT = REGISTRY.counter(
+    "rucioevents_events_built",
+    "Number of events built.",
+)
+PRODUCE_SECONDS = REGISTRY.histogram(
+    "rucioevents_produce_seconds",
+    "Time taken to hand a batch of events to the sink.",
+    labels=("sink",),
+)
+EVENTS_SENT = REGISTRY.counter(
+    "rucioevents_events_sent",
+    "Number of events handed to the sink.",
+    labels=("sink",),
+)
+DELIVERY_SECONDS = REGISTRY.histogram(
+    "rucioevents_delivery_latency_seconds",
+    "Time from the production of a Kafka message to its delivery report.",
+)
+DELIVERIES = REGISTRY.counter(
+    "rucioevents_deliveries",
+    "Number of Kafka delivery reports, by outcome.",
+    labels=("outcome",),
+)
+BYTES_SENT = REGISTRY.counter(
+    "rucioevents_bytes_sent",
+    "Number of bytes of the events written, or delivered by Kafka.",
+    labels=("sink",),
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "rucioevents_queue_depth",
+    "Number of items waiting in a queue: the sink or a pipeline stage.",
+    labels=("queue",),
+)
+
+
+def _timed_iterator(method: str, iterator: Iterator, elapsed: float) -> Iterator:
+    """Yield the results of a lazy Rucio call, observing the time spent in
+    the call and in reading its results when they are exhausted.
+    """
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                break
+            elapsed += time.perf_counter() - start
+            yield item
+    except Exception:
+        RUCIO_CALL_ERRORS.labels(method).inc()
+        raise
+    finally:
+        RUCIO_CALL_SECONDS.labels(method).observe(elapsed)
+
+
+def timed_call(method: str, function: Callable, *args, **kwargs):
+    """
+    Invoke a Rucio client method, recording its duration and failures.
+
+    The Rucio methods listing DIDs or replicas return generators, which
+    query the server as they are read: their results are then wrapped, so
+    that the time spent reading them is included.
+    """
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    except Exception:
+        RUCIO_CALL_ERRORS.labels(method).inc()
+        RUCIO_CALL_SECONDS.labels(method).observe(time.perf_counter() - start)
+        raise
+    elapsed = time.perf_counter() - start
+    if isinstance(result, Iterator):
+        return _timed_iterator(method, result, elapsed)
+    RUCIO_CALL_SECONDS.labels(method).observe(elapsed)
+    return result
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_http_server(
+    port: int, address: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY
+) -> ThreadingHTTPServer:
+    """
+    Serve the metrics on ``http://address:port/metrics`` from a daemon
+    thread, until ``shutdown`` is called on the returned server.
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((address, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, name="MetricsServer", daemon=True
+    )
+    thread.start()
+    logger.info(f"Serving the metrics on http://{address}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,245 @@
+import contextlib
+import cProfile
+import heapq
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional, Tuple
+from lsst.rucioevents.metrics import RUCIO_CALL_SECONDS, STAGE_SECONDS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("RucioEventsProfiler")
+
+DEFAULT_TOP = 25
+
+# Entry points of each component of a run, by module file and function:
+# their cumulative time is the time spent in the component.
+COMPONENTS = (
+    ("rucio", "metrics.py", ("timed_call", "_timed_iterator")),
+    ("events", "event_creator.py", ("_create_file_event",)),
+    ("serialization", "serialization.py", ("encode",)),
+    ("kafka", "kafka_producer.py", ("_produce", "flush")),
+)
+
+# Before Python 3.12 a profiler only sees the thread enabling it; since,
+# it runs on sys.monitoring, which sees every thread but takes a single
+# profiler at a time.
+PROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+# The profiler of the run in progress, if any.
+_active = None
+
+
+class RunProfiler:
+    """
+    Profiles a whole run with ``cProfile``, then writes a report.
+
+    Before Python 3.12 ``cProfile`` only follows the thread enabling it: a
+    profiler is then started in each thread created while the context
+    lasts, such as the workers, the pipeline stages and the container
+    walkers, and the profiles are merged when the run ends. Later versions
+    profile every thread with a single profiler.
+
+    The report gives the time spent in Rucio, in building the events, in
+    serializing them and in Kafka, then the stage timings recorded by the
+    metrics, the memory peaks of the DIDs when ``trace_memory`` is set, and
+    the functions taking the most time. The raw profile is written next to
+    it, with the ``.pstats`` suffix, to be read with ``pstats`` or
+    ``snakeviz``.
+
+    Args:
+        path (str): Path of the report.
+        top (int, optional): Number of functions, and of DIDs, listed.
+        trace_memory (bool, optional): Record the memory peak of each DID
+            with ``tracemalloc``.
+    """
+
+    def __init__(self, path: str, top: int = DEFAULT_TOP, trace_memory: bool = False):
+        self.path = path
+        self.top = max(1, top)
+        self.trace_memory = trace_memory
+        self.profiler = cProfile.Profile()
+        self.thread_profilers = []
+        self.memory_peaks = []
+        self.stats = None
+        self._lock = threading.Lock()
+        self._start = None
+        self._cpu_start = None
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.threads = 0
+
+    def _start_thread(self, frame, event, arg):
+        """Profile a new thread, from its first call on: enabling the
+        profiler replaces this hook in the thread.
+        """
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiler is active: the thread runs unprofiled.
+            logger.debug(f"Thread not profiled: {e}")
+            return
+        with self._lock:
+            self.thread_profilers.append(profiler)
+
+    def __enter__(self) -> "RunProfiler":
+        global _active
+        if self.trace_memory:
+            tracemalloc.start()
+        if PROFILE_PER_THREAD:
+            threading.setprofile(self._start_thread)
+        self._start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        _active = self
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _active
+        self.profiler.disable()
+        if PROFILE_PER_THREAD:
+            threading.setprofile(None)
+        _active = None
+        self.wall_time = time.perf_counter() - self._start
+        self.cpu_time = time.process_time() - self._cpu_start
+        if self.trace_memory:
+            tracemalloc.stop()
+        self.stats = self._merge()
+        self.stats.dump_stats(f"{self.path}.pstats")
+        with open(self.path, "w") as file:
+            file.write(self.report())
+        for line in self.summary():
+            logger.info(line)
+        logger.info(f"Profile written to {self.path}")
+        return False
+
+    def _merge(self) -> pstats.Stats:
+        """Merge the profiles of the threads into the one of the run."""
+        stats = pstats.Stats(self.profiler)
+        self.threads = 1 + len(self.thread_profilers)
+        for profiler in self.thread_profilers:
+            try:
+                stats.add(profiler)
+            except TypeError:
+                # No function was profiled in the thread.
+                pass
+        return stats
+
+    def record_memory(self, did: str, peak: int):
+        """Keep the memory peak of a DID if it is among the largest."""
+        with self._lock:
+            if len(self.memory_peaks) < self.top:
+                heapq.heappush(self.memory_peaks, (peak, did))
+            else:
+                heapq.heappushpop(self.memory_peaks, (peak, did))
+
+    def components(self) -> Dict[str, float]:
+        """Return the time spent in each component, summed over the
+        threads.
+        """
+        times = dict.fromkeys((name for name, _, _ in COMPONENTS), 0.0)
+        for (filename, _, function), entry in self.stats.stats.items():
+            for name, module, functions in COMPONENTS:
+                if function in functions and os.path.basename(filename) == module:
+                    # Cumulative time of the entry point.
+                    times[name] += entry[3]
+        return times
+
+    def _top_functions(self, sort: str) -> str:
+        output = io.StringIO()
+        self.stats.stream = output
+        self.stats.sort_stats(sort).print_stats(self.top)
+        self.stats.stream = None
+        # Skip the header of pstats, which repeats the totals.
+        lines = output.getvalue().splitlines()
+        start = next(
+            (i for i, line in enumerate(lines) if line.lstrip().startswith("ncalls")),
+            0,
+        )
+        return "\n".join(lines[start:])
+
+    def summary(self) -> List[str]:
+        """Return the short summary of the run: where the time went and the
+        functions taking the most time of their own.
+        """
+        times = self.components()
+        lines = [
+            f"Profiled {self.wall_time:.2f}s of wall time, {self.cpu_time:.2f}s of "
+            f"CPU time, {self.threads if PROFILE_PER_THREAD else 'all'} threads",
+            "Time by component: "
+            + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in times.items()),
+        ]
+        entries = sorted(
+            self.stats.stats.items(), key=lambda item: item[1][2], reverse=True
+        )
+        for (filename, line, function), entry in entries[:5]:
+            lines.append(
+                f"  {entry[2]:.3f}s in {function} "
+                f"({os.path.basename(filename)}:{line}), {entry[1]} calls"
+            )
+        return lines
+
+    def report(self) -> str:
+        """Return the report of the run."""
+        sections = ["\n".join(self.summary())]
+        sections.append(
+            "Stage timings (count, total):\n" + _format_totals(STAGE_SECONDS.totals())
+        )
+        sections.append(
+            "Rucio calls (count, total):\n"
+            + _format_totals(RUCIO_CALL_SECONDS.totals())
+        )
+        if self.trace_memory:
+            peaks = sorted(self.memory_peaks, reverse=True)
+            sections.append(
+                "Memory peaks by DID:\n"
+                + "\n".join(f"  {peak / 2**20:10.2f} MiB  {did}" for peak, did in peaks)
+            )
+        sections.append(
+            "Top functions by cumulative time:\n" + self._top_functions("cumulative")
+        )
+        sections.append(
+            "Top functions by internal time:\n" + self._top_functions("tottime")
+        )
+        return "\n\n".join(sections) + "\n"
+
+
+def _format_totals(totals: Dict[Tuple[str, ...], Tuple[int, float]]) -> str:
+    rows = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+    if not rows:
+        return "  none"
+    return "\n".join(
+        f"  {','.join(labels):20} {count:8d} {seconds:10.3f}s"
+        for labels, (count, seconds) in rows
+    )
+
+
+@contextlib.contextmanager
+def track_memory(did: str) -> Iterator[None]:
+    """
+    Record the memory peak of a DID in the profile of the run, when one
+    is taken with ``trace_memory``.
+
+    The peak is the one of the whole process: it is the peak of the DID
+    alone only when the DIDs are processed by a single worker.
+    """
+    profiler: Optional[RunProfiler] = _active
+    if profiler is None or not profiler.trace_memory or not tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        if tracemalloc.is_tracing():
+            profiler.record_memory(did, tracemalloc.get_traced_memory()[1])
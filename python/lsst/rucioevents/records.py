@@ -0,0 +1,126 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator
+
+EVENT_TYPE = "transfer-done"
+
+
+class Record(Mapping):
+    """
+    Compact record with the read-only API of a dictionary.
+
+    The values are kept in ``__slots__`` instead of a per-instance
+    dictionary. ``KEYS`` lists the dictionary keys, in order, and
+    ``ATTRIBUTES`` the slot holding each of them. Records compare equal to
+    the dictionaries with the same items, and ``to_dict`` converts them.
+    """
+
+    __slots__ = ()
+    KEYS = ()
+    ATTRIBUTES = {}
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, self.ATTRIBUTES[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def to_dict(self) -> Dict:
+        """Return the items of the record as a dictionary."""
+        return {key: self[key] for key in self.KEYS}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+class FilePayload(Record):
+    """Payload of the event of a file: its Rubin metadata and its replica."""
+
+    __slots__ = (
+        "rubin_butler",
+        "rubin_sidecar",
+        "scope",
+        "name",
+        "dataset",
+        "dataset_scope",
+        "dst_url",
+        "dst_rse",
+    )
+    KEYS = (
+        "rubin_butler",
+        "rubin_sidecar",
+        "scope",
+        "name",
+        "dataset",
+        "datasetScope",
+        "dst-url",
+        "dst-rse",
+    )
+    ATTRIBUTES = dict(zip(KEYS, __slots__))
+
+    def __init__(
+        self,
+        rubin_butler=None,
+        rubin_sidecar=None,
+        scope=None,
+        name=None,
+        dataset=None,
+        dataset_scope=None,
+        dst_url=None,
+        dst_rse=None,
+    ):
+        self.rubin_butler = rubin_butler
+        self.rubin_sidecar = rubin_sidecar
+        self.scope = scope
+        self.name = name
+        self.dataset = dataset
+        self.dataset_scope = dataset_scope
+        self.dst_url = dst_url
+        self.dst_rse = dst_rse
+
+    @classmethod
+    def from_dict(cls, payload: Dict) -> "FilePayload":
+        """Build the record of a payload dictionary."""
+        return cls(**{cls.ATTRIBUTES[key]: payload.get(key) for key in cls.KEYS})
+
+
+class TransferEvent(Record):
+    """Transfer event of a file, serialized to JSON only by the sinks."""
+
+    __slots__ = ("payload", "created_at")
+    KEYS = ("event_type", "payload", "created_at")
+    ATTRIBUTES = {key: key for key in KEYS}
+    event_type = EVENT_TYPE
+
+    def __init__(self, payload: Mapping, created_at: str):
+        self.payload = payload
+        self.created_at = created_at
+
+    def to_dict(self) -> Dict:
+        """Return the event as a dictionary, its payload included."""
+        return {
+            "event_type": self.event_type,
+            "payload": as_dict(self.payload),
+            "created_at": self.created_at,
+        }
+
+
+def as_dict(value: Any) -> Any:
+    """Convert a record to a dictionary, leaving the other values as they
+    are.
+    """
+    return value.to_dict() if isinstance(value, Record) else value
+
+
+def record_to_dict(value: Any) -> Dict:
+    """Convert a record to a dictionary, as a ``default`` of the JSON
+    encoders.
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
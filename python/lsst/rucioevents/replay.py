@@ -0,0 +1,237 @@
+import argparse
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+from lsst.rucioevents.capture import iter_capture
+from lsst.rucioevents.dummy_event_generator import (
+    FILE_SINKS,
+    SINKS,
+    add_kafka_arguments,
+    add_metrics_arguments,
+    create_sink,
+    exported_metrics,
+    kafka_config_from_args,
+)
+from lsst.rucioevents.event_creator import KafkaEvent
+from lsst.rucioevents.serialization import EventEncoder
+from lsst.rucioevents.sinks import EventSink
+from lsst.rucioevents.utils import chunked
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("RucioEventReplay")
+
+# Number of batches sent per second at a target rate, to keep it smooth.
+BATCHES_PER_SECOND = 10
+DEFAULT_REPORT_INTERVAL = 10.0
+
+
+def paced_batch_size(rate: Optional[float], batch_size: int) -> int:
+    """Return the size of the batches sent at a target rate."""
+    if not rate:
+        return batch_size
+    return max(1, min(batch_size, int(rate / BATCHES_PER_SECOND)))
+
+
+def _rate_report(sent: int, elapsed: float, rate: Optional[float]) -> str:
+    """Describe the achieved rate, and the target one if any."""
+    achieved = sent / elapsed if elapsed > 0 else 0.0
+    target = f" (target {rate:.0f} events/s)" if rate else ""
+    return f"{sent} events in {elapsed:.2f}s: {achieved:.0f} events/s{target}"
+
+
+def stream(
+    batches: Iterable[List[Dict]],
+    sink: EventSink,
+    rate: Optional[float] = None,
+    report_interval: float = DEFAULT_REPORT_INTERVAL,
+) -> Dict:
+    """
+    Sends batches of events to a sink, at a target rate or as fast as
+    possible, periodically logging the achieved rate and the depth of the
+    producer queue.
+
+    :param batches: The batches of events.
+    :param sink: The destination of the events.
+    :param rate: Target rate in events per second, as fast as possible if
+        not set. A batch is sent once the previous events are due.
+    :param report_interval: Time between two progress reports, in seconds.
+    :return: The number of events sent, the elapsed time, the requested
+        and achieved rates and the maximum producer queue depth.
+    """
+    sent = 0
+    max_depth = 0
+    start = time.monotonic()
+    next_report = start + report_interval
+    for batch in batches:
+        if rate:
+            delay = start + sent / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        sent += sink.send_event(batch, flush=False)
+        depth = sink.queue_depth()
+        max_depth = max(max_depth, depth)
+        now = time.monotonic()
+        if now >= next_report:
+            logger.info(
+                f"Sent {_rate_report(sent, now - start, rate)}, "
+                f"producer queue depth {depth}"
+            )
+            next_report = now + report_interval
+    sink.flush()
+    elapsed = time.monotonic() - start
+    logger.info(
+        f"Sent {_rate_report(sent, elapsed, rate)}, "
+        f"maximum producer queue depth {max_depth}"
+    )
+    return {
+        "events": sent,
+        "seconds": elapsed,
+        "requested_rate": rate,
+        "achieved_rate": sent / elapsed if elapsed > 0 else 0.0,
+        "max_queue_depth": max_depth,
+    }
+
+
+def refresh_events(events: List[Dict]):
+    """Give the events a new creation time, and drop their key so that the
+    producer assigns a new one, random with the ``random`` key strategy.
+    """
+    created_at = datetime.now().strftime(KafkaEvent.DATE_FORMAT)
+    for event in events:
+        event["created_at"] = created_at
+        event.pop("key", None)
+
+
+def iter_replayed(
+    path: str, batch_size: int, refresh: bool = False, repeat: int = 1
+) -> Iterator[List[Dict]]:
+    """Yield the events of a capture in batches, ``repeat`` times."""
+    for _ in range(repeat):
+        for batch in chunked(iter_capture(path), batch_size):
+            if refresh:
+                refresh_events(batch)
+            yield batch
+
+
+def replay(
+    path: str,
+    sink: EventSink,
+    rate: Optional[float] = None,
+    refresh: bool = False,
+    repeat: int = 1,
+    batch_size: int = EventSink.DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    Streams the events of a capture file to a sink.
+
+    :param path: The capture file.
+    :param sink: The destination of the events.
+    :param rate: Target rate in events per second, as fast as possible if
+        not set.
+    :param refresh: Refresh the creation time of the events, once per
+        batch, and drop their key, so that the sink draws a new one with the
+        ``random`` key strategy.
+    :param repeat: Number of times the capture is replayed.
+    :param batch_size: Maximum number of events sent at once.
+    :return: The number of events sent.
+    """
+    batches = iter_replayed(path, paced_batch_size(rate, batch_size), refresh, repeat)
+    return stream(batches, sink, rate=rate)["events"]
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Replay the events of a capture, recorded by "
+        "dummy_event_generator --sink capture, without querying Rucio."
+    )
+    parser.add_argument(
+        "capture",
+        metavar="CAPTURE",
+        type=str,
+        help="The capture file to replay.",
+    )
+    parser.add_argument(
+        "-t",
+        "--topic",
+        metavar="TOPIC",
+        type=str,
+        help="Kafka topic the events are sent to.",
+    )
+    parser.add_argument(
+        "--sink",
+        choices=SINKS,
+        default="kafka",
+        help="Destination of the events.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="Output file of the file and capture sinks.",
+    )
+    add_kafka_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument(
+        "--fast-json",
+        action="store_true",
+        help="Serialize the events with orjson when it is installed.",
+    )
+    parser.add_argument(
+        "--rate",
+        metavar="EVENTS",
+        type=float,
+        default=None,
+        help="Target rate in events per second, as fast as possible by default.",
+    )
+    parser.add_argument(
+        "--repeat",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Number of times the capture is replayed.",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Refresh the creation time and the key of the replayed events.",
+    )
+    args = parser.parse_args(argv)
+    if args.sink == "kafka" and not args.topic:
+        parser.error("--topic is required by --sink kafka")
+    if (args.sink in FILE_SINKS) != bool(args.output):
+        parser.error(
+            "--output is required by, and only used with, --sink file and capture"
+        )
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    sink = create_sink(
+        args.sink,
+        args.topic,
+        output=args.output,
+        encoder=EventEncoder(fast=args.fast_json),
+        kafka_config=kafka_config_from_args(args),
+        key_strategy="random" if args.refresh else "did",
+    )
+    with exported_metrics(args, sink):
+        try:
+            replay(
+                args.capture,
+                sink,
+                rate=args.rate,
+                refresh=args.refresh,
+                repeat=args.repeat,
+            )
+        finally:
+            sink.close()
+    logger.info(f"Event sink: {sink.summary()}")
+    return 0
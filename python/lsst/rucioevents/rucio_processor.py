@@ -1,6 +1,12 @@
-from typing import Dict, List, Optional
+import weakref
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 from rucio.client import Client
-from rucio.common.exception import DataIdentifierNotFound
+from rucio.common.exception import DataIdentifierNotFound, UnsupportedOperation
+from lsst.rucioevents.cache import RucioCache
+from lsst.rucioevents.metrics import timed_call
+from lsst.rucioevents.records import FilePayload, as_dict
+from lsst.rucioevents.utils import chunked
 import logging
 
 logging.basicConfig(
@@ -10,120 +16,428 @@ logging.basicConfig(
 )
 logger = logging.getLogger("RucioProcessor")
 
+# Clients whose server refused get_metadata_bulk, not to be asked again.
+_NO_BULK_CLIENTS = weakref.WeakSet()
+
 
 class RucioProcessor:
     """
     Provides an interface to retrieve DID information from Rucio.
 
+    Several RSEs can be given: the replicas on all of them are then looked
+    up with a single ``list_replicas`` call, the metadata of each file are
+    requested once, and the payload holds one entry per file and RSE, keyed
+    by ``name@rse`` instead of the file name.
+
     Args:
         scope (str): The Rucio scope.
         name (str): The Rucio DID name.
-        rse (str): The Rucio Storage Element.
+        rse (str or list of str): The Rucio Storage Element, or several.
         client (Client, optional): A pre-configured Rucio Client object.
             If not provided, a new Client will be created.
+        metadata_chunk_size (int, optional): Number of DIDs sent in a single
+            bulk metadata request.
+        cache (RucioCache, optional): On-disk cache of the file lists,
+            replicas and metadata, queried before Rucio.
+        replicas (dict, optional): Replica URLs of the files of the DID on
+            each RSE, by RSE then file name, already looked up with those of
+            other DIDs. They stand for both the file list and the replica
+            lookup.
     """
 
+    DEFAULT_METADATA_CHUNK_SIZE = 500
+    METADATA_PLUGIN = "ALL"
+    RUBIN_KEYS = ("rubin_butler", "rubin_sidecar", "scope", "name")
+
     def __init__(
-        self, scope: str, name: str, rse: str, client: Optional[Client] = None
+        self,
+        scope: str,
+        name: str,
+        rse: Union[str, Sequence[str]],
+        client: Optional[Client] = None,
+        metadata_chunk_size: int = DEFAULT_METADATA_CHUNK_SIZE,
+        cache: Optional[RucioCache] = None,
+        replicas: Optional[Dict[str, Dict[str, str]]] = None,
     ):
         self.client = client or Client()
+        self.cache = cache
+        self.replicas = replicas
         self.scope = scope
         self.name = name
-        self.rse = rse
+        self.rses = [rse] if isinstance(rse, str) else list(rse)
+        # RSE expression matching all the RSEs.
+        self.rse = "|".join(self.rses)
+        self.metadata_chunk_size = max(1, metadata_chunk_size)
+        self.rucio_calls = Counter()
+        self.skipped_lookups = 0
+        # Number of Rucio lookups that failed, leaving the payload incomplete.
+        self.lookup_errors = 0
 
-    def get_payload(self) -> Dict:
+    def get_payload(self) -> Dict[str, Dict]:
         """Merge metadata and RSE information into a single payload."""
-        return self._merge_metadata()
+        return {
+            name: as_dict(payload)
+            for name, payload in self.get_payload_records().items()
+        }
+
+    def get_payload_records(self) -> Dict[str, FilePayload]:
+        """Merge metadata and RSE information into a single payload of
+        compact ``FilePayload`` records.
+        """
+        payload = self._merge_metadata()
+        logger.info(
+            f"Rucio calls for DID {self.scope}:{self.name}: {self.format_rucio_calls()}"
+        )
+        return payload
+
+    def iter_payload(self, window: int) -> Iterator[Tuple[str, Dict]]:
+        """Yield the merged payload of the files, ``window`` files at a time.
+
+        Metadata and replicas are only looked up for the files of the
+        current window, so memory usage does not depend on the DID size.
+        """
+        for name, payload in self.iter_payload_records(window):
+            yield name, as_dict(payload)
+
+    def iter_payload_records(self, window: int) -> Iterator[Tuple[str, FilePayload]]:
+        """Yield the merged payload of the files as ``FilePayload`` records,
+        ``window`` files at a time, as ``iter_payload``.
+        """
+        names = (file_info["name"] for file_info in self._iter_files())
+        for chunk in chunked(names, window):
+            replicas = self._get_files_replicas(chunk)
+            rubin_payload = self._get_all_metadata(self._names_on_rse(chunk, replicas))
+            yield from self._join_replicas(rubin_payload, replicas).items()
+        self._log_skipped_lookups()
+        logger.info(
+            f"Rucio calls for DID {self.scope}:{self.name}: {self.format_rucio_calls()}"
+        )
+
+    def format_rucio_calls(self) -> str:
+        """Return a summary of the Rucio calls made so far."""
+        details = ", ".join(
+            f"{method}={count}" for method, count in sorted(self.rucio_calls.items())
+        )
+        total = sum(self.rucio_calls.values())
+        return f"{total} ({details})" if details else "0"
+
+    def _call(self, method: str, *args, **kwargs):
+        """Invoke a Rucio client method, keeping track of the calls made."""
+        function = getattr(self.client, method)
+        self.rucio_calls[method] += 1
+        return timed_call(method, function, *args, **kwargs)
+
+    def _cache_get(self, kind: str, names: List[str], rse: str = "") -> Dict:
+        """Return the cached values of the given names, if a cache is set."""
+        if self.cache is None:
+            return {}
+        return self.cache.get_many(kind, self.scope, names, rse)
+
+    def _cache_put(self, kind: str, values: Dict, rse: str = ""):
+        """Store values in the cache, if a cache is set."""
+        if self.cache is not None and values:
+            self.cache.put_many(kind, self.scope, values, rse)
 
     def _get_did_info(self) -> Optional[Dict]:
         """Retrieve DID info from Rucio."""
         try:
-            return self.client.get_did(self.scope, self.name)
+            return self._call("get_did", self.scope, self.name)
         except DataIdentifierNotFound:
             logger.error(f"DID {self.name} not found in scope {self.scope}.")
         except Exception as e:
             logger.error(f"Error retrieving DID {self.name}: {e}")
         return None
 
-    def _get_files_info(self) -> List[Dict]:
-        """Retrieve information about all the files within a DID."""
+    def _iter_files(self, long: bool = False) -> Iterator[Dict]:
+        """Stream the files within a DID with a single ``list_files`` call.
+
+        Args:
+            long (bool): Also return the extended file attributes
+                (``bytes``, ``adler32``, ``guid``, ``events``, ...).
+        """
         try:
-            return [
-                self.client.get_did(file["scope"], file["name"])
-                for file in self.client.list_files(self.scope, self.name)
-            ]
+            yield from self._call("list_files", self.scope, self.name, long=long)
         except DataIdentifierNotFound:
+            self.lookup_errors += 1
             logger.error(f"DID {self.name} not found in scope {self.scope}.")
         except Exception as e:
+            self.lookup_errors += 1
             logger.error(f"Error retrieving files info for DID {self.name}: {e}")
-        return []
+
+    def _get_files_info(self, long: bool = False) -> List[Dict]:
+        """Retrieve information about all the files within a DID."""
+        return list(self._iter_files(long=long))
 
     def _get_file_names(self) -> List[str]:
         """Retrieve the names of all files within a DID."""
-        logger.info(f"Getting filenames for DID {self.scope}:{self.name}")
-        return [file_info["name"] for file_info in self._get_files_info()]
+        if self.replicas is not None:
+            return list(
+                dict.fromkeys(name for urls in self.replicas.values() for name in urls)
+            )
+        cached = self._cache_get("files", [self.name])
+        if self.name in cached:
+            return cached[self.name]
+        logger.debug(f"Getting filenames for DID {self.scope}:{self.name}")
+        errors = self.lookup_errors
+        names = [file_info["name"] for file_info in self._iter_files()]
+        if self.lookup_errors == errors:
+            self._cache_put("files", {self.name: names})
+        return names
 
-    def _get_rubin_payload(self, name: str) -> Optional[Dict]:
-        """Retrieve the Rubin metadata of a specific file or container."""
+    def _build_rubin_payload(self, name: str, metas: Dict) -> Optional[Dict]:
+        """Extract the Rubin payload from the metadata of a file."""
         RUBIN_BUTLER = "rubin_butler"
         RUBIN_SIDECAR = "rubin_sidecar"
         SCOPE = "scope"
         NAME = "name"
         DATASET = "dataset"
         DATASET_SCOPE = "datasetScope"
-        logger.info(f"Getting metadata for {name}")
+        payload = {
+            RUBIN_BUTLER: metas.get(RUBIN_BUTLER),
+            RUBIN_SIDECAR: metas.get(RUBIN_SIDECAR),
+            SCOPE: metas.get(SCOPE),
+            NAME: metas.get(NAME),
+            DATASET: self.name,
+            DATASET_SCOPE: self.scope,  # I can use also SCOPE directly
+        }
+        if not any(payload.values()):
+            logger.warning(
+                f"No relevant metadata found for {name} in scope {self.scope}."
+            )
+            return None
+        return payload
+
+    def _get_rubin_payload(self, name: str) -> Optional[Dict]:
+        """Retrieve the Rubin metadata of a specific file or container."""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Getting metadata for {name}")
         try:
-            metas = self.client.get_metadata(self.scope, name=name, plugin="ALL")
-            payload = {
-                RUBIN_BUTLER: metas.get(RUBIN_BUTLER),
-                RUBIN_SIDECAR: metas.get(RUBIN_SIDECAR),
-                SCOPE: metas.get(SCOPE),
-                NAME: metas.get(NAME),
-                DATASET: self.name,
-                DATASET_SCOPE: self.scope,  # I can use also SCOPE directly
-            }
-            if not any(payload.values()):
-                logger.warning(
-                    f"No relevant metadata found for {name} in scope {self.scope}."
-                )
-                return None
-            return payload
+            metas = self._call(
+                "get_metadata", self.scope, name=name, plugin=self.METADATA_PLUGIN
+            )
+            self._cache_put("metadata", {name: self._rubin_metas(metas)})
+            return self._build_rubin_payload(name, metas)
         except DataIdentifierNotFound:
             logger.error(f"Metadata for {name} not found in scope {self.scope}.")
         except Exception as e:
+            self.lookup_errors += 1
             logger.error(f"Error retrieving metadata for {name}: {e}")
         return None
 
+    def _fetch_metadata_chunk(self, names: List[str]) -> Optional[Dict[str, Dict]]:
+        """Retrieve the metadata of a chunk of files in one request, by file
+        name, or None if the server does not support the bulk call.
+        """
+        dids = [{"scope": self.scope, "name": name} for name in names]
+        try:
+            return {
+                metas.get("name"): metas
+                for metas in self._call(
+                    "get_metadata_bulk", dids, plugin=self.METADATA_PLUGIN
+                )
+            }
+        except UnsupportedOperation:
+            logger.warning(
+                "Bulk metadata retrieval not supported, "
+                "falling back to one request per file."
+            )
+            _NO_BULK_CLIENTS.add(self.client)
+            return None
+
+    def _get_metadata_chunk(
+        self, names: List[str], found: Dict[str, Dict]
+    ) -> Dict[str, Optional[Dict]]:
+        """Build the Rubin payloads of a chunk of files from the metadata
+        returned by a bulk request.
+        """
+        # Files left out of the reply have no metadata, as when get_metadata
+        # does not find them; they are not cached.
+        self._cache_put(
+            "metadata",
+            {name: self._rubin_metas(found[name]) for name in names if name in found},
+        )
+        return {
+            name: self._build_rubin_payload(name, found[name]) if name in found else None
+            for name in names
+        }
+
+    def _bulk_supported(self) -> bool:
+        """Return True unless the client lacks the bulk metadata call, or
+        its server refused it.
+        """
+        return (
+            getattr(self.client, "get_metadata_bulk", None) is not None
+            and self.client not in _NO_BULK_CLIENTS
+        )
+
+    def _rubin_metas(self, metas: Dict) -> Dict:
+        """Keep only the metadata needed to build the Rubin payload."""
+        return {key: metas.get(key) for key in self.RUBIN_KEYS}
+
     def _get_all_metadata(self, names: List[str]) -> Dict[str, Optional[Dict]]:
-        """Retrieve metadata for all specified names."""
-        return {name: self._get_rubin_payload(name) for name in names}
+        """Retrieve metadata for all specified names.
+
+        Metadata are requested in chunks of ``metadata_chunk_size`` DIDs
+        through ``get_metadata_bulk``. One ``get_metadata`` call per file is
+        used only when the server or the client does not support the bulk
+        call, or when a chunk contains a DID unknown to Rucio. Metadata found
+        in the cache are not requested.
+        """
+        metadata = {
+            name: self._build_rubin_payload(name, metas)
+            for name, metas in self._cache_get("metadata", names).items()
+        }
+        requested = names
+        if metadata:
+            requested = [name for name in names if name not in metadata]
+        for chunk in chunked(requested, self.metadata_chunk_size):
+            if self._bulk_supported():
+                logger.debug(
+                    f"Getting metadata for {len(chunk)} files of "
+                    f"{self.scope}:{self.name}"
+                )
+                try:
+                    found = self._fetch_metadata_chunk(chunk)
+                except DataIdentifierNotFound:
+                    logger.warning(
+                        f"Unknown DID in metadata chunk of {self.scope}:{self.name}, "
+                        "retrying the chunk one file at a time."
+                    )
+                except Exception as e:
+                    self.lookup_errors += 1
+                    logger.error(
+                        f"Error retrieving bulk metadata for {self.name}: {e}"
+                    )
+                    metadata.update({name: None for name in chunk})
+                    continue
+                else:
+                    if found is not None:
+                        metadata.update(self._get_metadata_chunk(chunk, found))
+                        continue
+            metadata.update({name: self._get_rubin_payload(name) for name in chunk})
+        return {name: metadata[name] for name in names}
 
     def _get_rse_info(self) -> Dict[str, str]:
-        """Retrieve RSE information for the specified DID."""
-        logger.info(f"Getting RSEs for {self.scope}:{self.name}")
+        """Retrieve RSE information for the specified DID, on its first
+        RSE.
+        """
+        return self._get_replicas()[self.rses[0]]
+
+    def _get_replicas(self) -> Dict[str, Dict[str, str]]:
+        """Retrieve the replica URLs of the files of the DID on each RSE,
+        with a single call for all the RSEs.
+        """
+        if self.replicas is not None:
+            return self.replicas
+        cached = {
+            rse: self._cache_get("replicas", [self.name], rse).get(self.name)
+            for rse in self.rses
+        }
+        if all(urls is not None for urls in cached.values()):
+            return cached
+        logger.debug(f"Getting RSEs for {self.scope}:{self.name}")
+        errors = self.lookup_errors
+        replicas = self._list_replicas([{"scope": self.scope, "name": self.name}])
+        if self.lookup_errors == errors:
+            for rse, urls in replicas.items():
+                self._cache_put("replicas", {self.name: urls}, rse)
+        return replicas
+
+    def _get_files_replicas(self, names: List[str]) -> Dict[str, Dict[str, str]]:
+        """Retrieve the replica URLs of the specified files of the DID on
+        each RSE.
+        """
+        return self._list_replicas(
+            [{"scope": self.scope, "name": name} for name in names]
+        )
+
+    def _list_replicas(self, dids: List[Dict]) -> Dict[str, Dict[str, str]]:
+        """Map the name of the replicas of the DIDs to their URL, for each
+        RSE.
+        """
+        replicas = {rse: {} for rse in self.rses}
         try:
-            replicas = self.client.list_replicas(
-                [{"scope": self.scope, "name": self.name}], rse_expression=self.rse
-            )
-            return {
-                replica["name"]: replica["rses"][self.rse][0]
-                for replica in replicas
-                if self.rse in replica["rses"]
-            }
+            for replica in self._call("list_replicas", dids, rse_expression=self.rse):
+                for rse, urls in replicas.items():
+                    if rse in replica["rses"]:
+                        urls[replica["name"]] = replica["rses"][rse][0]
+            return replicas
         except Exception as e:
+            self.lookup_errors += 1
             logger.error(f"Error retrieving RSE info for {self.name}: {e}")
-            return {}
+            return {rse: {} for rse in self.rses}
 
     def _merge_metadata(self) -> Dict:
-        """Merge Rubin meta and RSE information into a single dictionary."""
-        rubin_payload = self._get_all_metadata(self._get_file_names())
-        rse_payload = self._get_rse_info()
+        """Merge Rubin meta and RSE information into a single dictionary.
+
+        Replicas are looked up first, so that metadata are only requested
+        for the files with a replica on the RSE.
+        """
+        replicas = self._get_replicas()
+        if not any(replicas.values()):
+            return {}
+        names = self._names_on_rse(self._get_file_names(), replicas)
+        self._log_skipped_lookups()
+        rubin_payload = self._get_all_metadata(names)
+        return self._join_replicas(rubin_payload, replicas)
+
+    def _names_on_rse(
+        self, names: List[str], replicas: Dict[str, Dict[str, str]]
+    ) -> List[str]:
+        """Keep the names of the files with a replica on one of the RSEs."""
+        on_rse = [
+            name for name in names if any(name in urls for urls in replicas.values())
+        ]
+        self.skipped_lookups += len(names) - len(on_rse)
+        return on_rse
+
+    def _log_skipped_lookups(self):
+        """Log the metadata lookups skipped for files without replica."""
+        if self.skipped_lookups:
+            logger.info(
+                f"Skipped metadata lookup for {self.skipped_lookups} files of "
+                f"{self.scope}:{self.name} with no replica on {self.rse}"
+            )
+
+    def _join_replicas(
+        self,
+        rubin_payload: Dict[str, Optional[Dict]],
+        replicas: Dict[str, Dict[str, str]],
+    ) -> Dict:
+        """Join Rubin metadata with the replica URLs on each RSE, keyed by
+        file name, or by ``name@rse`` with several RSEs.
+        """
+        if len(self.rses) == 1:
+            return self._join_payloads(rubin_payload, replicas[self.rses[0]])
+        merged_dict = {}
+        for rse in self.rses:
+            for name, payload in self._join_payloads(
+                rubin_payload, replicas[rse], rse
+            ).items():
+                merged_dict[f"{name}@{rse}"] = payload
+        return merged_dict
+
+    def _join_payloads(
+        self,
+        rubin_payload: Dict[str, Optional[Dict]],
+        rse_payload: Dict[str, str],
+        rse: Optional[str] = None,
+    ) -> Dict:
+        """Join Rubin metadata with the replica URLs on an RSE, by default
+        the first one, in compact ``FilePayload`` records.
+        """
+        rse = rse or self.rses[0]
         merged_dict = {}
         for name, items in rubin_payload.items():
             if items and name in rse_payload:
-                merged_dict[name] = {
-                    **items,
-                    "dst-url": rse_payload[name],
-                    "dst-rse": self.rse,
-                }
+                merged_dict[name] = FilePayload(
+                    rubin_butler=items.get("rubin_butler"),
+                    rubin_sidecar=items.get("rubin_sidecar"),
+                    scope=items.get("scope"),
+                    name=items.get("name"),
+                    dataset=items.get("dataset"),
+                    dataset_scope=items.get("datasetScope"),
+                    dst_url=rse_payload[name],
+                    dst_rse=rse,
+                )
         return merged_dict
@@ -0,0 +1,93 @@
+import json
+import logging
+from functools import partial
+from typing import Any, Dict
+from lsst.rucioevents.event_creator import KafkaEvent
+from lsst.rucioevents.records import TransferEvent, record_to_dict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("EventEncoder")
+
+_JSON_ENCODER = json.JSONEncoder(default=record_to_dict)
+
+
+def _json_dumps(value: Any) -> bytes:
+    """Serialize a value as ``json.dumps`` does, to UTF-8 bytes."""
+    return _JSON_ENCODER.encode(value).encode("utf-8")
+
+
+class EventEncoder:
+    """
+    Serializes the events to UTF-8 JSON documents.
+
+    The events built by ``KafkaEvent`` are assembled from fragments encoded
+    once, the event type and the keys, so that only the payload and the
+    creation time, shared by consecutive events, are encoded per event.
+
+    By default the documents are byte for byte those of ``json.dumps``.
+    ``TransferEvent`` and ``FilePayload`` records are serialized as the
+    dictionaries they stand for, without converting them first.
+
+    With ``fast`` they are encoded by orjson, when it is installed: the
+    documents are the same, with the keys in the same order, but without
+    spaces after the separators and with non-ASCII characters unescaped.
+
+    Args:
+        fast (bool, optional): Encode with orjson when it is installed.
+    """
+
+    EVENT_KEYS = ("event_type", "payload", "created_at")
+
+    def __init__(self, fast: bool = False):
+        if fast and orjson is None:
+            logger.warning("orjson is not installed, events are encoded with json")
+        self.fast = fast and orjson is not None
+        if self.fast:
+            self._dumps = partial(orjson.dumps, default=record_to_dict)
+            item_separator, key_separator = b",", b":"
+        else:
+            self._dumps = _json_dumps
+            item_separator, key_separator = b", ", b": "
+        event_type, payload, created_at = (self._dumps(key) for key in self.EVENT_KEYS)
+        self._head = (
+            b"{"
+            + event_type
+            + key_separator
+            + self._dumps(KafkaEvent.EVENT_TYPE)
+            + item_separator
+            + payload
+            + key_separator
+        )
+        self._middle = item_separator + created_at + key_separator
+        self._created_at = (None, b"")
+
+    def encode(self, event: Dict) -> bytes:
+        """Serialize an event, from its fragments when it has the layout of
+        the ``KafkaEvent`` events.
+        """
+        if isinstance(event, TransferEvent):
+            return self.encode_event(event.payload, event.created_at)
+        if (
+            len(event) == 3
+            and event.get("event_type") == KafkaEvent.EVENT_TYPE
+            and tuple(event) == self.EVENT_KEYS
+        ):
+            return self.encode_event(event["payload"], event["created_at"])
+        return self._dumps(event)
+
+    def encode_event(self, payload: Dict, created_at: str) -> bytes:
+        """Serialize the event of a payload, without building the event."""
+        cached = self._created_at
+        if cached[0] != created_at:
+            cached = (created_at, self._dumps(created_at) + b"}")
+            self._created_at = cached
+        return self._head + self._dumps(payload) + self._middle + cached[1]
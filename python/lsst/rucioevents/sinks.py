@@ -0,0 +1,217 @@
+import gzip
+import logging
+import sys
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, List, Optional, Tuple
+from lsst.rucioevents.journal import RunJournal
+from lsst.rucioevents.metrics import BYTES_SENT, EVENTS_SENT, PRODUCE_SECONDS
+from lsst.rucioevents.serialization import EventEncoder
+from lsst.rucioevents.utils import chunked
+
+if TYPE_CHECKING:
+    from lsst.rucioevents.dedup import DedupIndex
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("EventSink")
+
+
+def event_dids(event: Dict) -> Tuple[str, str]:
+    """Return the dataset and the file DIDs an event is about."""
+    payload = event.get("payload", {})
+    return (
+        f"{payload.get('datasetScope')}:{payload.get('dataset')}",
+        f"{payload.get('scope')}:{payload.get('name')}",
+    )
+
+
+def journal_dids(event: Dict) -> Tuple[str, str]:
+    """Return the dataset DID of an event and the key of its file in the
+    journal: the file DID followed by ``@rse``, so that the events of a file
+    for several RSEs are recorded apart.
+    """
+    dataset_did, file_did = event_dids(event)
+    rse = event.get("payload", {}).get("dst-rse")
+    return dataset_did, f"{file_did}@{rse}" if rse else file_did
+
+
+class EventSink:
+    """
+    Destination of the generated events.
+
+    Events are serialized to JSON by ``encoder`` and written in batches of
+    ``batch_size`` events, so that the cost of a sink can be profiled on its
+    own.
+    Subclasses implement ``_write``, and ``_serialize`` for another format
+    than JSON Lines; ``RucioKafkaProducer`` is the Kafka implementation.
+
+    Args:
+        batch_size (int, optional): Number of events written at once.
+        journal (RunJournal, optional): Journal recording the written file
+            events, when it tracks files.
+        dedup (DedupIndex, optional): Index of the emitted file events,
+            confirming the keys of the written events.
+        encoder (EventEncoder, optional): Serializer of the events, by
+            default equivalent to ``json.dumps``.
+    """
+
+    DEFAULT_BATCH_SIZE = 1000
+
+    def __init__(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        journal: Optional[RunJournal] = None,
+        encoder: Optional[EventEncoder] = None,
+        dedup: Optional["DedupIndex"] = None,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.journal = journal
+        self.dedup = dedup
+        self.encoder = encoder or EventEncoder()
+        self.delivered = 0
+        self.failed = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        label = type(self).__name__
+        self._produce_seconds = PRODUCE_SECONDS.labels(label)
+        self._events_sent = EVENTS_SENT.labels(label)
+        self._bytes_sent = BYTES_SENT.labels(label)
+
+    def send_event(self, events: Iterable[Dict], flush: bool = True) -> int:
+        """
+        Writes the events, one batch at a time.
+
+        :param events: Dictionaries containing the event data.
+        :param flush: Flush the sink once the events are written.
+        :return: The number of events written.
+        """
+        written = 0
+        with self._produce_seconds.time():
+            for batch in chunked(events, self.batch_size):
+                data = self._serialize(batch)
+                with self._lock:
+                    self._write(data)
+                    self.delivered += len(batch)
+                    self.bytes += len(data)
+                self._record(batch)
+                self._bytes_sent.inc(len(data))
+                written += len(batch)
+        self._events_sent.inc(written)
+        if flush:
+            self.flush()
+        return written
+
+    def _serialize(self, batch: List[Dict]) -> bytes:
+        """Serializes a batch of events, one JSON document per line."""
+        encode = self.encoder.encode
+        return b"".join(encode(event) + b"\n" for event in batch)
+
+    def _write(self, data: bytes):
+        """Writes a batch of serialized events."""
+        raise NotImplementedError()
+
+    def _record(self, batch: List[Dict]):
+        """Records the written file events in the journal and in the
+        deduplication index.
+        """
+        if self.dedup is not None:
+            for event in batch:
+                self.dedup.confirm(self.dedup.key(event))
+        if self.journal is None or not self.journal.track_files:
+            return
+        for event in batch:
+            self.journal.record_file(*journal_dids(event))
+
+    def flush(self) -> int:
+        """Flushes the written events, returning the number not written."""
+        return 0
+
+    def queue_depth(self) -> int:
+        """Returns the number of events waiting to be written."""
+        return 0
+
+    def close(self):
+        """Flushes and releases the sink."""
+        self.flush()
+
+    def summary(self) -> str:
+        """Returns a summary of the written events."""
+        return f"{self.delivered} events written, {self.bytes} bytes"
+
+
+class JsonlFileSink(EventSink):
+    """
+    Writes the events to a JSON Lines file, gzip compressed when ``compress``
+    is set or when the file name ends with ``.gz``.
+
+    Args:
+        path (str): The output file.
+        compress (bool, optional): Compress the file with gzip.
+        buffer_size (int, optional): Size of the write buffer in bytes.
+    """
+
+    DEFAULT_BUFFER_SIZE = 1024**2
+
+    def __init__(
+        self,
+        path: str,
+        compress: bool = False,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.path = path
+        if compress or path.endswith(".gz"):
+            self._file = gzip.open(path, "wb")
+        else:
+            self._file = open(path, "wb", buffering=buffer_size)
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+
+    def flush(self) -> int:
+        with self._lock:
+            self._file.flush()
+        return 0
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def summary(self) -> str:
+        return f"{super().summary()} to {self.path}"
+
+
+class StdoutSink(EventSink):
+    """Writes the events to the standard output, one JSON document per line."""
+
+    def __init__(self, stream: Optional[BinaryIO] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.stream = stream or sys.stdout.buffer
+
+    def _write(self, data: bytes):
+        self.stream.write(data)
+
+    def flush(self) -> int:
+        with self._lock:
+            self.stream.flush()
+        return 0
+
+
+class NullSink(EventSink):
+    """Discards the events, to measure the upstream throughput alone."""
+
+    def send_event(self, events: Iterable[Dict], flush: bool = True) -> int:
+        written = 0
+        for batch in chunked(events, self.batch_size):
+            with self._lock:
+                self.delivered += len(batch)
+            self._record(batch)
+            written += len(batch)
+        return written
+
+    def summary(self) -> str:
+        return f"{self.delivered} events discarded"
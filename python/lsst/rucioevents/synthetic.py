@@ -0,0 +1,302 @@
+import argparse
+import logging
+import random
+import string
+from typing import Dict, Iterator, List, Optional, Tuple
+from lsst.rucioevents.dummy_event_generator import (
+    FILE_SINKS,
+    SINKS,
+    add_kafka_arguments,
+    add_metrics_arguments,
+    create_sink,
+    exported_metrics,
+    kafka_config_from_args,
+)
+from lsst.rucioevents.event_creator import KafkaEvent
+from lsst.rucioevents.replay import DEFAULT_REPORT_INTERVAL, paced_batch_size, stream
+from lsst.rucioevents.serialization import EventEncoder
+from lsst.rucioevents.sinks import EventSink
+from lsst.rucioevents.utils import chunked
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("SyntheticEventGenerator")
+
+DEFAULT_DST_URL = "davs://{rse}.example.org:1094/{scope}/{name}"
+
+
+class SyntheticPayloads:
+    """
+    Generates realistic file payloads, without Rucio, for load testing.
+
+    The payloads fill ``KafkaEvent._get_template()`` with generated names:
+    file ``i`` is ``dataset_DDDDDD/file_IIIIIIIII.fits``, with
+    ``files_per_dataset`` files per dataset, and datasets spread over
+    ``n_scopes`` scopes. The butler and sidecar blobs are random strings of
+    the requested sizes, drawn once and shared by all the payloads.
+
+    Args:
+        count (int): Number of payloads.
+        scope (str, optional): Scope, or prefix of the scopes.
+        n_scopes (int, optional): Number of scopes.
+        files_per_dataset (int, optional): Number of files per dataset.
+        rse (str, optional): Destination RSE.
+        dst_url (str, optional): Pattern of the destination URLs, formatted
+            with ``rse``, ``scope``, ``dataset`` and ``name``.
+        butler_size (int, optional): Size of the ``rubin_butler`` blobs.
+        sidecar_size (int, optional): Size of the ``rubin_sidecar`` blobs.
+        seed (int, optional): Seed of the blobs.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        scope: str = "synthetic",
+        n_scopes: int = 1,
+        files_per_dataset: int = 1000,
+        rse: str = "SYNTHETIC_RSE",
+        dst_url: str = DEFAULT_DST_URL,
+        butler_size: int = 256,
+        sidecar_size: int = 1024,
+        seed: int = 0,
+    ):
+        self.count = count
+        self.scope = scope
+        self.n_scopes = max(1, n_scopes)
+        self.files_per_dataset = max(1, files_per_dataset)
+        self.rse = rse
+        self.dst_url = dst_url
+        generator = random.Random(seed)
+        alphabet = string.ascii_letters + string.digits
+        self.butler = "".join(generator.choices(alphabet, k=butler_size))
+        self.sidecar = "".join(generator.choices(alphabet, k=sidecar_size))
+
+    def _scope(self, dataset_index: int) -> str:
+        """Returns the scope of a dataset."""
+        if self.n_scopes == 1:
+            return self.scope
+        return f"{self.scope}{dataset_index % self.n_scopes}"
+
+    def iter_payloads(self) -> Iterator[Tuple[str, Dict]]:
+        """Yields the ``(name, payload)`` pair of each file."""
+        template = KafkaEvent._get_template()
+        for index in range(self.count):
+            dataset_index = index // self.files_per_dataset
+            scope = self._scope(dataset_index)
+            dataset = f"dataset_{dataset_index:06d}"
+            name = f"{dataset}/file_{index:09d}.fits"
+            payload = dict(template)
+            payload.update(
+                {
+                    "name": name,
+                    "scope": scope,
+                    "dataset": dataset,
+                    "datasetScope": scope,
+                    "dst-rse": self.rse,
+                    "dst-url": self.dst_url.format(
+                        rse=self.rse, scope=scope, dataset=dataset, name=name
+                    ),
+                    "rubin_butler": self.butler,
+                    "rubin_sidecar": self.sidecar,
+                }
+            )
+            yield name, payload
+
+    def iter_batches(
+        self, batch_size: int, timestamp_granularity: float = 0.0
+    ) -> Iterator[List[Dict]]:
+        """Yields the events in batches of ``batch_size``."""
+        events = KafkaEvent(
+            self.iter_payloads(), timestamp_granularity=timestamp_granularity
+        ).iter_event_records()
+        return chunked(events, batch_size)
+
+
+def generate(
+    payloads: SyntheticPayloads,
+    sink: EventSink,
+    rate: Optional[float] = None,
+    batch_size: int = EventSink.DEFAULT_BATCH_SIZE,
+    report_interval: float = DEFAULT_REPORT_INTERVAL,
+    timestamp_granularity: float = 0.0,
+) -> Dict:
+    """
+    Sends synthetic events to a sink, at a target rate or as fast as
+    possible. Consecutive events share their creation time for
+    ``timestamp_granularity`` seconds.
+
+    :return: The report of ``replay.stream``: the number of events sent, the
+        elapsed time, the requested and achieved rates and the maximum
+        producer queue depth.
+    """
+    batches = payloads.iter_batches(
+        paced_batch_size(rate, batch_size), timestamp_granularity
+    )
+    return stream(batches, sink, rate=rate, report_interval=report_interval)
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic transfer-done events, without Rucio, "
+        "to load test the event consumers."
+    )
+    parser.add_argument(
+        "-n",
+        "--count",
+        metavar="N",
+        type=int,
+        required=True,
+        help="Number of events to generate.",
+    )
+    parser.add_argument(
+        "-t",
+        "--topic",
+        metavar="TOPIC",
+        type=str,
+        help="Kafka topic the events are sent to, defaults to the RSE name.",
+    )
+    parser.add_argument(
+        "--sink",
+        choices=SINKS,
+        default="kafka",
+        help="Destination of the events.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="Output file of the file and capture sinks.",
+    )
+    add_kafka_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument(
+        "--fast-json",
+        action="store_true",
+        help="Serialize the events with orjson when it is installed.",
+    )
+    parser.add_argument(
+        "--rate",
+        metavar="EVENTS",
+        type=float,
+        default=None,
+        help="Target rate in events per second, as fast as possible by default.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        metavar="N",
+        type=int,
+        default=EventSink.DEFAULT_BATCH_SIZE,
+        help="Maximum number of events generated and sent at once.",
+    )
+    parser.add_argument(
+        "--timestamp-granularity",
+        metavar="SECONDS",
+        type=float,
+        default=0.0,
+        help="Time during which consecutive events share their creation time.",
+    )
+    parser.add_argument(
+        "--scope",
+        metavar="SCOPE",
+        type=str,
+        default="synthetic",
+        help="Scope of the files, or prefix of the scopes with --scopes.",
+    )
+    parser.add_argument(
+        "--scopes",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Number of scopes the datasets are spread over.",
+    )
+    parser.add_argument(
+        "--files-per-dataset",
+        metavar="N",
+        type=int,
+        default=1000,
+        help="Number of files per dataset.",
+    )
+    parser.add_argument(
+        "-r",
+        "--rse",
+        metavar="RSE",
+        type=str,
+        default="SYNTHETIC_RSE",
+        help="Destination RSE of the events.",
+    )
+    parser.add_argument(
+        "--dst-url",
+        metavar="PATTERN",
+        type=str,
+        default=DEFAULT_DST_URL,
+        help="Pattern of the destination URLs, with the {rse}, {scope}, "
+        "{dataset} and {name} fields.",
+    )
+    parser.add_argument(
+        "--butler-size",
+        metavar="BYTES",
+        type=int,
+        default=256,
+        help="Size of the rubin_butler blobs.",
+    )
+    parser.add_argument(
+        "--sidecar-size",
+        metavar="BYTES",
+        type=int,
+        default=1024,
+        help="Size of the rubin_sidecar blobs.",
+    )
+    parser.add_argument(
+        "--report-interval",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_REPORT_INTERVAL,
+        help="Time between two reports of the achieved rate and queue depth.",
+    )
+    args = parser.parse_args(argv)
+    if (args.sink in FILE_SINKS) != bool(args.output):
+        parser.error(
+            "--output is required by, and only used with, --sink file and capture"
+        )
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    payloads = SyntheticPayloads(
+        args.count,
+        scope=args.scope,
+        n_scopes=args.scopes,
+        files_per_dataset=args.files_per_dataset,
+        rse=args.rse,
+        dst_url=args.dst_url,
+        butler_size=args.butler_size,
+        sidecar_size=args.sidecar_size,
+    )
+    sink = create_sink(
+        args.sink,
+        args.topic or args.rse,
+        output=args.output,
+        batch_size=args.batch_size,
+        encoder=EventEncoder(fast=args.fast_json),
+        kafka_config=kafka_config_from_args(args),
+    )
+    with exported_metrics(args, sink):
+        try:
+            generate(
+                payloads,
+                sink,
+                rate=args.rate,
+                batch_size=args.batch_size,
+                report_interval=args.report_interval,
+                timestamp_granularity=args.timestamp_granularity,
+            )
+        finally:
+            sink.close()
+    logger.info(f"Event sink: {sink.summary()}")
+    return 0
@@ -0,0 +1,48 @@
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """Split an iterable into lists of at most ``size`` items."""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class AdaptiveChunkSize:
+    """
+    Size of the chunks of a bulk call, adjusted to its response time.
+
+    After each call, ``update`` scales the size by the ratio of the
+    ``target`` duration to the observed one, by at most a factor 2 up or
+    down, within ``[minimum, maximum]``: calls answered quickly get larger
+    chunks, slow calls smaller ones.
+
+    Args:
+        initial (int): Size of the first chunk.
+        minimum (int, optional): Smallest chunk size.
+        maximum (int, optional): Largest chunk size.
+        target (float, optional): Wanted duration of a call, in seconds.
+    """
+
+    DEFAULT_TARGET = 2.0
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: int = 1000,
+        target: float = DEFAULT_TARGET,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.target = target
+        self.value = min(max(initial, self.minimum), self.maximum)
+
+    def update(self, seconds: float) -> int:
+        """Record the duration of a call of the current size, returning the
+        size of the next chunk.
+        """
+        factor = 2.0 if seconds <= 0 else min(2.0, max(0.5, self.target / seconds))
+        self.value = min(max(round(self.value * factor), self.minimum), self.maximum)
+        return self.value
@@ -0,0 +1,69 @@
+import os
+import unittest
+import tempfile
+import lsst.utils.tests
+from lsst.rucioevents.benchmark import (
+    BENCHMARKS,
+    compare,
+    load,
+    main,
+    run_benchmarks,
+    run_profile_benchmarks,
+)
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_run_benchmarks(self):
+        """Run every benchmark on a small dataset."""
+        results = run_benchmarks([50], repeat=1)
+        self.assertEqual([result["benchmark"] for result in results], list(BENCHMARKS))
+        for result in results:
+            self.assertEqual(result["events"], 50)
+            self.assertGreater(result["events_per_second"], 0)
+            self.assertGreaterEqual(result["peak_memory_mb"], 0)
+
+    def test_run_profile_benchmarks(self):
+        """Check the throughput profile batches more than the low-latency
+        one.
+        """
+        results = run_profile_benchmarks(20, request_time=0.001)
+        self.assertEqual(
+            [result["profile"] for result in results], ["throughput", "low-latency"]
+        )
+        throughput, low_latency = results
+        self.assertEqual(throughput["events"], 20)
+        self.assertEqual(low_latency["events"], 20)
+        self.assertGreater(throughput["delivery_latency_ms"], 40)
+        self.assertGreater(low_latency["seconds"], 0.02)
+
+    def test_compare(self):
+        """Check throughput regressions are detected."""
+        baseline = [
+            {"benchmark": "send_event", "size": 10, "events_per_second": 1000.0},
+            {"benchmark": "process_dids", "size": 10, "events_per_second": 1000.0},
+        ]
+        results = [
+            {"benchmark": "send_event", "size": 10, "events_per_second": 850.0},
+            {"benchmark": "process_dids", "size": 10, "events_per_second": 500.0},
+            {"benchmark": "process_dids", "size": 20, "events_per_second": 1.0},
+        ]
+        regressions = compare(results, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("process_dids [10 files]"))
+
+    def test_main_baseline(self):
+        """Check a run compared to its own baseline."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "baseline.json")
+            args = ["-s", "20", "-n", "1", "-b", "process_metadata"]
+            self.assertEqual(main(args + ["-o", path]), 0)
+            self.assertEqual(len(load(path)), 1)
+            self.assertEqual(main(args + ["--baseline", path, "--tolerance", "1"]), 0)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
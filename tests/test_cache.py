@@ -0,0 +1,76 @@
+import unittest
+import tempfile
+import lsst.utils.tests
+from unittest.mock import patch
+from lsst.rucioevents.cache import RucioCache
+
+
+class TestRucioCache(unittest.TestCase):
+    def setUp(self):
+        """Create a cache in a temporary directory."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = RucioCache(self.tmpdir.name)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_put_get(self):
+        """Check values are stored and hits and misses counted."""
+        self.cache.put("files", "scope", "dataset", ["file1", "file2"])
+        self.cache.put("replicas", "scope", "dataset", {"file1": "url1"}, "RSE")
+        self.assertEqual(
+            self.cache.get("files", "scope", "dataset"), ["file1", "file2"]
+        )
+        self.assertEqual(
+            self.cache.get("replicas", "scope", "dataset", "RSE"), {"file1": "url1"}
+        )
+        self.assertIsNone(self.cache.get("replicas", "scope", "dataset", "OTHER_RSE"))
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertTrue(self.cache.summary().startswith("2 hits, 1 misses"))
+
+    def test_get_many(self):
+        """Check bulk storage and lookup."""
+        values = {f"file{i}": {"rubin_butler": i} for i in range(1200)}
+        self.cache.put_many("metadata", "scope", values)
+        found = self.cache.get_many(
+            "metadata", "scope", ["file1", "file1199", "missing"]
+        )
+        self.assertEqual(
+            found, {"file1": {"rubin_butler": 1}, "file1199": {"rubin_butler": 1199}}
+        )
+
+    def test_persistence(self):
+        """Check entries survive reopening the cache."""
+        self.cache.put("files", "scope", "dataset", ["file1"])
+        self.cache.close()
+        self.cache = RucioCache(self.tmpdir.name)
+        self.assertEqual(self.cache.get("files", "scope", "dataset"), ["file1"])
+
+    def test_ttl(self):
+        """Check expired entries are not returned."""
+        with patch("lsst.rucioevents.cache.time.time", return_value=1000.0):
+            self.cache.put("files", "scope", "dataset", ["file1"])
+        with patch(
+            "lsst.rucioevents.cache.time.time", return_value=1000.0 + self.cache.ttl + 1
+        ):
+            self.assertIsNone(self.cache.get("files", "scope", "dataset"))
+
+    def test_eviction(self):
+        """Check least recently used entries are evicted."""
+        self.cache.close()
+        self.cache = RucioCache(self.tmpdir.name, max_size=40)
+        for i in range(10):
+            self.cache.put("files", "scope", f"dataset{i}", ["file"])
+        self.assertGreater(self.cache.evictions, 0)
+        self.assertIsNone(self.cache.get("files", "scope", "dataset0"))
+        self.assertEqual(self.cache.get("files", "scope", "dataset9"), ["file"])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
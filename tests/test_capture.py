@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+import lsst.utils.tests
+from lsst.rucioevents.capture import CAPTURE_MAGIC, CaptureSink, iter_capture
+
+
+def make_events(count):
+    """Build events with a payload per file."""
+    return [
+        {
+            "event_type": "transfer-done",
+            "payload": {"scope": "scope", "name": f"file{i}"},
+            "created_at": "2024-01-01 00:00:00.000000",
+        }
+        for i in range(count)
+    ]
+
+
+class TestCapture(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "events.capture")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_capture_and_read(self):
+        """Check captured events are read back in order."""
+        sink = CaptureSink(self.path, batch_size=2)
+        events = make_events(5)
+        self.assertEqual(sink.send_event(events), 5)
+        sink.close()
+        self.assertEqual(list(iter_capture(self.path)), events)
+        self.assertEqual(os.path.getsize(self.path), len(CAPTURE_MAGIC) + sink.bytes)
+
+    def test_empty_capture(self):
+        """Check a capture without events."""
+        CaptureSink(self.path).close()
+        self.assertEqual(list(iter_capture(self.path)), [])
+
+    def test_truncated_capture(self):
+        """Check the events before a truncated record are read."""
+        sink = CaptureSink(self.path)
+        sink.send_event(make_events(3))
+        sink.close()
+        with open(self.path, "r+b") as file:
+            file.truncate(os.path.getsize(self.path) - 5)
+        self.assertEqual(list(iter_capture(self.path)), make_events(2))
+
+    def test_not_a_capture(self):
+        """Check files which are not captures are refused."""
+        with open(self.path, "w") as file:
+            file.write("{}\n")
+        with self.assertRaises(ValueError):
+            list(iter_capture(self.path))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
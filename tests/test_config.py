@@ -1,6 +1,8 @@
+import os
+import tempfile
 import unittest
 import lsst.utils.tests
-from lsst.rucioevents.config import KafkaConfig
+from lsst.rucioevents.config import KafkaConfig, read_properties
 
 
 class TestKafkaConfig(unittest.TestCase):
@@ -45,6 +47,52 @@ class TestKafkaConfig(unittest.TestCase):
         }
         self.assertEqual(config.complete_config(), expected_config)
 
+    def test_profile(self):
+        """Check profiles and their overrides."""
+        config = KafkaConfig(profile="low-latency", acks="all")
+        self.assertEqual(config.get("linger.ms"), 0)
+        self.assertEqual(config.get("acks"), "all")
+        self.assertEqual(KafkaConfig.PROFILES["low-latency"]["acks"], 1)
+        with self.assertRaises(ValueError):
+            KafkaConfig(profile="unknown")
+
+    def test_from_sources(self):
+        """Check the priority of the file, environment and overrides."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "producer.properties")
+            with open(path, "w") as file:
+                file.write(
+                    "# Producer settings\n\nlinger.ms=10\nacks = all\n"
+                    "bootstrap.servers=kafka1:9092,kafka2:9092\n"
+                )
+            environ = {
+                "RUCIOEVENTS_KAFKA_PROFILE": "throughput",
+                "RUCIOEVENTS_KAFKA_ACKS": "1",
+                "RUCIOEVENTS_KAFKA_BATCH_NUM_MESSAGES": "500",
+                "OTHER": "ignored",
+            }
+            config = KafkaConfig.from_sources(
+                config_file=path,
+                overrides={"batch.num.messages": "100"},
+                environ=environ,
+            )
+        self.assertEqual(config.profile, "throughput")
+        self.assertEqual(config.bootstrap_servers, ["kafka1:9092", "kafka2:9092"])
+        self.assertEqual(config.get("compression.type"), "lz4")
+        self.assertEqual(config.get("linger.ms"), "10")
+        self.assertEqual(config.get("acks"), "1")
+        self.assertEqual(config.get("batch.num.messages"), "100")
+        self.assertNotIn("other", config.complete_config())
+
+    def test_read_properties_invalid(self):
+        """Check lines without a value are refused."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "producer.properties")
+            with open(path, "w") as file:
+                file.write("linger.ms\n")
+            with self.assertRaises(ValueError):
+                read_properties(path)
+
     def test_str(self):
         """Check config string representation."""
         config = KafkaConfig(bootstrap_servers=["kafka1:9092"], client_id="my-client")
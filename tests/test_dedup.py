@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+import lsst.utils.tests
+from lsst.rucioevents.dedup import BloomFilter, DedupIndex
+from lsst.rucioevents.records import FilePayload, TransferEvent
+
+
+def make_events(names, rse="RSE"):
+    """Build the events of files of scope, with their destination RSE."""
+    return [
+        {"payload": {"scope": "scope", "name": name, "dst-rse": rse}} for name in names
+    ]
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_membership(self):
+        """Check added keys are found, and few others."""
+        bloom = BloomFilter(1000, error_rate=0.01)
+        self.assertFalse(bloom.add("key0"))
+        for index in range(1, 1000):
+            bloom.add(f"key{index}")
+        self.assertTrue(all(f"key{index}" in bloom for index in range(1000)))
+        false_positives = sum(f"other{index}" in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertTrue(bloom.add("key0"))
+
+
+class TestDedupIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "dedup.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_filter(self):
+        """Check duplicates are suppressed, per RSE."""
+        index = DedupIndex(capacity=100)
+        skipped = Counter()
+        events = make_events(["file1", "file2", "file1"])
+        self.assertEqual(list(index.filter(events, skipped)), events[:2])
+        self.assertEqual(skipped["duplicates"], 1)
+        events = make_events(["file2", "file3"]) + make_events(["file2"], rse="OTHER")
+        self.assertEqual(list(index.filter(events)), events[1:])
+        self.assertEqual(index.suppressed, 2)
+        self.assertEqual(index.checked, 6)
+        self.assertEqual(index.size, 0)
+        for key in ("scope:file1@RSE", "scope:file2@RSE"):
+            index.confirm(key)
+        self.assertEqual(index.size, 2)
+        index.close()
+
+    def test_records_and_events_without_did(self):
+        """Check records are indexed and events without file DID kept."""
+        index = DedupIndex(capacity=100)
+        payload = FilePayload(scope="scope", name="file1", dst_rse="RSE")
+        events = [TransferEvent(payload, "now"), {"payload": {}}, {"payload": {}}]
+        self.assertEqual(len(list(index.filter(events))), 3)
+        self.assertEqual(list(index.filter(make_events(["file1"]))), [])
+        index.close()
+
+    def test_persistence(self):
+        """Check the files emitted by a previous run are suppressed."""
+        index = DedupIndex(self.path, capacity=10)
+        for event in index.filter(make_events([f"file{i}" for i in range(50)])):
+            index.confirm(index.key(event))
+        index.close()
+
+        index = DedupIndex(self.path, capacity=10)
+        self.assertEqual(index.size, 50)
+        events = make_events([f"file{i}" for i in range(40, 60)])
+        self.assertEqual(list(index.filter(events)), events[10:])
+        self.assertEqual(index.suppressed, 10)
+        self.assertIn("10 duplicates suppressed", index.summary())
+        index.close()
+
+    def test_failed_delivery(self):
+        """Check the events not delivered are sent again, in this run or
+        the next one.
+        """
+        index = DedupIndex(self.path, capacity=10)
+        events = make_events(["file1", "file2", "file3"])
+        self.assertEqual(list(index.filter(events)), events)
+        index.release("scope:file1@RSE")
+        index.confirm("scope:file2@RSE")
+        # file1 failed, file3 was never delivered.
+        self.assertEqual(list(index.filter(events)), events[:1])
+        index.close()
+
+        index = DedupIndex(self.path, capacity=10)
+        self.assertEqual(index.size, 1)
+        self.assertEqual(list(index.filter(events)), [events[0], events[2]])
+        index.close()
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -1,47 +1,134 @@
+import os
 import unittest
 import argparse
+import asyncio
+import tempfile
 import lsst.utils.tests
-from unittest.mock import patch, mock_open
+from unittest.mock import MagicMock, patch, mock_open
+from rucio.common.exception import RucioException
 from lsst.rucioevents.dummy_event_generator import (
     parse_arguments,
     read_dids_from_file,
+    iter_dids_from_file,
     process_dids,
     main,
+    DID_SUCCEEDED,
+    DID_EMPTY,
+    DID_FAILED,
+    DID_SKIPPED,
+    DEFAULT_QUEUE_SIZE,
+    process_dids_async,
+    create_sink,
+    kafka_setting,
+    resolve_rses,
+    rse_topics,
 )
+from lsst.rucioevents.rucio_processor import RucioProcessor
+from lsst.rucioevents.kafka_producer import RucioKafkaProducer
+from lsst.rucioevents.cache import RucioCache
+from lsst.rucioevents.dedup import DedupIndex
+from lsst.rucioevents.expansion import ContainerExpander
+from lsst.rucioevents.fake_kafka import FakeProducer
+from lsst.rucioevents.fake_rucio import FakeRucioClient
+from lsst.rucioevents.journal import RunJournal
+from lsst.rucioevents.sinks import EventSink, JsonlFileSink, NullSink
+
+
+class FailingRucioClient(FakeRucioClient):
+    """Fake Rucio client whose ``failing`` method always fails."""
+
+    failing = None
+
+    def _call(self, method: str):
+        super()._call(method)
+        if method == self.failing:
+            raise RucioException(f"Simulated failure of {method}")
+
+
+def make_args(**kwargs):
+    """Build the namespace returned by parse_arguments with default options."""
+    defaults = dict(
+        dids=None,
+        file=None,
+        rse=["test_rse"],
+        topic=None,
+        verbose=False,
+        sink="kafka",
+        output=None,
+        sink_batch_size=EventSink.DEFAULT_BATCH_SIZE,
+        fast_json=False,
+        timestamp_granularity=0.0,
+        metadata_chunk_size=RucioProcessor.DEFAULT_METADATA_CHUNK_SIZE,
+        flush_timeout=RucioKafkaProducer.DEFAULT_FLUSH_TIMEOUT,
+        flush_each_message=False,
+        kafka_profile=None,
+        kafka_config=None,
+        kafka_settings=[],
+        key_strategy="did",
+        partitioner="default",
+        partitions=None,
+        workers=1,
+        pipeline=False,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        stream_window=None,
+        cache_dir=None,
+        cache_ttl=RucioCache.DEFAULT_TTL,
+        cache_max_size=1024,
+        journal=None,
+        journal_files=False,
+        resume=False,
+        dedup=False,
+        dedup_index=None,
+        dedup_capacity=DedupIndex.DEFAULT_CAPACITY,
+        expand_containers=False,
+        expansion_workers=ContainerExpander.DEFAULT_FAN_OUT,
+        replica_batch_size=None,
+        metrics_port=None,
+        metrics_address="127.0.0.1",
+        metrics_file=None,
+        progress_interval=10.0,
+        log_sample=0,
+        async_logging=False,
+        profile=None,
+        profile_top=25,
+        trace_memory=False,
+    )
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
 
 
 class TestDummyEventGenerator(unittest.TestCase):
     @patch("argparse.ArgumentParser.parse_args")
     def test_parse_arguments_dids(self, mock_parse_args):
         """Check parsing with --dids."""
-        mock_parse_args.return_value = argparse.Namespace(
+        mock_parse_args.return_value = make_args(
             dids=["scope1:name1", "scope2:name2"],
             file=None,
-            rse="test_rse",
+            rse=["test_rse"],
             topic=None,
             verbose=False,
         )
         args = parse_arguments()
         self.assertEqual(args.dids, ["scope1:name1", "scope2:name2"])
         self.assertIsNone(args.file)
-        self.assertEqual(args.rse, "test_rse")
+        self.assertEqual(args.rse, ["test_rse"])
         self.assertIsNone(args.topic)
         self.assertFalse(args.verbose)
 
     @patch("argparse.ArgumentParser.parse_args")
     def test_parse_arguments_file(self, mock_parse_args):
         """Check parsing with --file."""
-        mock_parse_args.return_value = argparse.Namespace(
+        mock_parse_args.return_value = make_args(
             dids=None,
             file="test_file.txt",
-            rse="test_rse",
+            rse=["test_rse"],
             topic="test_topic",
             verbose=True,
         )
         args = parse_arguments()
         self.assertIsNone(args.dids)
         self.assertEqual(args.file, "test_file.txt")
-        self.assertEqual(args.rse, "test_rse")
+        self.assertEqual(args.rse, ["test_rse"])
         self.assertEqual(args.topic, "test_topic")
         self.assertTrue(args.verbose)
 
@@ -69,54 +156,495 @@ class TestDummyEventGenerator(unittest.TestCase):
         topic = "test_topic"
 
         mock_processor_instance = mock_processor.return_value
-        mock_processor_instance.get_payload.return_value = {"test": "payload"}
+        mock_processor_instance.lookup_errors = 0
+        mock_processor_instance.get_payload_records.return_value = {"test": "payload"}
 
         mock_event_instance = mock_event.return_value
-        mock_event_instance.process_metadata.return_value = [{"event": "data"}]
+        mock_event_instance.process_metadata_records.return_value = [{"event": "data"}]
 
         process_dids(dids, rse, topic)
 
         self.assertEqual(mock_processor.call_count, 2)
-        mock_processor.assert_any_call("scope1", "name1", rse, mock_client.return_value)
-        mock_processor.assert_any_call("scope2", "name2", rse, mock_client.return_value)
+        mock_processor.assert_any_call(
+            "scope1",
+            "name1",
+            rse,
+            mock_client.return_value,
+            metadata_chunk_size=RucioProcessor.DEFAULT_METADATA_CHUNK_SIZE,
+            cache=None,
+            replicas=None,
+        )
+        mock_processor.assert_any_call(
+            "scope2",
+            "name2",
+            rse,
+            mock_client.return_value,
+            metadata_chunk_size=RucioProcessor.DEFAULT_METADATA_CHUNK_SIZE,
+            cache=None,
+            replicas=None,
+        )
 
         self.assertEqual(mock_event.call_count, 2)
-        mock_event.assert_called_with({"test": "payload"})
+        mock_event.assert_called_with({"test": "payload"}, timestamp_granularity=0.0)
 
         mock_kafka_producer.return_value.send_event.assert_called_with(
             [{"event": "data"}]
         )
 
+    @patch("lsst.rucioevents.dummy_event_generator.RucioKafkaProducer")
+    @patch("lsst.rucioevents.dummy_event_generator.KafkaEvent")
+    @patch("lsst.rucioevents.dummy_event_generator.RucioProcessor")
+    @patch("lsst.rucioevents.dummy_event_generator.Client")
+    def test_process_dids_workers(
+        self, mock_client, mock_processor, mock_event, mock_kafka_producer
+    ):
+        """Check concurrent DID analysis and outcome summary."""
+        payloads = {"name1": {"test": "payload"}, "name2": {}}
+
+        def make_processor(scope, name, rse, client, **kwargs):
+            processor = MagicMock(lookup_errors=0)
+            processor.get_payload_records.return_value = payloads[name]
+            return processor
+
+        def send_event(events):
+            return len(events)
+
+        mock_processor.side_effect = make_processor
+        mock_kafka_producer.return_value.send_event.side_effect = send_event
+        dids = ["scope1:name1", "scope1:name2", "not_a_did"]
+        summary = process_dids(dids, "test_rse", "test_topic", workers=3)
+
+        self.assertEqual(summary[DID_SUCCEEDED], 1)
+        self.assertEqual(summary[DID_EMPTY], 1)
+        self.assertEqual(summary[DID_FAILED], 1)
+        self.assertEqual(mock_kafka_producer.call_count, 1)
+        mock_kafka_producer.return_value.send_event.assert_called_once()
+
+    @patch("argparse.ArgumentParser.error")
+    @patch("argparse.ArgumentParser.parse_args")
+    def test_parse_arguments_resume_without_journal(self, mock_parse_args, mock_error):
+        """Check --resume requires --journal."""
+        mock_parse_args.return_value = make_args(dids=["scope1:name1"], resume=True)
+        parse_arguments()
+        mock_error.assert_called_once()
+
+    @patch("argparse.ArgumentParser.error")
+    @patch("argparse.ArgumentParser.parse_args")
+    def test_parse_arguments_file_sink_without_output(
+        self, mock_parse_args, mock_error
+    ):
+        """Check --sink file requires --output."""
+        mock_parse_args.return_value = make_args(dids=["scope1:name1"], sink="file")
+        parse_arguments()
+        mock_error.assert_called_once()
+
+    @patch("argparse.ArgumentParser.error")
+    @patch("argparse.ArgumentParser.parse_args")
+    def test_parse_arguments_pipeline_with_stream_window(
+        self, mock_parse_args, mock_error
+    ):
+        """Check --pipeline cannot be used with --stream-window."""
+        mock_parse_args.return_value = make_args(
+            dids=["scope1:name1"], pipeline=True, stream_window=10
+        )
+        parse_arguments()
+        mock_error.assert_called_once()
+
+    def test_create_sink(self):
+        """Check the sinks selected by name."""
+        self.assertIsInstance(create_sink("null", "test_topic"), NullSink)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sink = create_sink(
+                "file", "test_topic", output=os.path.join(tmpdir, "events.jsonl")
+            )
+            self.assertIsInstance(sink, JsonlFileSink)
+            sink.close()
+        with self.assertRaises(ValueError):
+            create_sink("unknown", "test_topic")
+
+    @patch("lsst.rucioevents.dummy_event_generator.RucioProcessor")
+    @patch("lsst.rucioevents.dummy_event_generator.Client")
+    def test_process_dids_sink(self, mock_client, mock_processor):
+        """Check the events are written to the given sink."""
+        mock_processor.return_value.lookup_errors = 0
+        mock_processor.return_value.get_payload_records.return_value = {
+            "file1": {"name": "file1"},
+            "file2": {"name": "file2"},
+        }
+        sink = NullSink()
+        summary = process_dids(["scope1:name1"], "test_rse", "test_topic", sink=sink)
+        self.assertEqual(summary[DID_SUCCEEDED], 1)
+        self.assertEqual(sink.delivered, 2)
+
+    def test_process_dids_dedup(self):
+        """Check the files of DIDs listed twice are sent once."""
+        client = FakeRucioClient(n_datasets=2, files_per_dataset=5)
+        dids = client.dids() + client.dids()[:1]
+        for stream_window in (None, 2):
+            sink = NullSink()
+            dedup = DedupIndex(capacity=100)
+            summary = process_dids(
+                dids,
+                "FAKE_RSE",
+                "test_topic",
+                client_factory=lambda: client,
+                sink=sink,
+                stream_window=stream_window,
+                dedup=dedup,
+            )
+            self.assertEqual(summary[DID_SUCCEEDED], 3)
+            self.assertEqual(sink.delivered, 10)
+            self.assertEqual(dedup.suppressed, 5)
+            dedup.close()
+
+    def test_process_dids_dedup_failed_delivery(self):
+        """Check the events whose delivery failed are sent by the next run."""
+        client = FakeRucioClient(n_datasets=1, files_per_dataset=10)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "dedup.sqlite")
+            for error_rate, delivered in ((1.0, 0), (0.0, 10)):
+                dedup = DedupIndex(path, capacity=100)
+                sink = RucioKafkaProducer(
+                    "test_topic",
+                    producer=FakeProducer(error_rate=error_rate),
+                    dedup=dedup,
+                )
+                process_dids(
+                    client.dids(),
+                    "FAKE_RSE",
+                    "test_topic",
+                    client_factory=lambda: client,
+                    sink=sink,
+                    dedup=dedup,
+                )
+                sink.close()
+                self.assertEqual(sink.delivered, delivered)
+                self.assertEqual(dedup.suppressed, 0)
+                dedup.close()
+            dedup = DedupIndex(path, capacity=100)
+            self.assertEqual(dedup.size, 10)
+            dedup.close()
+
+    @patch("lsst.rucioevents.dummy_event_generator.RucioKafkaProducer")
+    @patch("lsst.rucioevents.dummy_event_generator.RucioProcessor")
+    @patch("lsst.rucioevents.dummy_event_generator.Client")
+    def test_process_dids_resume(self, mock_client, mock_processor, mock_kafka_producer):
+        """Check completed DIDs and delivered files are skipped on resume."""
+        payload = {
+            f"file{i}": {
+                "name": f"file{i}",
+                "scope": "scope1",
+                "dataset": "name1",
+                "datasetScope": "scope1",
+            }
+            for i in range(3)
+        }
+        mock_processor.return_value.lookup_errors = 0
+        mock_processor.return_value.get_payload_records.return_value = payload
+        sent = []
+
+        def send_event(events):
+            events = list(events)
+            sent.extend(events)
+            for event in events:
+                journal.record_file("scope1:name1", f"scope1:{event['payload']['name']}")
+            return len(events)
+
+        mock_kafka_producer.return_value.send_event.side_effect = send_event
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "journal.txt")
+            with open(path, "w") as journal_file:
+                journal_file.write("did\tscope2:name2\nfile\tscope1:name1\tscope1:file1\n")
+            journal = RunJournal(path, resume=True, track_files=True)
+            summary = process_dids(
+                ["scope1:name1", "scope2:name2"], "test_rse", "test_topic", journal=journal
+            )
+            journal.close()
+            resumed = RunJournal(path, resume=True)
+            self.assertTrue(resumed.is_done("scope1:name1"))
+            resumed.close()
+
+        self.assertEqual(summary[DID_SUCCEEDED], 1)
+        self.assertEqual(summary[DID_SKIPPED], 1)
+        self.assertEqual(mock_processor.call_count, 1)
+        self.assertEqual([event["payload"]["name"] for event in sent], ["file0", "file2"])
+
+    def test_process_dids_resume_failed_lookup(self):
+        """Check DIDs whose Rucio lookups failed are not recorded, and are
+        processed again on resume.
+        """
+        client = FailingRucioClient(n_datasets=1, files_per_dataset=5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "journal.txt")
+            for failing in ("list_replicas", "get_metadata_bulk", None):
+                client.failing = failing
+                journal = RunJournal(path, resume=True)
+                sink = NullSink()
+                summary = process_dids(
+                    client.dids(),
+                    "FAKE_RSE",
+                    "test_topic",
+                    journal=journal,
+                    client_factory=lambda: client,
+                    sink=sink,
+                )
+                journal.close()
+                if failing:
+                    self.assertEqual(summary[DID_FAILED], 1)
+                    self.assertEqual(summary[DID_EMPTY], 0)
+            self.assertEqual(summary[DID_SUCCEEDED], 1)
+            self.assertEqual(sink.delivered, 5)
+            client.failing = "list_replicas"
+            outcomes = asyncio.run(
+                process_dids_async(
+                    client.dids(),
+                    "FAKE_RSE",
+                    "test_topic",
+                    client_factory=lambda: client,
+                    sink=NullSink(),
+                )
+            )
+            self.assertEqual(outcomes[DID_FAILED], 1)
+
+    @patch(
+        "builtins.open",
+        new_callable=mock_open,
+        read_data="scope1:name1\n\nscope2:name2\n",
+    )
+    def test_iter_dids_from_file(self, mock_file):
+        """Check lazy reading of DIDs from a file."""
+        dids = iter_dids_from_file("test_file.txt")
+        mock_file.assert_not_called()
+        self.assertEqual(list(dids), ["scope1:name1", "scope2:name2"])
+
+    @patch("lsst.rucioevents.dummy_event_generator.RucioKafkaProducer")
+    @patch("lsst.rucioevents.dummy_event_generator.RucioProcessor")
+    @patch("lsst.rucioevents.dummy_event_generator.Client")
+    def test_process_dids_stream(self, mock_client, mock_processor, mock_kafka_producer):
+        """Check streaming DIDs, payloads and events."""
+        mock_processor.return_value.lookup_errors = 0
+        mock_processor.return_value.iter_payload_records.side_effect = lambda window: iter(
+            [("file1", {"name": "file1"}), ("file2", {"name": "file2"})]
+        )
+        sent = []
+
+        def send_event(events):
+            sent.extend(events)
+            return len(sent)
+
+        mock_kafka_producer.return_value.send_event.side_effect = send_event
+        summary = process_dids(
+            iter(["scope1:name1"]), "test_rse", "test_topic", stream_window=10
+        )
+        self.assertEqual(summary[DID_SUCCEEDED], 1)
+        mock_processor.return_value.iter_payload_records.assert_called_once_with(10)
+        mock_processor.return_value.get_payload_records.assert_not_called()
+        self.assertEqual([event["payload"]["name"] for event in sent], ["file1", "file2"])
+
+    @patch("lsst.rucioevents.dummy_event_generator.RucioKafkaProducer")
+    @patch("lsst.rucioevents.dummy_event_generator.RucioProcessor")
+    @patch("lsst.rucioevents.dummy_event_generator.Client")
+    def test_process_dids_async(self, mock_client, mock_processor, mock_kafka_producer):
+        """Check the asyncio pipeline."""
+        payloads = {
+            "name1": {"file1": {"name": "file1"}, "file2": {"name": "file2"}},
+            "name2": {},
+        }
+
+        def make_processor(scope, name, rse, client, **kwargs):
+            processor = MagicMock(lookup_errors=0)
+            processor._names_on_rse.return_value = list(payloads[name])
+            processor._join_replicas.return_value = payloads[name]
+            return processor
+
+        mock_processor.side_effect = make_processor
+        dids = ["scope1:name1", "scope1:name2", "not_a_did"]
+        outcomes = asyncio.run(
+            process_dids_async(dids, "test_rse", "test_topic", workers=2, queue_size=1)
+        )
+        self.assertEqual(outcomes[DID_SUCCEEDED], 1)
+        self.assertEqual(outcomes[DID_EMPTY], 1)
+        self.assertEqual(outcomes[DID_FAILED], 1)
+        send_event = mock_kafka_producer.return_value.send_event
+        send_event.assert_called_once()
+        events = send_event.call_args.args[0]
+        self.assertEqual(
+            [event["payload"]["name"] for event in events], ["file1", "file2"]
+        )
+
+    @patch("lsst.rucioevents.dummy_event_generator.create_sink")
+    @patch("lsst.rucioevents.dummy_event_generator.process_dids_async")
+    @patch("lsst.rucioevents.dummy_event_generator.parse_arguments")
+    def test_main_pipeline(
+        self, mock_parse_args, mock_process_dids_async, mock_create_sink
+    ):
+        """Check Process with --pipeline."""
+        mock_parse_args.return_value = make_args(
+            dids=["scope1:name1"], pipeline=True, queue_size=4
+        )
+
+        async def fake_pipeline(*args, **kwargs):
+            return None
+
+        mock_process_dids_async.side_effect = fake_pipeline
+        main()
+        args, kwargs = mock_process_dids_async.call_args
+        self.assertEqual(args, (["scope1:name1"], "test_rse", "test_rse"))
+        self.assertEqual(kwargs["queue_size"], 4)
+        self.assertIs(kwargs["sink"], mock_create_sink.return_value)
+        mock_create_sink.return_value.close.assert_called_once()
+
+    @patch("lsst.rucioevents.dummy_event_generator.create_sink")
     @patch("lsst.rucioevents.dummy_event_generator.process_dids")
     @patch("lsst.rucioevents.dummy_event_generator.read_dids_from_file")
     @patch("lsst.rucioevents.dummy_event_generator.parse_arguments")
-    def test_main_dids(self, mock_parse_args, mock_read_dids, mock_process_dids):
+    def test_main_dids(
+        self, mock_parse_args, mock_read_dids, mock_process_dids, mock_create_sink
+    ):
         """Check Process passing --dids."""
-        mock_parse_args.return_value = argparse.Namespace(
-            dids=["scope1:name1"], file=None, rse="test_rse", topic=None, verbose=False
-        )
+        mock_parse_args.return_value = make_args(dids=["scope1:name1"])
         main()
-        mock_process_dids.assert_called_once_with(
-            ["scope1:name1"], "test_rse", "test_rse"
+        mock_process_dids.assert_called_once()
+        args, kwargs = mock_process_dids.call_args
+        self.assertEqual(args, (["scope1:name1"], "test_rse", "test_rse"))
+        self.assertEqual(
+            kwargs["metadata_chunk_size"], RucioProcessor.DEFAULT_METADATA_CHUNK_SIZE
         )
+        self.assertIs(kwargs["sink"], mock_create_sink.return_value)
+        self.assertEqual(mock_create_sink.call_args.args, ("kafka", "test_rse"))
+        self.assertFalse(mock_create_sink.call_args.kwargs["flush_each"])
+
+    @patch("lsst.rucioevents.dummy_event_generator.create_sink")
+    @patch("lsst.rucioevents.dummy_event_generator.process_dids")
+    @patch("lsst.rucioevents.dummy_event_generator.parse_arguments")
+    def test_main_failure_closes(
+        self, mock_parse_args, mock_process_dids, mock_create_sink
+    ):
+        """Check the sink and the journal are closed when the run fails."""
+        mock_process_dids.side_effect = RuntimeError("Simulated failure")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mock_parse_args.return_value = make_args(
+                dids=["scope1:name1"], journal=os.path.join(tmpdir, "run.journal")
+            )
+            with patch.object(
+                RunJournal, "close", autospec=True, side_effect=RunJournal.close
+            ) as mock_close:
+                with self.assertRaises(RuntimeError):
+                    main()
+        mock_create_sink.return_value.close.assert_called_once()
+        mock_close.assert_called_once()
 
+    @patch("lsst.rucioevents.dummy_event_generator.create_sink")
     @patch("lsst.rucioevents.dummy_event_generator.process_dids")
     @patch("lsst.rucioevents.dummy_event_generator.read_dids_from_file")
     @patch("lsst.rucioevents.dummy_event_generator.parse_arguments")
-    def test_main_file(self, mock_parse_args, mock_read_dids, mock_process_dids):
+    def test_main_file(
+        self, mock_parse_args, mock_read_dids, mock_process_dids, mock_create_sink
+    ):
         """Check Process passing --file."""
-        mock_parse_args.return_value = argparse.Namespace(
-            dids=None,
+        mock_parse_args.return_value = make_args(
             file="test_file.txt",
-            rse="test_rse",
             topic="test_topic",
-            verbose=False,
+            metadata_chunk_size=100,
+            flush_timeout=5.0,
+            workers=4,
         )
         mock_read_dids.return_value = ["scope1:name1"]
         main()
-        mock_process_dids.assert_called_once_with(
-            ["scope1:name1"], "test_rse", "test_topic"
+        mock_process_dids.assert_called_once()
+        args, kwargs = mock_process_dids.call_args
+        self.assertEqual(args, (["scope1:name1"], "test_rse", "test_topic"))
+        self.assertEqual(kwargs["metadata_chunk_size"], 100)
+        self.assertEqual(mock_create_sink.call_args.kwargs["flush_timeout"], 5.0)
+        self.assertEqual(kwargs["workers"], 4)
+
+    @patch("lsst.rucioevents.dummy_event_generator.create_sink")
+    @patch("lsst.rucioevents.dummy_event_generator.process_dids")
+    @patch("lsst.rucioevents.dummy_event_generator.parse_arguments")
+    def test_main_kafka_profile(
+        self, mock_parse_args, mock_process_dids, mock_create_sink
+    ):
+        """Check the Kafka profile and settings of the command line."""
+        mock_parse_args.return_value = make_args(
+            dids=["scope1:name1"],
+            kafka_profile="throughput",
+            kafka_settings=[("linger.ms", "5")],
         )
+        main()
+        config = mock_create_sink.call_args.kwargs["kafka_config"]
+        self.assertEqual(config.profile, "throughput")
+        self.assertEqual(config.get("linger.ms"), "5")
+        self.assertEqual(config.get("compression.type"), "lz4")
+
+    @patch("lsst.rucioevents.dummy_event_generator.create_sink")
+    @patch("lsst.rucioevents.dummy_event_generator.process_dids")
+    @patch("lsst.rucioevents.dummy_event_generator.parse_arguments")
+    def test_main_multiple_rses(
+        self, mock_parse_args, mock_process_dids, mock_create_sink
+    ):
+        """Check several RSEs are processed together, each with its topic."""
+        mock_parse_args.return_value = make_args(
+            dids=["scope1:name1"], rse=["RSE_A", "RSE_B"], topic="events-{rse}"
+        )
+        main()
+        args, _ = mock_process_dids.call_args
+        self.assertEqual(args, (["scope1:name1"], ["RSE_A", "RSE_B"], "events-RSE_A"))
+        self.assertEqual(
+            mock_create_sink.call_args.kwargs["topics"],
+            {"RSE_A": "events-RSE_A", "RSE_B": "events-RSE_B"},
+        )
+
+    @patch("lsst.rucioevents.dummy_event_generator.create_sink")
+    @patch("lsst.rucioevents.dummy_event_generator.process_dids")
+    @patch("lsst.rucioevents.dummy_event_generator.parse_arguments")
+    def test_main_metrics_file(
+        self, mock_parse_args, mock_process_dids, mock_create_sink
+    ):
+        """Check the metrics are written at the end of the run."""
+        mock_create_sink.return_value = NullSink()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "rucioevents.prom")
+            mock_parse_args.return_value = make_args(
+                dids=["scope1:name1"], metrics_file=path
+            )
+            main()
+            with open(path) as metrics_file:
+                metrics = metrics_file.read()
+        self.assertIn("# TYPE rucioevents_rucio_call_seconds histogram", metrics)
+        self.assertIn('rucioevents_queue_depth{queue="sink"} 0', metrics)
+
+    @patch("lsst.rucioevents.dummy_event_generator.create_sink")
+    @patch("lsst.rucioevents.dummy_event_generator.process_dids")
+    @patch("lsst.rucioevents.dummy_event_generator.parse_arguments")
+    def test_main_profile(self, mock_parse_args, mock_process_dids, mock_create_sink):
+        """Check the run is profiled with --profile."""
+        mock_create_sink.return_value = NullSink()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "profile.txt")
+            mock_parse_args.return_value = make_args(
+                dids=["scope1:name1"], profile=path
+            )
+            main()
+            with open(path) as report_file:
+                report = report_file.read()
+            self.assertTrue(os.path.exists(f"{path}.pstats"))
+        self.assertIn("Time by component: rucio", report)
+        self.assertIn("run", report)
+
+    def test_resolve_rses(self):
+        """Check RSE expressions are resolved, and the topics of the RSEs."""
+        client = FakeRucioClient(rses=["RSE_A", "RSE_B", "RSE_C"])
+        rses = resolve_rses(["RSE_B", "RSE_A|RSE_B"], lambda: client)
+        self.assertEqual(rses, ["RSE_B", "RSE_A"])
+        self.assertEqual(client.calls["list_rses"], 1)
+        self.assertEqual(rse_topics(rses), {"RSE_B": "RSE_B", "RSE_A": "RSE_A"})
+        self.assertEqual(rse_topics(["RSE_A"], "topic"), {"RSE_A": "topic"})
+
+    def test_kafka_setting(self):
+        """Check the parsing of -X settings."""
+        self.assertEqual(kafka_setting("linger.ms = 5"), ("linger.ms", "5"))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            kafka_setting("linger.ms")
 
 
 class MemoryTester(lsst.utils.tests.MemoryTestCase):
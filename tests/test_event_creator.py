@@ -1,8 +1,10 @@
+import json
 import unittest
 import lsst.utils.tests
 from datetime import datetime
 from unittest.mock import patch
 from lsst.rucioevents.event_creator import KafkaEvent
+from lsst.rucioevents.records import FilePayload, TransferEvent
 
 
 class TestKafkaEvent(unittest.TestCase):
@@ -55,6 +57,30 @@ class TestKafkaEvent(unittest.TestCase):
 
         mock_logger.assert_called_once_with("Generating dummy events")
 
+    def test_process_metadata_dicts(self):
+        """Check the events are dictionaries, and the records of the hot path
+        equal to them.
+        """
+        events = KafkaEvent(
+            {"file1.txt": FilePayload.from_dict(self.dummy_metadata["file1.txt"])}
+        ).process_metadata()
+        self.assertIs(type(events[0]), dict)
+        self.assertIs(type(events[0]["payload"]), dict)
+        decoded = json.loads(json.dumps(events[0]))
+        self.assertEqual(decoded["payload"]["dst-url"], "test_url")
+        events[0]["key"] = "test_key"
+        records = self.kafka_event.process_metadata_records()
+        self.assertIsInstance(records[0], TransferEvent)
+        self.assertEqual(records[0]["payload"], self.dummy_metadata["file1.txt"])
+
+    def test_iter_events(self):
+        """Check lazy events creation from a stream of payloads."""
+        kafka_event = KafkaEvent(iter(self.dummy_metadata.items()))
+        events = kafka_event.iter_events()
+        self.assertEqual(
+            [event["payload"]["name"] for event in events], ["file1.txt", "file2.txt"]
+        )
+
     def test_create_file_event(self):
         """Check single file event."""
         file_meta = {
@@ -74,6 +100,20 @@ class TestKafkaEvent(unittest.TestCase):
             datetime.strptime(event["created_at"], KafkaEvent.DATE_FORMAT), datetime
         )
 
+    @patch("lsst.rucioevents.event_creator.time.monotonic")
+    def test_timestamp_granularity(self, mock_monotonic):
+        """Check events share their creation time within the granularity."""
+        mock_monotonic.side_effect = [0.0, 0.5, 1.5, 2.0]
+        kafka_event = KafkaEvent(
+            iter(list(self.dummy_metadata.items()) * 2), timestamp_granularity=1.0
+        )
+        with patch("lsst.rucioevents.event_creator.datetime") as mock_datetime:
+            mock_datetime.now.return_value.strftime.side_effect = ["t0", "t1"]
+            events = list(kafka_event.iter_events())
+        self.assertEqual(
+            [event["created_at"] for event in events], ["t0", "t0", "t1", "t1"]
+        )
+
     def test_get_template(self):
         """Check get_template method."""
         template = KafkaEvent._get_template()
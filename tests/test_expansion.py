@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+import lsst.utils.tests
+from lsst.rucioevents.cache import RucioCache
+from lsst.rucioevents.expansion import ContainerExpander, ReplicaBatcher
+from lsst.rucioevents.fake_rucio import FakeRucioClient
+from lsst.rucioevents.rucio_processor import RucioProcessor
+from lsst.rucioevents.utils import AdaptiveChunkSize
+
+
+class TestAdaptiveChunkSize(unittest.TestCase):
+    def test_update(self):
+        """Check the size follows the duration of the calls."""
+        chunk_size = AdaptiveChunkSize(10, minimum=2, maximum=30, target=1.0)
+        self.assertEqual(chunk_size.update(0.1), 20)
+        self.assertEqual(chunk_size.update(0.8), 25)
+        self.assertEqual(chunk_size.update(0.1), 30)
+        self.assertEqual(chunk_size.update(10.0), 15)
+        self.assertEqual(chunk_size.update(1.5), 10)
+        for _ in range(5):
+            chunk_size.update(10.0)
+        self.assertEqual(chunk_size.value, 2)
+
+
+class TestContainerExpander(unittest.TestCase):
+    def test_expand(self):
+        """Check nested containers are walked, each dataset yielded once."""
+        client = FakeRucioClient(
+            n_datasets=7, files_per_dataset=1, datasets_per_container=3
+        )
+        expander = ContainerExpander(lambda: client, fan_out=2)
+        dids = [
+            "test:container_all",
+            "test:dataset_000001",
+            "test:container_000002",
+            "test:unknown",
+            "test:container_all",
+        ]
+        datasets = list(expander.expand(iter(dids)))
+        self.assertEqual(sorted(datasets), sorted(client.dids() + ["test:unknown"]))
+        self.assertEqual(expander.counts["containers"], 4)
+        self.assertEqual(expander.counts["dataset"], 7)
+        self.assertEqual(expander.counts["errors"], 1)
+        self.assertEqual(client.calls["list_content"], 4)
+
+    def test_no_container(self):
+        """Check datasets are yielded unchanged."""
+        client = FakeRucioClient(n_datasets=2)
+        expander = ContainerExpander(lambda: client)
+        self.assertEqual(sorted(expander.expand(client.dids())), client.dids())
+        self.assertEqual(client.calls["list_content"], 0)
+
+
+class TestReplicaBatcher(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeRucioClient(
+            n_datasets=7, files_per_dataset=20, replica_fraction=0.5
+        )
+
+    def expected(self, did):
+        """Look up the replicas of a single DID."""
+        scope, name = did.split(":")
+        client = FakeRucioClient(
+            n_datasets=7, files_per_dataset=20, replica_fraction=0.5
+        )
+        return RucioProcessor(scope, name, "FAKE_RSE", client)._get_replicas()
+
+    def test_iter_replicas(self):
+        """Check grouped lookups match the lookups of each DID."""
+        batcher = ReplicaBatcher(
+            self.client, "FAKE_RSE", AdaptiveChunkSize(2, maximum=4)
+        )
+        results = list(batcher.iter_replicas(iter(self.client.dids())))
+        self.assertEqual([did for did, _ in results], self.client.dids())
+        for did, replicas in results:
+            self.assertEqual(replicas, self.expected(did))
+        # 2 DIDs, then 4, then the last one.
+        self.assertEqual(self.client.calls["list_replicas"], 3)
+        self.assertEqual(batcher.fallbacks, 0)
+
+    def test_multiple_rses(self):
+        """Check the replicas of several RSEs are looked up together."""
+        client = FakeRucioClient(
+            n_datasets=3, files_per_dataset=20, rses=["A", "B"], replica_fraction=0.5
+        )
+        batcher = ReplicaBatcher(client, ["A", "B"], AdaptiveChunkSize(3))
+        for did, replicas in batcher.iter_replicas(client.dids()):
+            scope, name = did.split(":")
+            self.assertEqual(
+                replicas, RucioProcessor(scope, name, ["A", "B"], client)._get_replicas()
+            )
+        # One grouped lookup, then one for each DID checked.
+        self.assertEqual(client.calls["list_replicas"], 4)
+
+    def test_fallback(self):
+        """Check a chunk with an unknown DID is left to single lookups."""
+        batcher = ReplicaBatcher(self.client, "FAKE_RSE", AdaptiveChunkSize(2))
+        dids = ["test:dataset_000000", "test:unknown", "invalid", "test:dataset_000001"]
+        results = dict(batcher.iter_replicas(dids))
+        self.assertIsNone(results["test:dataset_000000"])
+        self.assertIsNone(results["invalid"])
+        self.assertEqual(
+            results["test:dataset_000001"], self.expected("test:dataset_000001")
+        )
+        self.assertEqual(batcher.fallbacks, 2)
+
+    def test_cache(self):
+        """Check cached replicas are not requested again."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = RucioCache(os.path.join(tmpdir, "cache"))
+            dids = self.client.dids()[:3]
+            first = list(
+                ReplicaBatcher(
+                    self.client, "FAKE_RSE", AdaptiveChunkSize(5), cache
+                ).iter_replicas(dids)
+            )
+            second = list(
+                ReplicaBatcher(
+                    self.client, "FAKE_RSE", AdaptiveChunkSize(5), cache
+                ).iter_replicas(dids)
+            )
+            cache.close()
+        self.assertEqual(first, second)
+        self.assertEqual(self.client.calls["list_replicas"], 1)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
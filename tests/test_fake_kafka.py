@@ -0,0 +1,71 @@
+import unittest
+import lsst.utils.tests
+from unittest.mock import MagicMock
+from lsst.rucioevents.fake_kafka import FakeProducer
+from lsst.rucioevents.kafka_producer import RucioKafkaProducer
+
+
+class TestFakeProducer(unittest.TestCase):
+    def test_produce_and_deliver(self):
+        """Check callbacks are served by poll and flush."""
+        producer = FakeProducer(partitions=4)
+        callback = MagicMock()
+        for index in range(3):
+            producer.produce(
+                "topic", value=b"value", key=f"key{index}", callback=callback
+            )
+        self.assertEqual(len(producer), 3)
+        self.assertEqual(producer.flush(), 0)
+        self.assertEqual(callback.call_count, 3)
+        errmsg, message = callback.call_args.args
+        self.assertIsNone(errmsg)
+        self.assertEqual(message.topic(), "topic")
+        self.assertEqual(producer.delivered, 3)
+        self.assertEqual(producer.bytes, 15)
+
+    def test_queue_full(self):
+        """Check BufferError on a full queue."""
+        producer = FakeProducer(queue_size=1)
+        producer.produce("topic", value=b"value")
+        with self.assertRaises(BufferError):
+            producer.produce("topic", value=b"value")
+        producer.poll(0)
+        producer.produce("topic", value=b"value")
+
+    def test_from_config(self):
+        """Check the producer follows the librdkafka settings."""
+        producer = FakeProducer.from_config(
+            {"linger.ms": 20, "batch.num.messages": 2, "queue.buffering.max.messages": 8},
+            request_time=0.01,
+            max_in_flight=1,
+        )
+        self.assertEqual(producer.latency, 0.02)
+        self.assertEqual(producer.queue_size, 8)
+        for _ in range(4):
+            producer.produce("topic", value=b"value")
+        self.assertEqual(producer.poll(0), 0)
+        self.assertEqual(producer.flush(), 0)
+        self.assertEqual(producer.delivered, 4)
+        # Two requests after the linger time, for each message.
+        self.assertGreaterEqual(producer.delivery_latency, 4 * 0.04)
+
+    def test_list_topics(self):
+        """Check the topic metadata lists the partitions."""
+        metadata = FakeProducer(partitions=3).list_topics("topic")
+        self.assertEqual(list(metadata.topics["topic"].partitions), [0, 1, 2])
+
+    def test_with_rucio_producer(self):
+        """Check RucioKafkaProducer against the fake producer."""
+        producer = FakeProducer(queue_size=2, error_rate=0.5)
+        sender = RucioKafkaProducer("topic", producer=producer)
+        sender.send_event([{"key": f"key{index}"} for index in range(10)])
+        self.assertEqual(sender.delivered + sender.failed, 10)
+        self.assertEqual(sender.delivered, producer.delivered)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
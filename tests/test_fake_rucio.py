@@ -0,0 +1,215 @@
+import asyncio
+import unittest
+import lsst.utils.tests
+from unittest.mock import patch
+from rucio.common.exception import DataIdentifierNotFound, RucioException
+from lsst.rucioevents.fake_kafka import FakeProducer
+from lsst.rucioevents.fake_rucio import FakeRucioClient
+from lsst.rucioevents.kafka_producer import RucioKafkaProducer
+from lsst.rucioevents.records import FilePayload
+from lsst.rucioevents.rucio_processor import RucioProcessor
+from lsst.rucioevents.dummy_event_generator import (
+    process_dids,
+    process_dids_async,
+    DID_SUCCEEDED,
+)
+from lsst.rucioevents.sinks import NullSink
+
+
+class TestFakeRucioClient(unittest.TestCase):
+    def setUp(self):
+        """Create a small catalogue."""
+        self.client = FakeRucioClient(
+            scope="raw", n_datasets=2, files_per_dataset=10, rses=["RSE_A", "RSE_B"]
+        )
+
+    def test_catalogue(self):
+        """Check datasets, files and metadata."""
+        self.assertEqual(
+            self.client.dids(), ["raw:dataset_000000", "raw:dataset_000001"]
+        )
+        files = list(self.client.list_files("raw", "dataset_000001"))
+        self.assertEqual(len(files), 10)
+        metas = self.client.get_metadata("raw", files[0]["name"], plugin="ALL")
+        self.assertEqual(metas["name"], files[0]["name"])
+        self.assertIn("rubin_sidecar", metas)
+        bulk = list(self.client.get_metadata_bulk(files, plugin="ALL"))
+        self.assertEqual([meta["name"] for meta in bulk], [f["name"] for f in files])
+        self.assertEqual(self.client.calls["list_files"], 1)
+
+    def test_unknown_did(self):
+        """Check missing DIDs."""
+        with self.assertRaises(DataIdentifierNotFound):
+            list(self.client.list_files("raw", "dataset_000002"))
+        with self.assertRaises(DataIdentifierNotFound):
+            self.client.get_did("other", "dataset_000000")
+
+    def test_replicas(self):
+        """Check replicas are filtered by RSE and fraction."""
+        client = FakeRucioClient(files_per_dataset=1000, replica_fraction=0.5)
+        replicas = list(
+            client.list_replicas(
+                [{"scope": "test", "name": "dataset_000000"}], rse_expression="FAKE_RSE"
+            )
+        )
+        self.assertTrue(300 < len(replicas) < 700)
+        again = list(
+            client.list_replicas(
+                [{"scope": "test", "name": "dataset_000000"}], rse_expression="FAKE_RSE"
+            )
+        )
+        self.assertEqual(replicas, again)
+        self.assertEqual(
+            list(
+                client.list_replicas(
+                    [{"scope": "test", "name": "dataset_000000"}], "NONE"
+                )
+            ),
+            [],
+        )
+
+    def test_containers(self):
+        """Check containers, their content and the replica parents."""
+        client = FakeRucioClient(n_datasets=5, files_per_dataset=2, datasets_per_container=2)
+        self.assertEqual(client.container_names(), [f"container_{i:06d}" for i in range(3)])
+        self.assertEqual(client.get_did("test", "container_all")["type"], "CONTAINER")
+        content = list(client.list_content("test", "container_000002"))
+        self.assertEqual(content, [{"scope": "test", "name": "dataset_000004", "type": "DATASET"}])
+        self.assertEqual(len(list(client.list_files("test", "container_all"))), 10)
+        replicas = list(
+            client.list_replicas(
+                [{"scope": "test", "name": "container_000001"}], resolve_parents=True
+            )
+        )
+        self.assertEqual(len(replicas), 4)
+        self.assertEqual(
+            replicas[0]["parents"],
+            ["test:dataset_000002", "test:container_000001", "test:container_all"],
+        )
+
+    def test_errors_and_bulk_support(self):
+        """Check simulated failures and missing bulk support."""
+        client = FakeRucioClient(error_rate=1.0)
+        with self.assertRaises(RucioException):
+            client.get_did("test", "dataset_000000")
+        client = FakeRucioClient(bulk_metadata=False)
+        processor = RucioProcessor("test", "dataset_000000", "FAKE_RSE", client)
+        self.assertEqual(len(processor.get_payload()), 1000)
+        self.assertEqual(client.calls["get_metadata"], 1000)
+
+    @patch("time.sleep")
+    def test_latency(self, mock_sleep):
+        """Check latency and jitter."""
+        client = FakeRucioClient(latency=0.1, jitter=0.05)
+        client.get_did("test", "dataset_000000")
+        delay = mock_sleep.call_args.args[0]
+        self.assertTrue(0.05 <= delay <= 0.15)
+
+    def test_processor(self):
+        """Check RucioProcessor against the fake catalogue."""
+        processor = RucioProcessor("raw", "dataset_000000", "RSE_A", self.client)
+        payload = processor.get_payload()
+        self.assertEqual(len(payload), 10)
+        self.assertEqual(processor.rucio_calls["list_replicas"], 1)
+        self.assertEqual(processor.rucio_calls["get_metadata_bulk"], 1)
+        self.assertTrue(all(type(item) is dict for item in payload.values()))
+        records = RucioProcessor(
+            "raw", "dataset_000000", "RSE_A", self.client
+        ).get_payload_records()
+        self.assertTrue(
+            all(isinstance(item, FilePayload) for item in records.values())
+        )
+        self.assertEqual(records, payload)
+
+    @patch("lsst.rucioevents.dummy_event_generator.RucioKafkaProducer")
+    def test_process_dids(self, mock_kafka_producer):
+        """Check process_dids against the fake catalogue."""
+        mock_kafka_producer.return_value.send_event.side_effect = lambda events: len(
+            list(events)
+        )
+        summary = process_dids(
+            self.client.dids(),
+            "RSE_B",
+            "topic",
+            workers=2,
+            client_factory=lambda: self.client,
+        )
+        self.assertEqual(summary[DID_SUCCEEDED], 2)
+        self.assertEqual(mock_kafka_producer.return_value.send_event.call_count, 2)
+
+    def test_process_containers(self):
+        """Check containers are expanded and their replicas grouped."""
+        for workers, pipeline in ((1, False), (2, False), (2, True)):
+            client = FakeRucioClient(
+                n_datasets=5, files_per_dataset=4, datasets_per_container=2
+            )
+            sink = NullSink()
+            options = dict(
+                workers=workers,
+                client_factory=lambda: client,
+                sink=sink,
+                expand_containers=True,
+                replica_batch_size=2,
+            )
+            dids = ["test:container_all", "test:dataset_000001"]
+            if pipeline:
+                summary = asyncio.run(
+                    process_dids_async(dids, "FAKE_RSE", "topic", **options)
+                )
+            else:
+                summary = process_dids(dids, "FAKE_RSE", "topic", **options)
+            self.assertEqual(summary[DID_SUCCEEDED], 5)
+            self.assertEqual(sink.delivered, 20)
+            self.assertEqual(client.calls["list_files"], 0)
+            self.assertLess(client.calls["list_replicas"], 5)
+
+    def test_multiple_rses(self):
+        """Check several RSEs are served by a single pass over the files."""
+        client = FakeRucioClient(
+            n_datasets=2,
+            files_per_dataset=50,
+            rses=["RSE_A", "RSE_B"],
+            replica_fraction=0.5,
+        )
+        fake = FakeProducer()
+        sink = RucioKafkaProducer(
+            "other", producer=fake, topics={"RSE_A": "topic_a", "RSE_B": "topic_b"}
+        )
+        summary = process_dids(
+            client.dids(),
+            ["RSE_A", "RSE_B"],
+            "other",
+            client_factory=lambda: client,
+            sink=sink,
+        )
+        self.assertEqual(summary[DID_SUCCEEDED], 2)
+        # One lookup of the replicas and of the metadata per dataset.
+        self.assertEqual(client.calls["list_replicas"], 2)
+        self.assertEqual(client.calls["get_metadata_bulk"], 2)
+        expected = {
+            rse: sum(
+                len(RucioProcessor("test", name, rse, client)._get_rse_info())
+                for name in client.dataset_names()
+            )
+            for rse in ("RSE_A", "RSE_B")
+        }
+        self.assertEqual(fake.messages_per_topic["topic_a"], expected["RSE_A"])
+        self.assertEqual(fake.messages_per_topic["topic_b"], expected["RSE_B"])
+        self.assertEqual(fake.messages_per_topic["other"], 0)
+
+    def test_list_rses(self):
+        """Check RSE expressions."""
+        self.assertEqual(
+            [rse["rse"] for rse in self.client.list_rses("RSE_B|RSE_C")], ["RSE_B"]
+        )
+        self.assertEqual(len(list(self.client.list_rses("*"))), 2)
+        with self.assertRaises(RucioException):
+            list(self.client.list_rses("RSE_C"))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,97 @@
+import os
+import unittest
+import tempfile
+import lsst.utils.tests
+from lsst.rucioevents.journal import RunJournal
+
+
+class TestRunJournal(unittest.TestCase):
+    def setUp(self):
+        """Create a journal in a temporary directory."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "journal.txt")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_record_and_resume(self):
+        """Check completed DIDs and files are found after resuming."""
+        journal = RunJournal(self.path, track_files=True)
+        journal.record_file("scope:dataset", "scope:file1")
+        journal.record_file("scope:dataset", "scope:file2")
+        journal.record_did("scope:dataset")
+        self.assertEqual(journal.delivered("scope:dataset"), 2)
+        journal.close()
+
+        resumed = RunJournal(self.path, resume=True)
+        self.assertTrue(resumed.is_done("scope:dataset"))
+        self.assertFalse(resumed.is_done("scope:other"))
+        self.assertTrue(resumed.is_file_done("scope:file2"))
+        self.assertFalse(resumed.is_file_done("scope:file3"))
+        self.assertEqual(resumed.delivered("scope:dataset"), 0)
+        resumed.close()
+
+    def test_flush_without_close(self):
+        """Check recorded files are on disk before the journal is closed."""
+        journal = RunJournal(
+            self.path, track_files=True, flush_records=2, flush_interval=3600.0
+        )
+        journal.record_file("scope:dataset", "scope:file1")
+        journal.record_file("scope:dataset", "scope:file2")
+        journal.record_file("scope:dataset", "scope:file3")
+
+        resumed = RunJournal(self.path, resume=True)
+        self.assertTrue(resumed.is_file_done("scope:file2"))
+        self.assertFalse(resumed.is_file_done("scope:file3"))
+        resumed.close()
+
+        journal.flush_interval = 0.0
+        journal.record_file("scope:dataset", "scope:file4")
+        resumed = RunJournal(self.path, resume=True)
+        self.assertTrue(resumed.is_file_done("scope:file4"))
+        resumed.close()
+        journal.close()
+
+    def test_file_rse(self):
+        """Check files are recorded by RSE, and legacy files for all RSEs."""
+        with open(self.path, "w") as journal_file:
+            journal_file.write("file\tscope:dataset\tscope:file1\n")
+        journal = RunJournal(self.path, resume=True, track_files=True)
+        journal.record_file("scope:dataset", "scope:file2@RSE_A")
+        self.assertTrue(journal.is_file_done("scope:file1@RSE_B"))
+        self.assertTrue(journal.is_file_done("scope:file2@RSE_A"))
+        self.assertFalse(journal.is_file_done("scope:file2@RSE_B"))
+        journal.close()
+
+    def test_no_resume(self):
+        """Check previous entries are ignored without resume, but kept."""
+        journal = RunJournal(self.path)
+        journal.record_did("scope:dataset")
+        journal.close()
+
+        journal = RunJournal(self.path)
+        self.assertFalse(journal.is_done("scope:dataset"))
+        journal.record_did("scope:other")
+        journal.close()
+        with open(self.path) as journal_file:
+            self.assertEqual(len(journal_file.readlines()), 2)
+
+    def test_truncated_line(self):
+        """Check a line cut by a crash is ignored."""
+        with open(self.path, "w") as journal_file:
+            journal_file.write("did\tscope:dataset\nfile\tscope:data")
+        journal = RunJournal(self.path, resume=True)
+        self.assertTrue(journal.is_done("scope:dataset"))
+        journal.record_did("scope:other")
+        journal.close()
+        journal = RunJournal(self.path, resume=True)
+        self.assertTrue(journal.is_done("scope:other"))
+        journal.close()
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -1,9 +1,14 @@
 import unittest
 import json
+import logging
 import uuid
+from types import SimpleNamespace
 import lsst.utils.tests
 from unittest.mock import MagicMock, patch
+from lsst.rucioevents.fake_kafka import FakeProducer
 from lsst.rucioevents.kafka_producer import RucioKafkaProducer
+from lsst.rucioevents.keys import message_key
+from lsst.rucioevents.logs import ProgressLog
 
 
 class TestRucioKafkaProducer(unittest.TestCase):
@@ -25,7 +30,7 @@ class TestRucioKafkaProducer(unittest.TestCase):
         self.mock_producer.produce.assert_called_once_with(
             topic=self.topic,
             key=event["key"],
-            value=json.dumps(event),
+            value=json.dumps(event).encode("utf-8"),
             callback=unittest.mock.ANY,  # I don't know how to test directly the callback
         )
         self.mock_producer.flush.assert_called_once()
@@ -43,9 +48,101 @@ class TestRucioKafkaProducer(unittest.TestCase):
         if key.startswith("b'") and key.endswith("'"):
             key = key[2:-1]
         self.assertIsInstance(uuid.UUID(key), uuid.UUID)
-        self.assertEqual(kwargs["value"], json.dumps(event))
+        self.assertEqual(kwargs["value"], json.dumps(event).encode("utf-8"))
         self.mock_producer.flush.assert_called_once()
 
+    def test_send_event_did_key(self):
+        """Check keys derived from the file DID and RSE."""
+        event = {"payload": {"scope": "raw", "name": "file1", "dst-rse": "RSE"}}
+        self.kafka_producer.send_event([event, dict(event)])
+        keys = [call.kwargs["key"] for call in self.mock_producer.produce.call_args_list]
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(keys[0], message_key(event))
+        self.assertNotIn("partition", self.mock_producer.produce.call_args.kwargs)
+
+    def test_send_event_random_key(self):
+        """Check the random key strategy."""
+        self.kafka_producer.key_strategy = "random"
+        event = {"payload": {"scope": "raw", "name": "file1", "dst-rse": "RSE"}}
+        self.kafka_producer.send_event([event])
+        key = self.mock_producer.produce.call_args.kwargs["key"]
+        self.assertIsInstance(uuid.UUID(key.decode("utf-8")), uuid.UUID)
+
+    def test_send_event_dataset_partitioner(self):
+        """Check the events of a dataset are sent to a single partition."""
+        producer = RucioKafkaProducer(
+            self.topic, producer=FakeProducer(partitions=8), partitioner="dataset"
+        )
+        events = [
+            {
+                "payload": {
+                    "scope": "raw",
+                    "name": f"file{i}",
+                    "dataset": f"dataset{i % 2}",
+                    "datasetScope": "raw",
+                }
+            }
+            for i in range(20)
+        ]
+        producer.send_event(events)
+        self.assertEqual(producer.partitions, 8)
+        self.assertLessEqual(len(producer.producer.messages_per_partition), 2)
+        self.assertEqual(sum(producer.producer.messages_per_partition.values()), 20)
+
+    def test_send_event_topics(self):
+        """Check the events are routed to the topic of their RSE."""
+        fake = FakeProducer(partitions=4)
+        producer = RucioKafkaProducer(
+            self.topic,
+            producer=fake,
+            partitioner="file",
+            topics={"RSE_A": "topic_a", "RSE_B": "topic_b"},
+        )
+        events = [
+            {"payload": {"scope": "raw", "name": f"file{i}", "dst-rse": rse}}
+            for i in range(3)
+            for rse in ("RSE_A", "RSE_B", "RSE_C")
+        ]
+        producer.send_event(events)
+        self.assertEqual(
+            fake.messages_per_topic,
+            {"topic_a": 3, "topic_b": 3, self.topic: 3},
+        )
+        self.assertEqual(producer._partition_count("topic_a"), 4)
+
+    def test_send_event_topic_without_partitions(self):
+        """Check the default partitioner is used for a topic without
+        partition metadata.
+        """
+        fake = FakeProducer(partitions=4)
+        producer = RucioKafkaProducer(self.topic, producer=fake, partitioner="dataset")
+        events = [
+            {"payload": {"scope": "raw", "name": f"file{i}", "dataset": "ds"}}
+            for i in range(5)
+        ]
+        for error in ("UNKNOWN_TOPIC_OR_PART", None):
+            fake.list_topics = MagicMock(
+                return_value=SimpleNamespace(
+                    topics={
+                        self.topic: SimpleNamespace(
+                            topic=self.topic, partitions={}, error=error
+                        )
+                    }
+                )
+            )
+            producer.partitions = None
+            with self.assertLogs("RucioKafkaProducer", logging.WARNING):
+                self.assertEqual(producer.send_event(events), 5)
+            self.assertEqual(producer.partitions, 0)
+        self.assertEqual(fake.messages_per_topic, {self.topic: 10})
+
+    def test_unknown_strategies(self):
+        """Check unknown key strategies and partitioners are refused."""
+        with self.assertRaises(ValueError):
+            RucioKafkaProducer(self.topic, producer=MagicMock(), key_strategy="x")
+        with self.assertRaises(ValueError):
+            RucioKafkaProducer(self.topic, producer=MagicMock(), partitioner="x")
+
     def test_send_event_multiple(self):
         """Chem many events production."""
         events = [
@@ -56,6 +153,84 @@ class TestRucioKafkaProducer(unittest.TestCase):
         self.assertEqual(self.mock_producer.produce.call_count, 2)
         self.mock_producer.flush.assert_called()
 
+    def test_send_event_batched(self):
+        """Check a single flush per batch with callbacks served while
+        producing.
+        """
+        events = [{"key": f"key{i}", "data": i} for i in range(5)]
+        self.mock_producer.flush.return_value = 0
+        self.kafka_producer.send_event(events)
+        self.assertEqual(self.mock_producer.produce.call_count, 5)
+        self.assertEqual(self.mock_producer.poll.call_count, 5)
+        self.mock_producer.flush.assert_called_once_with(
+            RucioKafkaProducer.DEFAULT_FLUSH_TIMEOUT
+        )
+
+    def test_send_event_no_flush(self):
+        """Check flush deferred to the end of the run."""
+        self.kafka_producer.send_event([{"key": "key1"}], flush=False)
+        self.mock_producer.flush.assert_not_called()
+
+    def test_send_event_flush_each(self):
+        """Check the strict per-message flush mode."""
+        self.kafka_producer.flush_each = True
+        self.kafka_producer.send_event([{"key": "key1"}, {"key": "key2"}])
+        self.assertEqual(self.mock_producer.flush.call_count, 2)
+        self.mock_producer.poll.assert_not_called()
+
+    def test_delivery_counters(self):
+        """Check delivered and failed counters."""
+        msg = MagicMock()
+        self.kafka_producer.delivery_report(None, msg)
+        self.kafka_producer.delivery_report(None, msg)
+        self.kafka_producer.delivery_report("error", msg)
+        self.assertEqual(self.kafka_producer.delivered, 2)
+        self.assertEqual(self.kafka_producer.failed, 1)
+        self.assertTrue(
+            self.kafka_producer.summary().startswith("2 messages delivered, 1 failed")
+        )
+
+    def test_send_event_queue_full(self):
+        """Check retry of a message when the local queue is full."""
+        self.mock_producer.produce.side_effect = [BufferError, BufferError, None]
+        self.kafka_producer.send_event([{"key": "key1"}])
+        self.assertEqual(self.mock_producer.produce.call_count, 3)
+        self.mock_producer.poll.assert_any_call(
+            RucioKafkaProducer.QUEUE_FULL_POLL_INTERVAL
+        )
+        self.assertEqual(self.kafka_producer.blocked_count, 1)
+        self.assertGreaterEqual(self.kafka_producer.blocked_time, 0.0)
+
+    def test_send_event_queue_full_timeout(self):
+        """Check a message is given up when the queue stays full."""
+        self.kafka_producer.queue_full_timeout = -1
+        self.mock_producer.produce.side_effect = BufferError
+        with self.assertRaises(BufferError):
+            self.kafka_producer.send_event([{"key": "key1"}])
+        self.assertEqual(self.kafka_producer.blocked_count, 1)
+
+    def test_send_event_journal(self):
+        """Check delivered file events are recorded in the journal."""
+        journal = MagicMock()
+        journal.track_files = True
+        self.kafka_producer.journal = journal
+        event = {
+            "payload": {
+                "scope": "raw",
+                "name": "file1",
+                "dataset": "dataset1",
+                "datasetScope": "raw",
+            }
+        }
+
+        def mock_produce(*args, **kwargs):
+            kwargs["callback"](None, MagicMock())
+            kwargs["callback"]("error", MagicMock())
+
+        self.mock_producer.produce.side_effect = mock_produce
+        self.kafka_producer.send_event([event])
+        journal.record_file.assert_called_once_with("raw:dataset1", "raw:file1")
+
     @patch("lsst.rucioevents.kafka_producer.logger")
     def test_delivery_report_success(self, mock_logger):
         """Trying to test the callback."""
@@ -72,11 +247,25 @@ class TestRucioKafkaProducer(unittest.TestCase):
                 callback(None, mock_msg)
 
         self.mock_producer.produce.side_effect = mock_produce
+        mock_logger.isEnabledFor.return_value = True
         self.kafka_producer.send_event(events)
-        mock_logger.info.assert_called_with(
-            "Message: test_key successfully produced to Topic: test_topic Partition: [0] at offset 123"
+        mock_logger.log.assert_called_with(
+            logging.DEBUG,
+            "Message: test_key successfully produced to Topic: test_topic Partition: [0] at offset 123",
         )
 
+    @patch("lsst.rucioevents.kafka_producer.logger")
+    def test_delivery_report_sampled(self, mock_logger):
+        """Check the deliveries are only logged when sampled, unless
+        verbose.
+        """
+        mock_logger.isEnabledFor.return_value = False
+        producer = RucioKafkaProducer(self.topic, producer=FakeProducer())
+        producer._progress = ProgressLog(mock_logger, "messages", sample=3)
+        producer.send_event([{"key": f"key{i}", "value": i} for i in range(7)])
+        levels = [call.args[0] for call in mock_logger.log.call_args_list]
+        self.assertEqual(levels, [logging.INFO, logging.INFO])
+
 
 class MemoryTester(lsst.utils.tests.MemoryTestCase):
     pass
@@ -0,0 +1,46 @@
+import unittest
+import lsst.utils.tests
+from lsst.rucioevents.keys import event_partition, message_key
+
+
+def make_event(name, dataset="dataset1", rse="RSE"):
+    """Build the event of a file of a dataset."""
+    return {
+        "payload": {
+            "scope": "raw",
+            "name": name,
+            "dataset": dataset,
+            "datasetScope": "raw",
+            "dst-rse": rse,
+        }
+    }
+
+
+class TestKeys(unittest.TestCase):
+    def test_message_key(self):
+        """Check keys depend only on the file DID and RSE."""
+        key = message_key(make_event("file1"))
+        self.assertEqual(len(key), 32)
+        self.assertEqual(key, message_key(make_event("file1", dataset="other")))
+        self.assertNotEqual(key, message_key(make_event("file2")))
+        self.assertNotEqual(key, message_key(make_event("file1", rse="OTHER")))
+        self.assertIsNone(message_key({"data": "test_data"}))
+
+    def test_event_partition(self):
+        """Check the dataset and file partitioners."""
+        events = [make_event(f"file{i}") for i in range(50)]
+        by_dataset = {event_partition(event, "dataset", 8) for event in events}
+        by_file = {event_partition(event, "file", 8) for event in events}
+        self.assertEqual(len(by_dataset), 1)
+        self.assertGreater(len(by_file), 4)
+        self.assertTrue(by_file <= set(range(8)))
+        with self.assertRaises(ValueError):
+            event_partition(events[0], "default", 8)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,109 @@
+import logging
+import threading
+import unittest
+import lsst.utils.tests
+from unittest.mock import MagicMock
+from lsst.rucioevents.logs import (
+    ITEM_LOGGERS,
+    DeferredQueueHandler,
+    ProgressLog,
+    configure_logging,
+    format_duration,
+    queued_logging,
+)
+
+
+class ListHandler(logging.Handler):
+    """Keep the formatted records, and the thread writing them."""
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+        self.threads.add(threading.current_thread().name)
+
+
+class TestProgressLog(unittest.TestCase):
+    def test_summary(self):
+        """Check the totals, the rate and the time left."""
+        progress = ProgressLog(MagicMock(), "DIDs", total=10, interval=3600)
+        progress.start -= 4.0
+        for _ in range(4):
+            progress.add()
+        self.assertEqual(
+            progress.summary(progress.start + 4.0),
+            "Progress: 4/10 DIDs (40.0%), 1.0 DIDs/s, ETA 6s",
+        )
+        progress.logger.info.assert_not_called()
+        unknown = ProgressLog(MagicMock(), "messages", interval=3600)
+        unknown.add(5)
+        self.assertIn("Progress: 5 messages", unknown.summary())
+
+    def test_periodic_and_sampled(self):
+        """Check summaries are logged once due, and items are sampled."""
+        logger = MagicMock()
+        progress = ProgressLog(logger, "messages", interval=0.0, sample=2)
+        sampled = [progress.add() for _ in range(5)]
+        self.assertEqual(sampled, [False, True, False, True, False])
+        self.assertEqual(logger.info.call_count, 5)
+        progress.close()
+        self.assertEqual(logger.info.call_count, 6)
+
+    def test_format_duration(self):
+        """Check durations are rounded to the second."""
+        self.assertEqual(format_duration(59.6), "1m00s")
+        self.assertEqual(format_duration(3725), "1h02m05s")
+
+
+class TestQueuedLogging(unittest.TestCase):
+    def setUp(self):
+        self.root = logging.getLogger()
+        self.handlers = list(self.root.handlers)
+        self.handler = ListHandler()
+        self.handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+        self.root.addHandler(self.handler)
+
+    def tearDown(self):
+        self.root.removeHandler(self.handler)
+        configure_logging()
+        for name in ITEM_LOGGERS:
+            logging.getLogger(name).setLevel(logging.NOTSET)
+
+    def test_queued_logging(self):
+        """Check the records are written by the listener, then the handlers
+        restored.
+        """
+        logger = logging.getLogger("TestQueuedLogging")
+        with queued_logging():
+            self.assertTrue(
+                any(isinstance(h, DeferredQueueHandler) for h in self.root.handlers)
+            )
+            self.assertNotIn(self.handler, self.root.handlers)
+            logger.warning("%d files", 3)
+            try:
+                raise ValueError("bad")
+            except ValueError:
+                logger.exception("failed")
+        self.assertEqual(self.handler.lines[0], "WARNING 3 files")
+        self.assertTrue(self.handler.lines[1].startswith("ERROR failed"))
+        self.assertIn("ValueError: bad", self.handler.lines[1])
+        self.assertNotIn("MainThread", self.handler.threads)
+        self.assertEqual(self.root.handlers, self.handlers + [self.handler])
+
+    def test_configure_logging(self):
+        """Check the per-item loggers follow --verbose."""
+        configure_logging(verbose=True)
+        self.assertTrue(logging.getLogger(ITEM_LOGGERS[0]).isEnabledFor(logging.DEBUG))
+        configure_logging()
+        self.assertFalse(logging.getLogger(ITEM_LOGGERS[0]).isEnabledFor(logging.DEBUG))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+import lsst.utils.tests
+from rucio.common.exception import RucioException
+from lsst.rucioevents.dummy_event_generator import process_dids
+from lsst.rucioevents.fake_kafka import FakeProducer
+from lsst.rucioevents.fake_rucio import FakeRucioClient
+from lsst.rucioevents.kafka_producer import RucioKafkaProducer
+from lsst.rucioevents.metrics import (
+    DELIVERY_SECONDS,
+    EVENTS_BUILT,
+    QUEUE_DEPTH,
+    REGISTRY,
+    RUCIO_CALL_ERRORS,
+    RUCIO_CALL_SECONDS,
+    STAGE_SECONDS,
+    MetricsRegistry,
+    start_http_server,
+    timed_call,
+)
+
+
+def histogram_count(histogram, *labels) -> int:
+    """Return the number of values observed by a histogram."""
+    return sum(histogram.labels(*labels).counts)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_render(self):
+        """Check the Prometheus text format of each kind of metric."""
+        calls = self.registry.counter("calls", "Calls made.", labels=("method",))
+        calls.labels("get_did").inc()
+        calls.labels("get_did").inc(2)
+        depth = self.registry.gauge("depth", "Queue depth.")
+        depth.set_function(lambda: 7)
+        duration = self.registry.histogram("duration", "Durations.", buckets=(0.1, 1))
+        duration.observe(0.05)
+        duration.observe(0.5)
+        duration.observe(5)
+        lines = self.registry.render().splitlines()
+        self.assertIn("# TYPE calls counter", lines)
+        self.assertIn('calls_total{method="get_did"} 3', lines)
+        self.assertIn("depth 7", lines)
+        self.assertIn('duration_bucket{le="0.1"} 1', lines)
+        self.assertIn('duration_bucket{le="1.0"} 2', lines)
+        self.assertIn('duration_bucket{le="+Inf"} 3', lines)
+        self.assertIn("duration_sum 5.55", lines)
+        self.assertIn("duration_count 3", lines)
+        with self.assertRaises(ValueError):
+            self.registry.counter("calls", "Again.")
+        with self.assertRaises(ValueError):
+            calls.labels()
+
+    def test_write_textfile(self):
+        """Check the metrics are written for the textfile collector."""
+        self.registry.counter("events", "Events.").inc(4)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "rucioevents.prom")
+            self.registry.write_textfile(path)
+            with open(path) as file:
+                self.assertIn("events_total 4\n", file.read())
+            self.assertEqual(os.listdir(tmpdir), ["rucioevents.prom"])
+
+    def test_http_server(self):
+        """Check the metrics are served on /metrics only."""
+        self.registry.gauge("depth", "Queue depth.").set(3)
+        server = start_http_server(0, registry=self.registry)
+        url = f"http://127.0.0.1:{server.server_port}"
+        try:
+            with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+                self.assertIn("depth 3", response.read().decode("utf-8"))
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"{url}/other", timeout=5)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        REGISTRY.reset()
+
+    def tearDown(self):
+        REGISTRY.reset()
+
+    def test_timed_call(self):
+        """Check lazy calls are timed once read, and failures counted."""
+        client = FakeRucioClient(files_per_dataset=5)
+        files = timed_call("list_files", client.list_files, "test", "dataset_000000")
+        self.assertEqual(histogram_count(RUCIO_CALL_SECONDS, "list_files"), 0)
+        self.assertEqual(len(list(files)), 5)
+        self.assertEqual(histogram_count(RUCIO_CALL_SECONDS, "list_files"), 1)
+        client.error_rate = 1.0
+        with self.assertRaises(RucioException):
+            timed_call("get_did", client.get_did, "test", "dataset_000000")
+        self.assertEqual(RUCIO_CALL_ERRORS.labels("get_did").value, 1)
+
+    def test_process_dids(self):
+        """Check the metrics recorded by a run."""
+        client = FakeRucioClient(n_datasets=2, files_per_dataset=10)
+        sink = RucioKafkaProducer("topic", producer=FakeProducer())
+        QUEUE_DEPTH.labels("sink").set_function(sink.queue_depth)
+        process_dids(
+            client.dids(), "FAKE_RSE", "topic", client_factory=lambda: client, sink=sink
+        )
+        self.assertEqual(histogram_count(RUCIO_CALL_SECONDS, "list_replicas"), 2)
+        self.assertEqual(histogram_count(STAGE_SECONDS, "produce"), 2)
+        self.assertEqual(EVENTS_BUILT.labels().value, 20)
+        self.assertEqual(histogram_count(DELIVERY_SECONDS), 20)
+        text = REGISTRY.render()
+        self.assertIn('rucioevents_deliveries_total{outcome="delivered"} 20', text)
+        self.assertIn('rucioevents_queue_depth{queue="sink"} 0', text)
+        self.assertIn(
+            'rucioevents_events_sent_total{sink="RucioKafkaProducer"} 20', text
+        )
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
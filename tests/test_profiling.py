@@ -0,0 +1,85 @@
+import os
+import pstats
+import tempfile
+import unittest
+import lsst.utils.tests
+from lsst.rucioevents.dummy_event_generator import DID_SUCCEEDED, process_dids
+from lsst.rucioevents.fake_rucio import FakeRucioClient
+from lsst.rucioevents.metrics import REGISTRY
+from lsst.rucioevents.profiling import RunProfiler, track_memory
+from lsst.rucioevents.sinks import NullSink
+
+
+class TestRunProfiler(unittest.TestCase):
+    def setUp(self):
+        REGISTRY.reset()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "profile.txt")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        REGISTRY.reset()
+
+    def test_profile_run(self):
+        """Check the report of a run processed by several workers."""
+        client = FakeRucioClient(n_datasets=4, files_per_dataset=10)
+        with RunProfiler(self.path, top=10, trace_memory=True) as profiler:
+            process_dids(
+                client.dids(),
+                "FAKE_RSE",
+                "topic",
+                workers=2,
+                client_factory=lambda: client,
+                sink=NullSink(),
+            )
+        with open(self.path) as file:
+            report = file.read()
+        for section in (
+            "Time by component:",
+            "Stage timings (count, total):",
+            "Rucio calls (count, total):",
+            "Memory peaks by DID:",
+            "Top functions by cumulative time:",
+            "Top functions by internal time:",
+        ):
+            self.assertIn(section, report)
+        self.assertEqual(len(profiler.memory_peaks), 4)
+        self.assertIn("test:dataset_000000", report)
+        self.assertGreater(profiler.components()["events"], 0.0)
+        # The functions run by the worker threads are in the profile.
+        functions = {key[2] for key in pstats.Stats(f"{self.path}.pstats").stats}
+        self.assertIn("process_did", functions)
+
+    def test_profile_workers(self):
+        """Check a run with several workers completes, and the functions run
+        by the workers only are profiled.
+        """
+        client = FakeRucioClient(n_datasets=8, files_per_dataset=5)
+        with RunProfiler(self.path) as profiler:
+            summary = process_dids(
+                client.dids(),
+                "FAKE_RSE",
+                "topic",
+                workers=4,
+                client_factory=lambda: client,
+                sink=NullSink(),
+            )
+        self.assertEqual(summary[DID_SUCCEEDED], 8)
+        functions = {key[2] for key in profiler.stats.stats}
+        self.assertIn("worker", functions)
+        self.assertGreater(profiler.components()["rucio"], 0.0)
+
+    def test_track_memory_inactive(self):
+        """Check nothing is recorded outside of a profiled run."""
+        profiler = RunProfiler(self.path)
+        with track_memory("test:dataset_000000"):
+            pass
+        self.assertEqual(profiler.memory_peaks, [])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
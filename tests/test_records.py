@@ -0,0 +1,65 @@
+import unittest
+import lsst.utils.tests
+from lsst.rucioevents.records import (
+    EVENT_TYPE,
+    FilePayload,
+    TransferEvent,
+    record_to_dict,
+)
+
+
+class TestRecords(unittest.TestCase):
+    def setUp(self):
+        self.payload = {
+            "rubin_butler": 1,
+            "rubin_sidecar": "sidecar",
+            "scope": "scope",
+            "name": "file1",
+            "dataset": "dataset",
+            "datasetScope": "scope",
+            "dst-url": "davs://example.org/scope/file1",
+            "dst-rse": "RSE",
+        }
+
+    def test_file_payload(self):
+        """Check payload records behave as read-only dictionaries."""
+        record = FilePayload.from_dict(self.payload)
+        self.assertEqual(record, self.payload)
+        self.assertEqual(list(record), list(self.payload))
+        self.assertEqual(record["dst-url"], "davs://example.org/scope/file1")
+        self.assertEqual(record.dataset_scope, "scope")
+        self.assertEqual(record.get("missing", "default"), "default")
+        self.assertEqual(record.to_dict(), self.payload)
+        with self.assertRaises(KeyError):
+            record["missing"]
+        self.assertFalse(hasattr(record, "__dict__"))
+
+    def test_transfer_event(self):
+        """Check event records behave as read-only dictionaries."""
+        payload = FilePayload.from_dict(self.payload)
+        event = TransferEvent(payload, "2024-01-01 00:00:00.000000")
+        expected = {
+            "event_type": EVENT_TYPE,
+            "payload": self.payload,
+            "created_at": "2024-01-01 00:00:00.000000",
+        }
+        self.assertEqual(event, expected)
+        self.assertEqual(event["payload"]["name"], "file1")
+        self.assertNotIn("key", event)
+        self.assertIsNone(event.get("key"))
+        self.assertFalse(hasattr(event, "__dict__"))
+
+    def test_record_to_dict(self):
+        """Check the JSON encoder hook."""
+        record = FilePayload.from_dict(self.payload)
+        self.assertEqual(record_to_dict(record), self.payload)
+        with self.assertRaises(TypeError):
+            record_to_dict(object())
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+import unittest
+import lsst.utils.tests
+from lsst.rucioevents.capture import CaptureSink, iter_capture
+from lsst.rucioevents.replay import main, replay
+from lsst.rucioevents.sinks import NullSink
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        """Capture a few events."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "events.capture")
+        self.events = [
+            {
+                "key": f"key{i}",
+                "event_type": "transfer-done",
+                "payload": {"scope": "scope", "name": f"file{i}"},
+                "created_at": "2024-01-01 00:00:00.000000",
+            }
+            for i in range(20)
+        ]
+        sink = CaptureSink(self.path)
+        sink.send_event(self.events)
+        sink.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_replay(self):
+        """Check the capture is replayed as many times as requested."""
+        sink = NullSink()
+        self.assertEqual(replay(self.path, sink, repeat=3), 60)
+        self.assertEqual(sink.delivered, 60)
+
+    def test_replay_rate(self):
+        """Check the replay does not exceed the target rate."""
+        start = time.monotonic()
+        replay(self.path, NullSink(), rate=100.0)
+        # Two batches of 10 events, the second one sent after 0.1s.
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_replay_refresh(self):
+        """Check the creation time and keys are refreshed."""
+        output = os.path.join(self.tmpdir.name, "replayed.capture")
+        sink = CaptureSink(output)
+        replay(self.path, sink, refresh=True)
+        sink.close()
+        replayed = list(iter_capture(output))
+        self.assertEqual(len(replayed), 20)
+        for event in replayed:
+            self.assertNotIn("key", event)
+            self.assertNotEqual(event["created_at"], "2024-01-01 00:00:00.000000")
+
+    def test_main(self):
+        """Check replaying to a capture file from the command line."""
+        output = os.path.join(self.tmpdir.name, "replayed.capture")
+        self.assertEqual(
+            main([self.path, "--sink", "capture", "-o", output, "--repeat", "2"]), 0
+        )
+        self.assertEqual(list(iter_capture(output)), self.events * 2)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
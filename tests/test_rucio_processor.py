@@ -1,8 +1,10 @@
 import unittest
+import tempfile
 import lsst.utils.tests
 from unittest.mock import MagicMock, patch
-from rucio.common.exception import DataIdentifierNotFound
+from rucio.common.exception import DataIdentifierNotFound, UnsupportedOperation
 from lsst.rucioevents.rucio_processor import RucioProcessor
+from lsst.rucioevents.cache import RucioCache
 
 
 class TestRucioProcessor(unittest.TestCase):
@@ -53,18 +55,32 @@ class TestRucioProcessor(unittest.TestCase):
         """Succesfull _get_files_info."""
         dummy_files_info = [{"scope": "scope1", "name": "name1"}]
         self.mock_client.list_files.return_value = dummy_files_info
-        self.mock_client.get_did.return_value = {"key": "value"}
         result = self.processor._get_files_info()
-        self.assertEqual(len(result), 1)
-        self.mock_client.list_files.assert_called_once_with(self.scope, self.name)
-        self.mock_client.get_did.assert_called_once_with("scope1", "name1")
+        self.assertEqual(result, dummy_files_info)
+        self.mock_client.list_files.assert_called_once_with(
+            self.scope, self.name, long=False
+        )
+        self.mock_client.get_did.assert_not_called()
 
     def test_get_files_info_not_found(self):
         """Test no DID found"""
         self.mock_client.list_files.side_effect = DataIdentifierNotFound
         result = self.processor._get_files_info()
         self.assertEqual(result, [])
-        self.mock_client.list_files.assert_called_once_with(self.scope, self.name)
+        self.mock_client.list_files.assert_called_once_with(
+            self.scope, self.name, long=False
+        )
+
+    def test_get_file_names_long(self):
+        """Check file names and call counting."""
+        self.mock_client.list_files.return_value = iter(
+            [{"scope": "scope1", "name": "name1"}, {"scope": "scope1", "name": "name2"}]
+        )
+        self.assertEqual(self.processor._get_file_names(), ["name1", "name2"])
+        self.processor._get_files_info(long=True)
+        self.mock_client.list_files.assert_called_with(self.scope, self.name, long=True)
+        self.assertEqual(self.processor.rucio_calls["list_files"], 2)
+        self.assertEqual(self.processor.format_rucio_calls(), "2 (list_files=2)")
 
     def test_get_rubin_payload_success(self):
         """Test succesfully _get_rubin_payload."""
@@ -90,7 +106,7 @@ class TestRucioProcessor(unittest.TestCase):
         self.assertIsNone(result)
 
     def test_get_all_metadata(self):
-        """Succesfull _get_all_metadata."""
+        """Succesfull _get_all_metadata without bulk support."""
         dummy_rubin_payload = {
             "rubin_butler": 1,
             "rubin_sidecar": "sidecar_data",
@@ -99,11 +115,94 @@ class TestRucioProcessor(unittest.TestCase):
             "dataset": self.name,
             "datasetScope": self.scope,
         }
+        self.mock_client.get_metadata_bulk.side_effect = UnsupportedOperation
         self.mock_client.get_metadata.return_value = dummy_rubin_payload
         result = self.processor._get_all_metadata(["file1", "file2"])
         self.assertEqual(len(result), 2)
         self.assertEqual(result["file1"], dummy_rubin_payload)
         self.assertEqual(result["file2"], dummy_rubin_payload)
+        self.mock_client.get_metadata_bulk.assert_called_once()
+        self.assertEqual(self.mock_client.get_metadata.call_count, 2)
+
+    def test_get_all_metadata_bulk_refused_once(self):
+        """A client whose server refused the bulk call is not asked again."""
+        self.mock_client.get_metadata_bulk.side_effect = UnsupportedOperation
+        self.mock_client.get_metadata.return_value = {"name": "file1"}
+        self.processor._get_all_metadata(["file1"])
+        processor = RucioProcessor(self.scope, "other", self.rse, self.mock_client)
+        processor._get_all_metadata(["file1"])
+        self.mock_client.get_metadata_bulk.assert_called_once()
+        self.assertEqual(self.mock_client.get_metadata.call_count, 2)
+
+    def test_get_all_metadata_no_bulk_method(self):
+        """A client without the bulk call is asked one file at a time."""
+        client = MagicMock(spec=["get_metadata"])
+        client.get_metadata.return_value = {"name": "file1"}
+        processor = RucioProcessor(self.scope, self.name, self.rse, client)
+        result = processor._get_all_metadata(["file1"])
+        self.assertEqual(result["file1"]["name"], "file1")
+        client.get_metadata.assert_called_once()
+
+    def test_get_all_metadata_bulk_payload_error(self):
+        """Errors building the payloads do not disable the bulk call."""
+        self.mock_client.get_metadata_bulk.return_value = [{"name": "file1"}]
+        with patch.object(
+            self.processor, "_build_rubin_payload", side_effect=AttributeError
+        ):
+            with self.assertRaises(AttributeError):
+                self.processor._get_all_metadata(["file1"])
+        self.assertTrue(self.processor._bulk_supported())
+
+    def test_get_all_metadata_bulk(self):
+        """Succesfull _get_all_metadata in chunks."""
+        processor = RucioProcessor(
+            self.scope, self.name, self.rse, self.mock_client, metadata_chunk_size=2
+        )
+
+        def get_metadata_bulk(dids, plugin):
+            for did in dids:
+                yield {
+                    "rubin_butler": 1,
+                    "rubin_sidecar": "sidecar_data",
+                    "name": did["name"],
+                    "scope": did["scope"],
+                }
+
+        self.mock_client.get_metadata_bulk.side_effect = get_metadata_bulk
+        result = processor._get_all_metadata(["file1", "file2", "file3"])
+        self.assertEqual(self.mock_client.get_metadata_bulk.call_count, 2)
+        self.mock_client.get_metadata.assert_not_called()
+        self.assertEqual(
+            result["file3"],
+            {
+                "rubin_butler": 1,
+                "rubin_sidecar": "sidecar_data",
+                "scope": self.scope,
+                "name": "file3",
+                "dataset": self.name,
+                "datasetScope": self.scope,
+            },
+        )
+        self.assertEqual(len(result), 3)
+
+    def test_get_all_metadata_bulk_missing_name(self):
+        """Check files left out of the bulk reply get no payload, and are
+        not cached.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = RucioCache(tmpdir)
+            processor = RucioProcessor(
+                self.scope, self.name, self.rse, self.mock_client, cache=cache
+            )
+            self.mock_client.get_metadata_bulk.return_value = [
+                {"rubin_butler": 1, "name": "file1", "scope": self.scope}
+            ]
+            result = processor._get_all_metadata(["file1", "file2"])
+            self.assertEqual(result["file1"]["name"], "file1")
+            self.assertIsNone(result["file2"])
+            cached = cache.get_many("metadata", self.scope, ["file1", "file2"])
+            self.assertEqual(list(cached), ["file1"])
+            cache.close()
 
     def test_get_rse_info_success(self):
         """Succesfull _get_rse_info."""
@@ -158,6 +257,124 @@ class TestRucioProcessor(unittest.TestCase):
                 },
             )
 
+    def test_merge_metadata_replicas_first(self):
+        """Check metadata are only requested for files on the RSE."""
+        self.mock_client.list_files.return_value = [
+            {"scope": self.scope, "name": "file1"},
+            {"scope": self.scope, "name": "file2"},
+            {"scope": self.scope, "name": "file3"},
+        ]
+        self.mock_client.list_replicas.return_value = [
+            {"name": "file1", "rses": {self.rse: ["rse_url1"]}},
+            {"name": "file2", "rses": {"other_rse": ["other_url2"]}},
+            {"name": "file3", "rses": {self.rse: ["rse_url3"]}},
+        ]
+        self.mock_client.get_metadata_bulk.return_value = [
+            {"rubin_butler": 1, "name": "file1", "scope": self.scope},
+            {"rubin_butler": 3, "name": "file3", "scope": self.scope},
+        ]
+        result = self.processor._merge_metadata()
+        dids = self.mock_client.get_metadata_bulk.call_args.args[0]
+        self.assertEqual([did["name"] for did in dids], ["file1", "file3"])
+        self.assertEqual(self.processor.skipped_lookups, 1)
+        self.assertEqual(list(result), ["file1", "file3"])
+        self.assertEqual(
+            result["file3"],
+            {
+                "rubin_butler": 3,
+                "rubin_sidecar": None,
+                "scope": self.scope,
+                "name": "file3",
+                "dataset": self.name,
+                "datasetScope": self.scope,
+                "dst-url": "rse_url3",
+                "dst-rse": self.rse,
+            },
+        )
+
+    def test_merge_metadata_no_replica(self):
+        """Check no file listing nor metadata lookup without replicas."""
+        self.mock_client.list_replicas.return_value = []
+        self.assertEqual(self.processor._merge_metadata(), {})
+        self.mock_client.list_files.assert_not_called()
+        self.mock_client.get_metadata_bulk.assert_not_called()
+
+    def test_merge_metadata_cache(self):
+        """Check a second run is served from the cache."""
+        self.mock_client.list_files.return_value = [
+            {"scope": self.scope, "name": "file1"},
+            {"scope": self.scope, "name": "file2"},
+        ]
+        self.mock_client.list_replicas.return_value = [
+            {"name": "file1", "rses": {self.rse: ["rse_url1"]}},
+            {"name": "file2", "rses": {self.rse: ["rse_url2"]}},
+        ]
+        self.mock_client.get_metadata_bulk.return_value = [
+            {"rubin_butler": 1, "name": "file1", "scope": self.scope},
+            {"rubin_butler": 2, "name": "file2", "scope": self.scope},
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = RucioCache(tmpdir)
+            first = RucioProcessor(
+                self.scope, self.name, self.rse, self.mock_client, cache=cache
+            )._merge_metadata()
+            second_processor = RucioProcessor(
+                self.scope, self.name, self.rse, self.mock_client, cache=cache
+            )
+            second = second_processor._merge_metadata()
+            cache.close()
+        self.assertEqual(first, second)
+        self.assertEqual(list(second), ["file1", "file2"])
+        self.assertEqual(sum(second_processor.rucio_calls.values()), 0)
+        self.assertEqual(self.mock_client.list_files.call_count, 1)
+        self.assertEqual(self.mock_client.list_replicas.call_count, 1)
+        self.assertEqual(self.mock_client.get_metadata_bulk.call_count, 1)
+
+    def test_merge_metadata_prefetched_replicas(self):
+        """Check replicas looked up with other DIDs replace the file listing
+        and the replica lookup.
+        """
+        self.mock_client.get_metadata_bulk.return_value = [
+            {"rubin_butler": 1, "name": "file1", "scope": self.scope},
+        ]
+        processor = RucioProcessor(
+            self.scope,
+            self.name,
+            self.rse,
+            self.mock_client,
+            replicas={self.rse: {"file1": "rse_url1"}},
+        )
+        payload = processor._merge_metadata()
+        self.assertEqual(payload["file1"]["dst-url"], "rse_url1")
+        self.mock_client.list_files.assert_not_called()
+        self.mock_client.list_replicas.assert_not_called()
+
+    def test_iter_payload(self):
+        """Check the streaming payload is built window by window."""
+        self.mock_client.list_files.return_value = iter(
+            [{"scope": self.scope, "name": f"file{i}"} for i in range(3)]
+        )
+
+        def get_metadata_bulk(dids, plugin):
+            for did in dids:
+                yield {"rubin_butler": 1, "name": did["name"], "scope": did["scope"]}
+
+        def list_replicas(dids, rse_expression):
+            for did in dids:
+                if did["name"] != "file1":
+                    yield {"name": did["name"], "rses": {self.rse: [did["name"] + "_url"]}}
+
+        self.mock_client.get_metadata_bulk.side_effect = get_metadata_bulk
+        self.mock_client.list_replicas.side_effect = list_replicas
+        result = list(self.processor.iter_payload(2))
+        self.assertEqual([name for name, _ in result], ["file0", "file2"])
+        self.assertIs(type(result[1][1]), dict)
+        self.assertEqual(result[1][1]["dst-url"], "file2_url")
+        self.assertEqual(result[1][1]["dst-rse"], self.rse)
+        self.assertEqual(self.mock_client.list_replicas.call_count, 2)
+        self.assertEqual(self.mock_client.get_metadata_bulk.call_count, 2)
+        self.assertEqual(self.processor.skipped_lookups, 1)
+
     def test_get_payload(self):
         """Testing get _merge_metadata."""
         dummy_merged_data = {"test": "data"}
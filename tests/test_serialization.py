@@ -0,0 +1,82 @@
+import json
+import unittest
+import lsst.utils.tests
+from lsst.rucioevents.event_creator import KafkaEvent
+from lsst.rucioevents.records import FilePayload
+from lsst.rucioevents.serialization import EventEncoder, orjson
+
+
+class TestEventEncoder(unittest.TestCase):
+    def setUp(self):
+        """Build an event as KafkaEvent does."""
+        self.payload = {
+            "name": "file1.fits",
+            "scope": "test_scope",
+            "dst-url": "davs://example.org/test_scope/file1.fits",
+            "rubin_butler": 1,
+            "rubin_sidecar": '{"k\\u00e9y": "valu\\u00e9"}',
+        }
+        self.record = KafkaEvent(
+            {"file1.fits": self.payload}
+        ).process_metadata_records()[0]
+        self.event = self.record.to_dict()
+
+    def test_encode_matches_json(self):
+        """Check the default encoding is byte for byte that of json.dumps."""
+        encoder = EventEncoder()
+        expected = json.dumps(self.event).encode("utf-8")
+        self.assertEqual(encoder.encode(self.event), expected)
+        self.assertEqual(encoder.encode(self.record), expected)
+        self.assertEqual(
+            encoder.encode_event(self.payload, self.event["created_at"]), expected
+        )
+
+    def test_encode_other_events(self):
+        """Check events with another layout are serialized as a whole."""
+        encoder = EventEncoder()
+        event = {"key": "test_key", "data": "test_data"}
+        self.assertEqual(encoder.encode(event), json.dumps(event).encode("utf-8"))
+        reordered = {key: self.event[key] for key in reversed(list(self.event))}
+        self.assertEqual(
+            encoder.encode(reordered), json.dumps(reordered).encode("utf-8")
+        )
+
+    def test_encode_payload_record(self):
+        """Check payload records are serialized as their dictionary."""
+        encoder = EventEncoder()
+        record = FilePayload.from_dict(self.payload)
+        self.assertEqual(
+            encoder.encode_event(record, "t0"),
+            encoder.encode_event(record.to_dict(), "t0"),
+        )
+
+    def test_created_at_cache(self):
+        """Check changing creation times are encoded."""
+        encoder = EventEncoder()
+        for created_at in ["t0", "t0", "t1"]:
+            self.assertEqual(
+                json.loads(encoder.encode_event(self.payload, created_at)),
+                {
+                    "event_type": KafkaEvent.EVENT_TYPE,
+                    "payload": self.payload,
+                    "created_at": created_at,
+                },
+            )
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_fast_encoding(self):
+        """Check orjson documents are equal to the json ones."""
+        encoder = EventEncoder(fast=True)
+        self.assertTrue(encoder.fast)
+        data = encoder.encode(self.record)
+        self.assertEqual(json.loads(data), self.event)
+        self.assertEqual(list(json.loads(data)), list(self.event))
+        self.assertEqual(data, orjson.dumps(self.event))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
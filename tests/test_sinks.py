@@ -0,0 +1,102 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+import lsst.utils.tests
+from lsst.rucioevents.journal import RunJournal
+from lsst.rucioevents.sinks import (
+    JsonlFileSink,
+    NullSink,
+    StdoutSink,
+    event_dids,
+    journal_dids,
+)
+
+
+def make_events(count):
+    """Build file events of the dataset scope:dataset."""
+    return [
+        {
+            "key": f"key{i}",
+            "payload": {
+                "scope": "scope",
+                "name": f"file{i}",
+                "datasetScope": "scope",
+                "dataset": "dataset",
+            },
+        }
+        for i in range(count)
+    ]
+
+
+class TestSinks(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_event_dids(self):
+        """Check the DIDs of an event."""
+        self.assertEqual(
+            event_dids(make_events(1)[0]), ("scope:dataset", "scope:file0")
+        )
+
+    def test_journal_dids(self):
+        """Check the journal keys of a file are made distinct by RSE."""
+        event = make_events(1)[0]
+        self.assertEqual(journal_dids(event), ("scope:dataset", "scope:file0"))
+        event["payload"]["dst-rse"] = "RSE"
+        self.assertEqual(journal_dids(event), ("scope:dataset", "scope:file0@RSE"))
+
+    def test_jsonl_file_sink(self):
+        """Check events are written one per line, in batches."""
+        path = os.path.join(self.tmpdir.name, "events.jsonl")
+        sink = JsonlFileSink(path, batch_size=2)
+        events = make_events(5)
+        self.assertEqual(sink.send_event(iter(events)), 5)
+        sink.close()
+        with open(path, "r") as file:
+            self.assertEqual([json.loads(line) for line in file], events)
+        self.assertEqual(sink.delivered, 5)
+        self.assertEqual(sink.bytes, os.path.getsize(path))
+
+    def test_jsonl_file_sink_compressed(self):
+        """Check the output is gzip compressed when it ends with .gz."""
+        path = os.path.join(self.tmpdir.name, "events.jsonl.gz")
+        sink = JsonlFileSink(path)
+        events = make_events(3)
+        sink.send_event(events)
+        sink.close()
+        with gzip.open(path, "rt") as file:
+            self.assertEqual([json.loads(line) for line in file], events)
+
+    def test_stdout_sink(self):
+        """Check events are written to the stream."""
+        stream = io.BytesIO()
+        sink = StdoutSink(stream=stream, batch_size=2)
+        events = make_events(3)
+        self.assertEqual(sink.send_event(events), 3)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], events)
+
+    def test_null_sink(self):
+        """Check events are counted and the journal updated."""
+        path = os.path.join(self.tmpdir.name, "journal.txt")
+        journal = RunJournal(path, track_files=True)
+        sink = NullSink(journal=journal)
+        self.assertEqual(sink.send_event(make_events(4)), 4)
+        self.assertEqual(sink.delivered, 4)
+        self.assertEqual(journal.delivered("scope:dataset"), 4)
+        self.assertTrue(journal.is_file_done("scope:file3"))
+        journal.close()
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
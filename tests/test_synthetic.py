@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+import lsst.utils.tests
+from lsst.rucioevents.capture import iter_capture
+from lsst.rucioevents.event_creator import KafkaEvent
+from lsst.rucioevents.fake_kafka import FakeProducer
+from lsst.rucioevents.kafka_producer import RucioKafkaProducer
+from lsst.rucioevents.sinks import NullSink
+from lsst.rucioevents.synthetic import SyntheticPayloads, generate, main
+
+
+class TestSyntheticPayloads(unittest.TestCase):
+    def test_payloads(self):
+        """Check the payloads fill the template with generated values."""
+        payloads = SyntheticPayloads(
+            5,
+            scope="scope",
+            n_scopes=2,
+            files_per_dataset=2,
+            rse="RSE",
+            butler_size=10,
+            sidecar_size=20,
+        )
+        pairs = list(payloads.iter_payloads())
+        self.assertEqual(len(pairs), 5)
+        name, payload = pairs[2]
+        self.assertEqual(set(payload), set(KafkaEvent._get_template()))
+        self.assertEqual(name, "dataset_000001/file_000000002.fits")
+        self.assertEqual(payload["name"], name)
+        self.assertEqual(payload["scope"], "scope1")
+        self.assertEqual(payload["datasetScope"], "scope1")
+        self.assertEqual(payload["dataset"], "dataset_000001")
+        self.assertEqual(
+            payload["dst-url"], f"davs://RSE.example.org:1094/scope1/{name}"
+        )
+        self.assertEqual(len(payload["rubin_butler"]), 10)
+        self.assertEqual(len(payload["rubin_sidecar"]), 20)
+
+    def test_batches(self):
+        """Check the events are generated in batches."""
+        batches = list(SyntheticPayloads(5).iter_batches(2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0][0]["event_type"], KafkaEvent.EVENT_TYPE)
+
+
+class TestGenerate(unittest.TestCase):
+    def test_generate(self):
+        """Check the report of the achieved rate and queue depth."""
+        sink = RucioKafkaProducer("topic", producer=FakeProducer(latency=0.2))
+        report = generate(SyntheticPayloads(30), sink, rate=1000.0)
+        self.assertEqual(report["events"], 30)
+        self.assertEqual(report["requested_rate"], 1000.0)
+        self.assertGreater(report["achieved_rate"], 0)
+        self.assertEqual(report["max_queue_depth"], 30)
+
+    def test_generate_null(self):
+        """Check generating as fast as possible."""
+        sink = NullSink()
+        report = generate(SyntheticPayloads(25), sink, batch_size=10)
+        self.assertEqual(report["events"], 25)
+        self.assertEqual(sink.delivered, 25)
+        self.assertEqual(report["max_queue_depth"], 0)
+
+    def test_main(self):
+        """Check generating a capture from the command line."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, "events.capture")
+            self.assertEqual(main(["-n", "12", "--sink", "capture", "-o", output]), 0)
+            self.assertEqual(len(list(iter_capture(output))), 12)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()